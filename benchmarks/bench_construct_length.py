@@ -0,0 +1,77 @@
+## bench_construct_length
+"""
+Validate and time construct length estimation on synthetic read length distributions.
+
+Every scenario mixes full-length plasmid reads with fragments, and some add dimers, chimeric outliers or very low depth.
+The estimator in construct_length runs on the compact read length histogram and is compared with the original
+scipy find_peaks call on 1 bp bins, which raised IndexError when it found no peak.
+
+Usage:
+    python benchmarks/bench_construct_length.py [n_reads]
+"""
+import sys
+import time
+
+import numpy as np
+from scipy.signal import find_peaks
+
+from plasmid_sequencing.construct_length import estimate_construct_length
+from plasmid_sequencing.histograms import HistogramAccumulator
+
+def synthetic_read_lengths(construct_length, n_reads, full_length_fraction=0.6, dimer_fraction=0.0, n_chimeras=0, seed=0):
+    """Read lengths of a plasmid sample: full-length reads (1% spread), random fragments, optional dimers and chimeric outliers."""
+    rng = np.random.default_rng(seed)
+    n_full = int(n_reads * full_length_fraction)
+    n_dimer = int(n_reads * dimer_fraction)
+    n_fragment = n_reads - n_full - n_dimer - n_chimeras
+    lengths = np.concatenate([
+        rng.normal(construct_length, construct_length * 0.01, n_full),
+        rng.normal(2 * construct_length, construct_length * 0.02, n_dimer),
+        rng.uniform(200, construct_length, n_fragment),
+        rng.uniform(50 * construct_length, 100 * construct_length, n_chimeras),
+    ])
+    return np.maximum(lengths, 1).astype(np.int64)
+
+def legacy_estimate(accumulator):
+    """The original estimate: the last find_peaks peak on 1 bp bins, or None where the original raised IndexError."""
+    histogram, edges = accumulator.histogram()
+    threshold = max(histogram) / 2
+    distance_threshold = max(len(histogram) // 20, 1)
+    peaks, _ = find_peaks(histogram, height=threshold, prominence=threshold, distance=distance_threshold)
+    if len(peaks) == 0:
+        return None
+    return (edges[peaks[-1]] + edges[peaks[-1] + 1]) / 2
+
+SCENARIOS = [
+    # (name, construct length, read fraction, synthetic_read_lengths keyword arguments)
+    ('3 kb plasmid', 3000, 1.0, {}),
+    ('10 kb plasmid', 10000, 1.0, {}),
+    ('10 kb, 5 chimeras', 10000, 1.0, {'n_chimeras': 5}),
+    ('10 kb, 20% dimers', 10000, 1.0, {'dimer_fraction': 0.2}),
+    ('50 kb plasmid', 50000, 1.0, {}),
+    ('150 kb BAC, 3 chimeras', 150000, 1.0, {'n_chimeras': 3}),
+    ('6 kb, low depth', 6000, 0.01, {}),
+    ('8 kb, mostly fragments', 8000, 1.0, {'full_length_fraction': 0.15}),
+]
+
+def main(n_reads=50000):
+    print(f"{'scenario':<26}{'true':>9}{'legacy':>11}{'err':>7}{'ms':>8}{'new':>11}{'err':>7}{'conf':>6}{'ms':>8}  bins")
+    for i, (name, construct_length, read_fraction, kwargs) in enumerate(SCENARIOS):
+        lengths = synthetic_read_lengths(construct_length, max(int(n_reads * read_fraction), 20), seed=i, **kwargs)
+        accumulator = HistogramAccumulator(bin_size=1)
+        accumulator.update(lengths)
+
+        start = time.perf_counter()
+        legacy = legacy_estimate(accumulator)
+        legacy_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        estimate = estimate_construct_length(accumulator, min_length=500)
+        new_ms = (time.perf_counter() - start) * 1000
+
+        legacy_text = f"{legacy:>11.0f}{abs(legacy - construct_length) / construct_length:>7.1%}" if legacy is not None else f"{'no peak':>11}{'':>7}"
+        print(f"{name:<26}{construct_length:>9}{legacy_text}{legacy_ms:>8.1f}"
+              f"{estimate.value:>11.0f}{abs(estimate.value - construct_length) / construct_length:>7.1%}{estimate.confidence:>6.2f}{new_ms:>8.1f}  {len(accumulator.counts)}")
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
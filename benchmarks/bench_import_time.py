@@ -0,0 +1,68 @@
+## bench_import_time
+"""
+Measure the startup cost of importing plasmid_sequencing and of reaching a lightweight wrapper through it.
+
+Every statement runs in a fresh interpreter, so nothing is cached between runs. Importing the package, or a wrapper
+that only builds a command line, must not load any of the heavy modules below; if one is loaded, or the median startup
+exceeds --max-ms, the script exits with status 1 so it can guard against import time regressions.
+
+Usage:
+    python benchmarks/bench_import_time.py [--repeats N] [--max-ms MS]
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+HEAVY_MODULES = ('numpy', 'scipy', 'matplotlib', 'pysam')
+
+STATEMENTS = [
+    'import plasmid_sequencing',
+    'from plasmid_sequencing import demux',
+    'from plasmid_sequencing import nest_file',
+    'from plasmid_sequencing import flye, porechop, rasusa, JobScheduler',
+]
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'ms': elapsed * 1000, 'heavy': [name for name in {heavy!r} if name in sys.modules]}}))
+"""
+
+def time_statement(statement, repeats):
+    """Run statement in repeats fresh interpreters. Returns (median ms, heavy modules it loaded)."""
+    timings = []
+    heavy = set()
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, '-c', PROBE.format(statement=statement, heavy=HEAVY_MODULES)],
+                                check=True, capture_output=True, text=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        timings.append(result['ms'])
+        heavy.update(result['heavy'])
+    return statistics.median(timings), sorted(heavy)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark plasmid_sequencing import time.')
+    parser.add_argument('--repeats', type=int, default=5, help='Fresh interpreters per statement.')
+    parser.add_argument('--max-ms', type=float, default=50.0, help='Largest acceptable median time of any statement.')
+    args = parser.parse_args(argv)
+
+    failures = []
+    print(f"{'statement':<70}{'median ms':>10}  heavy modules loaded")
+    for statement in STATEMENTS:
+        median_ms, heavy = time_statement(statement, args.repeats)
+        print(f"{statement:<70}{median_ms:>10.1f}  {', '.join(heavy) or '-'}")
+        if heavy:
+            failures.append(f"{statement!r} loads {', '.join(heavy)}")
+        if median_ms > args.max_ms:
+            failures.append(f"{statement!r} takes {median_ms:.1f} ms, more than {args.max_ms:.0f} ms")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
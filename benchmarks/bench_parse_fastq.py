@@ -0,0 +1,61 @@
+## bench_parse_fastq
+"""
+Compare records-per-second of the chunked FASTQ parser against the original line-by-line parser.
+
+Usage:
+    python benchmarks/bench_parse_fastq.py [n_reads] [read_length]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from plasmid_sequencing.fastq_io import parse_fastq_batches
+from plasmid_sequencing.filter_fastqs import parse_fastq
+
+def parse_fastq_readline(file_path):
+    """The original readline-based parser, kept here as the benchmark baseline."""
+    with open(file_path, "r") as fq:
+        while True:
+            header = fq.readline().strip()
+            if not header:
+                break
+            sequence = fq.readline().strip()
+            separator = fq.readline().strip()
+            quality = fq.readline().strip()
+            yield header, sequence, separator, quality
+
+def write_synthetic_fastq(path, n_reads, read_length, seed=0):
+    """Write n_reads random reads with lengths drawn around read_length."""
+    rng = np.random.default_rng(seed)
+    bases = np.frombuffer(b'ACGT', dtype=np.uint8)
+    lengths = np.maximum(rng.normal(read_length, read_length / 4, n_reads).astype(int), 50)
+    with open(path, 'wb') as fq:
+        for i, length in enumerate(lengths):
+            sequence = bases[rng.integers(0, 4, length)].tobytes()
+            quality = (rng.integers(5, 40, length, dtype=np.uint8) + 33).tobytes()
+            fq.write(b'@read_%d\n%s\n+\n%s\n' % (i, sequence, quality))
+
+def time_parser(label, parse, path):
+    start = time.perf_counter()
+    n_records = parse(path)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28}{n_records:>10} records  {elapsed:8.3f} s  {n_records / elapsed:12,.0f} records/s")
+    return elapsed
+
+def main(n_reads=20000, read_length=5000):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'synthetic.fastq')
+        write_synthetic_fastq(path, n_reads, read_length)
+        size_mb = os.path.getsize(path) / 1e6
+        print(f"Synthetic FASTQ: {n_reads} reads, mean length {read_length}, {size_mb:.1f} MB")
+
+        baseline = time_parser('readline parse_fastq', lambda p: sum(1 for _ in parse_fastq_readline(p)), path)
+        time_parser('parse_fastq (wrapper)', lambda p: sum(1 for _ in parse_fastq(p)), path)
+        batched = time_parser('parse_fastq_batches', lambda p: sum(len(b) for b in parse_fastq_batches(p)), path)
+        print(f"Batch parser speedup over readline parser: {baseline / batched:.1f}x")
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
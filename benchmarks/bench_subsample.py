@@ -0,0 +1,55 @@
+## bench_subsample
+"""
+Compare the single-pass in-process subsampler against one rasusa process per replicate.
+
+The input is gzipped, as the porechopped FASTQs in the workflow are. The rasusa timing is skipped if rasusa is not on the PATH.
+
+Usage:
+    python benchmarks/bench_subsample.py [n_reads] [read_length] [iterations]
+"""
+import gzip
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from plasmid_sequencing.subsample import subsample_fastq
+from plasmid_sequencing.rasusa import rasusa
+
+from bench_parse_fastq import write_synthetic_fastq
+
+def time_subsampler(label, subsample, iterations):
+    start = time.perf_counter()
+    output_file_list = subsample()
+    elapsed = time.perf_counter() - start
+    assert len(output_file_list) == iterations and all(os.path.exists(path) for path in output_file_list)
+    print(f"{label:<28}{iterations:>4} replicates  {elapsed:8.3f} s")
+    return elapsed
+
+def main(n_reads=20000, read_length=5000, iterations=3):
+    coverage, genome_size = 200, read_length
+    with tempfile.TemporaryDirectory() as tmp:
+        plain_path = os.path.join(tmp, 'synthetic.fastq')
+        path = plain_path + '.gz'
+        write_synthetic_fastq(plain_path, n_reads, read_length)
+        with open(plain_path, 'rb') as infile, gzip.open(path, 'wb', compresslevel=1) as outfile:
+            shutil.copyfileobj(infile, outfile)
+        os.remove(plain_path)
+        print(f"Synthetic FASTQ: {n_reads} reads, mean length {read_length}, {os.path.getsize(path) / 1e6:.1f} MB gzipped, "
+              f"target {coverage}x of {genome_size} bp")
+
+        builtin_dir = os.path.join(tmp, 'builtin')
+        os.makedirs(builtin_dir)
+        builtin = time_subsampler('subsample_fastq', lambda: subsample_fastq(path, coverage, genome_size, iterations, builtin_dir), iterations)
+
+        if shutil.which('rasusa') is None:
+            print("rasusa not found on PATH; skipping the subprocess comparison")
+            return
+        rasusa_dir = os.path.join(tmp, 'rasusa')
+        os.makedirs(rasusa_dir)
+        baseline = time_subsampler('rasusa (subprocess)', lambda: rasusa(path, coverage, f'{genome_size}b', iterations, rasusa_dir), iterations)
+        print(f"In-process speedup over rasusa: {baseline / builtin:.1f}x")
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,264 @@
+## run_benchmarks
+"""
+Throughput and memory benchmarks of the FASTQ hot paths on synthetic nanopore reads at several scales.
+
+For every scale a demultiplexed fixture of four samples is generated with synthetic_reads (seeded, so every run sees
+the same reads) and kept in --workdir for later runs. Every case then runs in a fresh interpreter, so its peak RSS
+(measured with os.wait4, see plasmid_sequencing.telemetry) is its own and nothing is cached between cases.
+
+Results are printed as reads/s, MB/s of FASTQ input and peak RSS. --output saves them as JSON; --baseline compares
+against a saved run and exits with status 1 if any case lost more than --tolerance of its throughput or grew its peak
+RSS by more than --tolerance.
+
+Usage:
+    python benchmarks/run_benchmarks.py [--scales 10k,100k,1M,10M] [--cases filter,gzip_fastqs] [--workdir DIR]
+                                        [--output results.json] [--baseline results.json] [--tolerance 0.2]
+
+Fixtures take about construct length x 2 bytes per read (60 GB for 10M reads of a 6 kb plasmid), so use a smaller
+--construct-length for the largest scales.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+CASES = ['parse_fastq_batches', 'parse_fastq', 'mean_quality', 'median_quality', 'min_quality', 'filter', 'extract_histogram_stats', 'gzip_fastqs']
+DEFAULT_SCALES = '10k,100k'
+N_SAMPLES = 4
+
+def parse_scale(scale):
+    """Read count of a scale such as '10k' or '1M'."""
+    multipliers = {'k': 1_000, 'm': 1_000_000}
+    scale = scale.strip().lower()
+    if scale[-1] in multipliers:
+        return int(float(scale[:-1]) * multipliers[scale[-1]])
+    return int(scale)
+
+def fixture_paths(fixture_dir):
+    """Sample FASTQs of a fixture, in sample order."""
+    paths = []
+    for root, dirs, files in os.walk(os.path.join(fixture_dir, 'demultiplexed_fastqs')):
+        dirs.sort()
+        paths.extend(os.path.join(root, file) for file in sorted(files) if file.endswith('.fastq'))
+    return paths
+
+def _generate_fixture(fixture_dir, n_reads, construct_length, seed):
+    from synthetic_reads import write_demultiplexed_fixture
+
+    write_demultiplexed_fixture(os.path.join(fixture_dir, 'demultiplexed_fastqs'), n_reads, N_SAMPLES, construct_length, seed)
+
+def ensure_fixture(workdir, n_reads, construct_length, seed):
+    """
+    Generate the fixture of a scale unless an identical one is already in workdir. Returns its directory.
+
+    Generation runs in a spawned process. Linux carries the peak RSS of a process over into the programs it starts,
+    so if this process grew while generating reads, every case measured afterwards would report at least that much.
+    """
+    import multiprocessing
+
+    fixture_dir = os.path.join(workdir, f'reads_{n_reads}_{construct_length}bp_seed{seed}')
+    marker = os.path.join(fixture_dir, 'fixture.json')
+    if os.path.exists(marker):
+        return fixture_dir
+
+    shutil.rmtree(fixture_dir, ignore_errors=True)
+    print(f"Generating {n_reads} synthetic reads in {fixture_dir}")
+    start = time.perf_counter()
+    process = multiprocessing.get_context('spawn').Process(target=_generate_fixture, args=(fixture_dir, n_reads, construct_length, seed))
+    process.start()
+    process.join()
+    if process.exitcode != 0:
+        raise RuntimeError(f"Generating the fixture in {fixture_dir} failed")
+    with open(marker, 'w') as handle:
+        json.dump({'n_reads': n_reads, 'construct_length': construct_length, 'seed': seed}, handle)
+    print(f"Generated in {time.perf_counter() - start:.1f} s")
+    return fixture_dir
+
+def _time_quality(calculate, paths):
+    """Time a batch quality calculator alone, parsing outside the timed region."""
+    from plasmid_sequencing.fastq_io import parse_fastq_batches
+
+    elapsed = 0.0
+    n_reads = 0
+    for path in paths:
+        for batch in parse_fastq_batches(path):
+            qualities, offsets = batch.quality_array()
+            start = time.perf_counter()
+            calculate(qualities, offsets)
+            elapsed += time.perf_counter() - start
+            n_reads += len(batch)
+    return elapsed, n_reads
+
+def run_case(case, fixture_dir):
+    """
+    Run one benchmark case on a fixture in this process.
+
+    Returns:
+        seconds (float): Time spent in the benchmarked code.
+        n_reads (int): Reads processed.
+    """
+    from plasmid_sequencing import filter_fastqs
+
+    paths = fixture_paths(fixture_dir)
+    filtered_dir = os.path.join(fixture_dir, 'filtered_demuliplexed_fastqs')
+
+    if case == 'mean_quality':
+        return _time_quality(filter_fastqs.calculate_batch_mean_quality, paths)
+    if case == 'median_quality':
+        return _time_quality(filter_fastqs.calculate_batch_median_quality, paths)
+    if case == 'min_quality':
+        return _time_quality(filter_fastqs.calculate_batch_min_quality, paths)
+
+    if case == 'gzip_fastqs':
+        from plasmid_sequencing.gzip_fastqs import gzip_fastqs
+
+        # gzip_fastqs deletes its inputs, so it runs on hard links to the fixture
+        with tempfile.TemporaryDirectory(dir=fixture_dir) as scratch:
+            for path in paths:
+                link = os.path.join(scratch, os.path.relpath(path, fixture_dir))
+                os.makedirs(os.path.dirname(link), exist_ok=True)
+                os.link(path, link)
+            start = time.perf_counter()
+            gzip_fastqs(scratch)
+            return time.perf_counter() - start, None
+
+    start = time.perf_counter()
+    n_reads = None
+    if case == 'parse_fastq_batches':
+        from plasmid_sequencing.fastq_io import parse_fastq_batches
+
+        n_reads = sum(len(batch) for path in paths for batch in parse_fastq_batches(path))
+    elif case == 'parse_fastq':
+        n_reads = sum(1 for path in paths for _ in filter_fastqs.parse_fastq(path))
+    elif case == 'filter':
+        for path in paths:
+            sample = os.path.basename(os.path.dirname(path))
+            output_dir = os.path.join(filtered_dir, sample)
+            hist_dir = filter_fastqs.histogram_dir(output_dir, path)
+            hist_dir.mkdir(parents=True, exist_ok=True)
+            output_path = os.path.join(output_dir, os.path.basename(path).split('.fastq')[0] + '_filtered.fastq.gz')
+            filter_fastqs.filter_fastq_and_generate_histograms(path, output_path, hist_dir, 500, 12, False)
+    elif case == 'extract_histogram_stats':
+        from plasmid_sequencing.extract_histogram_stats import extract_histogram_stats
+
+        if not os.path.isdir(filtered_dir):
+            raise RuntimeError("extract_histogram_stats needs the histograms written by the filter case; run it first")
+        extract_histogram_stats(filtered_dir)
+    else:
+        raise ValueError(f"Unknown case: {case}")
+    return time.perf_counter() - start, n_reads
+
+def measure_case(case, fixture_dir, n_reads):
+    """
+    Run one case in a fresh interpreter and measure it.
+
+    Returns:
+        result (dict): case, n_reads, input MB, seconds, reads/s, MB/s and peak RSS in MB of the case, or None if it failed.
+    """
+    from plasmid_sequencing.telemetry import run_instrumented
+
+    with tempfile.NamedTemporaryFile('r', suffix='.json') as result_file, open(os.devnull, 'wb') as devnull:
+        command = [sys.executable, os.path.abspath(__file__), '--run-case', case, '--fixture', fixture_dir, '--result', result_file.name]
+        returncode, usage = run_instrumented(command, stdout=devnull)
+        if returncode != 0:
+            print(f"{case} failed with exit status {returncode}")
+            return None
+        seconds, case_reads = json.load(result_file)
+
+    input_mb = sum(os.path.getsize(path) for path in fixture_paths(fixture_dir)) / 1e6
+    return {
+        'case': case,
+        'n_reads': case_reads or n_reads,
+        'input_mb': input_mb,
+        'seconds': seconds,
+        'reads_per_s': (case_reads or n_reads) / seconds if seconds else float('inf'),
+        'mb_per_s': input_mb / seconds if seconds else float('inf'),
+        'max_rss_mb': usage['max_rss_kb'] / 1024,
+    }
+
+def compare(results, baseline, tolerance):
+    """Return a message for every case that lost more than tolerance of its throughput or grew its peak RSS by more than tolerance."""
+    previous = {(result['scale'], result['case']): result for result in baseline}
+    regressions = []
+    for result in results:
+        old = previous.get((result['scale'], result['case']))
+        if old is None:
+            continue
+        if result['reads_per_s'] < old['reads_per_s'] * (1 - tolerance):
+            regressions.append(f"{result['case']} at {result['scale']} reads: {result['reads_per_s']:,.0f} reads/s, was {old['reads_per_s']:,.0f}")
+        if result['max_rss_mb'] > old['max_rss_mb'] * (1 + tolerance):
+            regressions.append(f"{result['case']} at {result['scale']} reads: {result['max_rss_mb']:.0f} MB peak RSS, was {old['max_rss_mb']:.0f}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the FASTQ hot paths of plasmid_sequencing on synthetic nanopore reads.')
+    parser.add_argument('--scales', default=DEFAULT_SCALES, help=f'Comma separated read counts, e.g. 10k,100k,1M,10M (default: {DEFAULT_SCALES}).')
+    parser.add_argument('--cases', default=','.join(CASES), help='Comma separated cases to run (default: all).')
+    parser.add_argument('--construct-length', type=int, default=6000, help='Plasmid length the reads come from (default: 6000).')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workdir', default=None, help='Directory the fixtures are generated in and reused from (default: a temporary directory).')
+    parser.add_argument('--output', default=None, help='Save the results to this JSON file.')
+    parser.add_argument('--baseline', default=None, help='Compare with results saved by an earlier --output.')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed relative loss of throughput or growth of peak RSS (default: 0.2).')
+    parser.add_argument('--run-case', help=argparse.SUPPRESS)
+    parser.add_argument('--fixture', help=argparse.SUPPRESS)
+    parser.add_argument('--result', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run_case:
+        # Inside the fresh interpreter started by measure_case
+        seconds, n_reads = run_case(args.run_case, args.fixture)
+        with open(args.result, 'w') as handle:
+            json.dump([seconds, n_reads], handle)
+        return 0
+
+    cases = [case.strip() for case in args.cases.split(',')]
+    unknown = set(cases) - set(CASES)
+    if unknown:
+        parser.error(f"unknown cases: {', '.join(sorted(unknown))}")
+
+    temporary = tempfile.TemporaryDirectory() if args.workdir is None else None
+    workdir = args.workdir or temporary.name
+    results = []
+    failures = []
+    try:
+        for scale in args.scales.split(','):
+            n_reads = parse_scale(scale)
+            fixture_dir = ensure_fixture(workdir, n_reads, args.construct_length, args.seed)
+            print(f"\n{n_reads} reads, {N_SAMPLES} samples, {args.construct_length} bp construct")
+            print(f"{'case':<26}{'seconds':>10}{'reads/s':>14}{'MB/s':>10}{'peak RSS MB':>13}")
+            for case in cases:
+                result = measure_case(case, fixture_dir, n_reads)
+                if result is None:
+                    failures.append(f"{case} at {n_reads} reads: failed")
+                    continue
+                result['scale'] = n_reads
+                results.append(result)
+                print(f"{case:<26}{result['seconds']:>10.3f}{result['reads_per_s']:>14,.0f}{result['mb_per_s']:>10.1f}{result['max_rss_mb']:>13.1f}")
+    finally:
+        if temporary is not None:
+            temporary.cleanup()
+
+    if args.output:
+        with open(args.output, 'w') as handle:
+            json.dump(results, handle, indent=2)
+        print(f"\nResults saved to: {args.output}")
+
+    # A case that failed to run is a regression whether or not there is a baseline to compare with
+    regressions = list(failures)
+    if args.baseline:
+        with open(args.baseline) as handle:
+            regressions += compare(results, json.load(handle), args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION: {regression}")
+    if regressions:
+        return 1
+    if args.baseline:
+        print(f"No regressions against {args.baseline}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
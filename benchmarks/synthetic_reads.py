@@ -0,0 +1,183 @@
+## synthetic_reads
+"""
+Seeded generator of synthetic nanopore reads from a random circular plasmid, for benchmarks and fixtures.
+
+Reads are cut from the plasmid at random positions on either strand. Most are full length (1% spread around the
+construct length), the rest are random fragments, and a fraction are chimeras of two independent pieces joined end to end.
+Every read gets a mean Q-score drawn from a two-component mix (a main population around Q20 and a low quality tail around Q10);
+per-base scores scatter around it and drop towards both read ends, and bases are substituted at the error rate their Q-score implies.
+The same arguments and seed always give byte-identical output.
+
+Usage:
+    python benchmarks/synthetic_reads.py output.fastq[.gz] [--reads N] [--construct-length BP] [--seed S]
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+
+BASES = np.frombuffer(b'ACGT', dtype=np.uint8)
+BATCH_BASES = 4_000_000  # Bases generated per vectorized batch, bounding memory whatever the read count
+
+def _read_layout(rng, n_reads, construct_length, full_length_fraction, chimera_fraction):
+    """Per-read segment lengths, start positions and strands. The second segment is empty unless the read is a chimera."""
+    kind = rng.random(n_reads)
+    full_length = kind < full_length_fraction
+    chimera = kind >= 1 - chimera_fraction
+
+    full_lengths = rng.normal(construct_length, construct_length * 0.01, n_reads)
+    fragment_lengths = rng.uniform(200, construct_length, n_reads)
+    first_lengths = np.where(full_length, full_lengths, fragment_lengths)
+    second_lengths = np.where(chimera, rng.uniform(200, construct_length, n_reads), 0)
+    first_lengths = np.maximum(first_lengths, 50).astype(np.int64)
+    second_lengths = second_lengths.astype(np.int64)
+
+    starts = rng.integers(0, construct_length, (2, n_reads))
+    reverse = rng.random((2, n_reads)) < 0.5
+    return first_lengths, second_lengths, starts, reverse
+
+def _read_mean_qualities(rng, n_reads, low_quality_fraction):
+    """Per-read mean Q-scores: N(20, 3) for most reads and N(10, 2) for a low quality tail."""
+    low = rng.random(n_reads) < low_quality_fraction
+    means = np.where(low, rng.normal(10, 2, n_reads), rng.normal(20, 3, n_reads))
+    return np.clip(means, 4, 35)
+
+def synthetic_batch(rng, plasmid, n_reads, first_read=0, full_length_fraction=0.6, chimera_fraction=0.02, low_quality_fraction=0.15):
+    """
+    Generate one batch of reads as FASTQ bytes.
+
+    Parameters:
+        rng (np.random.Generator): Random state, advanced by the call.
+        plasmid (np.ndarray): Base codes (0-3 for ACGT) of the circular construct.
+        n_reads (int): Number of reads in the batch.
+        first_read (int): Number of the first read, used in the read headers.
+        full_length_fraction (float): Fraction of reads spanning the whole construct.
+        chimera_fraction (float): Fraction of reads that are two independent pieces joined together.
+        low_quality_fraction (float): Fraction of reads from the low quality population.
+
+    Returns:
+        records (bytes): The FASTQ records of the batch.
+        n_bases (int): Total number of bases in the batch.
+    """
+    construct_length = len(plasmid)
+    first_lengths, second_lengths, starts, reverse = _read_layout(rng, n_reads, construct_length, full_length_fraction, chimera_fraction)
+    lengths = first_lengths + second_lengths
+    offsets = np.zeros(n_reads + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    n_bases = int(offsets[-1])
+
+    # Position of every base within its read, and whether it belongs to the second piece of a chimera
+    read_index = np.repeat(np.arange(n_reads), lengths)
+    position = np.arange(n_bases, dtype=np.int64) - offsets[:-1][read_index]
+    second = position >= first_lengths[read_index]
+    segment = second.astype(np.int64)
+    position -= np.where(second, first_lengths[read_index], 0)
+
+    segment_start = starts[segment, read_index]
+    segment_reverse = reverse[segment, read_index]
+    genome_position = np.where(segment_reverse, segment_start - position, segment_start + position) % construct_length
+    bases = plasmid[genome_position]
+    bases = np.where(segment_reverse, 3 - bases, bases)
+
+    # Per-base Q-scores scatter around the read mean and drop over the first and last ~50 bases
+    read_position = np.arange(n_bases, dtype=np.int64) - offsets[:-1][read_index]
+    distance_to_end = np.minimum(read_position, lengths[read_index] - 1 - read_position)
+    qualities = _read_mean_qualities(rng, n_reads, low_quality_fraction)[read_index] + rng.normal(0, 4, n_bases) - 8 * np.exp(-distance_to_end / 25)
+    qualities = np.clip(np.rint(qualities), 1, 50).astype(np.uint8)
+
+    # Substitute bases at the error rate of their Q-score
+    errors = rng.random(n_bases) < 10.0 ** (-qualities / 10)
+    bases[errors] = (bases[errors] + rng.integers(1, 4, int(errors.sum()))) % 4
+
+    sequence = BASES[bases].tobytes()
+    quality = (qualities + 33).tobytes()
+    channels = rng.integers(1, 513, n_reads)
+    records = []
+    for i in range(n_reads):
+        read_id = rng.bytes(16).hex()
+        start, end = offsets[i], offsets[i + 1]
+        records.append(b'@%s-%s-%s-%s-%s runid=synthetic read=%d ch=%d\n%s\n+\n%s\n' % (
+            read_id[:8].encode(), read_id[8:12].encode(), read_id[12:16].encode(), read_id[16:20].encode(), read_id[20:].encode(),
+            first_read + i, channels[i], sequence[start:end], quality[start:end]))
+    return b''.join(records), n_bases
+
+def synthetic_reads(n_reads, construct_length=6000, seed=0, **kwargs):
+    """
+    Yield FASTQ bytes of n_reads synthetic reads in batches of about BATCH_BASES bases.
+
+    Parameters:
+        n_reads (int): Total number of reads.
+        construct_length (int): Length of the random circular plasmid the reads come from.
+        seed (int): Random seed. The plasmid and every read follow from it.
+        **kwargs: Passed on to synthetic_batch (full_length_fraction, chimera_fraction, low_quality_fraction).
+
+    Yields:
+        records (bytes): FASTQ records of one batch.
+    """
+    rng = np.random.default_rng(seed)
+    plasmid = rng.integers(0, 4, construct_length).astype(np.uint8)
+    batch_reads = max(1, BATCH_BASES // construct_length)
+    for first_read in range(0, n_reads, batch_reads):
+        records, _ = synthetic_batch(rng, plasmid, min(batch_reads, n_reads - first_read), first_read, **kwargs)
+        yield records
+
+def write_synthetic_reads(path, n_reads, construct_length=6000, seed=0, compresslevel=1, **kwargs):
+    """
+    Write synthetic reads to a FASTQ file, gzip compressed if the path ends in .gz.
+
+    Parameters:
+        path (str): Output FASTQ.
+        n_reads (int): Number of reads.
+        construct_length (int): Length of the plasmid the reads come from.
+        seed (int): Random seed.
+        compresslevel (int): gzip level of a .gz output.
+        **kwargs: Passed on to synthetic_batch.
+
+    Returns:
+        path (str): The output path.
+    """
+    from plasmid_sequencing.fastq_io import open_compressed_output
+
+    handle = open_compressed_output(path, compresslevel) if str(path).endswith('.gz') else open(path, 'wb')
+    with handle:
+        for records in synthetic_reads(n_reads, construct_length, seed, **kwargs):
+            handle.write(records)
+    return path
+
+def write_demultiplexed_fixture(root, n_reads, n_samples=4, construct_length=6000, seed=0, compress=False):
+    """
+    Write a demultiplexed FASTQ tree, <root>/barcodeNN/synthetic_barcodeNN.fastq, splitting n_reads over n_samples.
+
+    Every sample gets its own plasmid (construct lengths spread by up to +-20% around construct_length) and seed.
+
+    Returns:
+        paths (list of str): The sample FASTQs.
+    """
+    paths = []
+    for sample in range(n_samples):
+        sample_dir = os.path.join(root, f'barcode{sample + 1:02d}')
+        os.makedirs(sample_dir, exist_ok=True)
+        path = os.path.join(sample_dir, f'synthetic_barcode{sample + 1:02d}.fastq' + ('.gz' if compress else ''))
+        sample_reads = n_reads // n_samples + (1 if sample < n_reads % n_samples else 0)
+        sample_length = int(construct_length * (0.8 + 0.4 * sample / max(n_samples - 1, 1)))
+        paths.append(write_synthetic_reads(path, sample_reads, sample_length, seed + sample))
+    return paths
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Write synthetic nanopore reads of a plasmid to a FASTQ file.')
+    parser.add_argument('output', help='Output FASTQ, gzipped if it ends in .gz.')
+    parser.add_argument('--reads', type=int, default=10000)
+    parser.add_argument('--construct-length', type=int, default=6000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--full-length-fraction', type=float, default=0.6)
+    parser.add_argument('--chimera-fraction', type=float, default=0.02)
+    parser.add_argument('--low-quality-fraction', type=float, default=0.15)
+    args = parser.parse_args(argv)
+
+    write_synthetic_reads(args.output, args.reads, args.construct_length, args.seed, full_length_fraction=args.full_length_fraction,
+                          chimera_fraction=args.chimera_fraction, low_quality_fraction=args.low_quality_fraction)
+    print(f"Wrote {args.reads} reads to {args.output} ({os.path.getsize(args.output) / 1e6:.1f} MB)")
+
+if __name__ == '__main__':
+    sys.exit(main())
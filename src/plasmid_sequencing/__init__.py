@@ -1,22 +1,42 @@
-from .canoncall import canoncall
-from .demux import demux
-from .extract_histogram_stats import extract_histogram_stats
-from .fastcat import fastcat
-from .filter_fastqs import process_directory
-from .flye import flye, recursive_flye
-from .gzip_fastqs import gzip_fastqs
-from .make_dirs import make_dirs
-from .nest_file import nest_file
-from .porechop import porechop
-from .rasusa import rasusa, recursive_rasusa
-from .medaka import medaka, recursive_medaka
-from .flye_polish import flye_polish, recursive_flye_polish
-from .copy_files import copy_files
-from .delete_empty_dirs import delete_empty_dirs
+# Public names are imported from their submodules on first access (PEP 562), so importing the package
+# does not load numpy, scipy or matplotlib until a function that needs them is used.
+import sys
+import types
+
+_LAZY_ATTRIBUTES = {
+    "canoncall": ".canoncall",
+    "demux": ".demux",
+    "bam_demux": ".bam_demux",
+    "extract_histogram_stats": ".extract_histogram_stats",
+    "fastcat": ".fastcat",
+    "flye": ".flye",
+    "recursive_flye": ".flye",
+    "gzip_fastqs": ".gzip_fastqs",
+    "make_dirs": ".make_dirs",
+    "nest_file": ".nest_file",
+    "porechop": ".porechop",
+    "process_directory": ".filter_fastqs",
+    "rasusa": ".rasusa",
+    "recursive_rasusa": ".rasusa",
+    "subsample_fastq": ".subsample",
+    "medaka": ".medaka",
+    "recursive_medaka": ".medaka",
+    "flye_polish": ".flye_polish",
+    "recursive_flye_polish": ".flye_polish",
+    "flye_assemble_and_polish": ".flye_polish",
+    "recursive_flye_and_polish": ".flye_polish",
+    "trycycler_sample": ".trycycler",
+    "recursive_trycycler": ".trycycler",
+    "compare_assemblies": ".assembly_agreement",
+    "copy_files": ".copy_files",
+    "delete_empty_dirs": ".delete_empty_dirs",
+    "JobScheduler": ".scheduler",
+}
 
 __all__ = [
     "canoncall",
     "demux",
+    "bam_demux",
     "extract_histogram_stats",
     'fastcat',
     "flye",
@@ -28,10 +48,41 @@ __all__ = [
     "process_directory",
     "rasusa",
     "recursive_rasusa",
+    "subsample_fastq",
     "medaka",
     "recursive_medaka",
     "flye_polish",
     "recursive_flye_polish",
+    "flye_assemble_and_polish",
+    "recursive_flye_and_polish",
+    "trycycler_sample",
+    "recursive_trycycler",
+    "compare_assemblies",
     "copy_files",
-    "delete_empty_dirs"
-    ]
\ No newline at end of file
+    "delete_empty_dirs",
+    "JobScheduler"
+    ]
+
+def __getattr__(name):
+    import importlib
+
+    module_name = _LAZY_ATTRIBUTES.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    # Cache it so later lookups do not come back through __getattr__
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
+
+class _LazyModule(types.ModuleType):
+    def __setattr__(self, name, value):
+        # Importing a submodule binds it as an attribute of the package, which would hide a public function of the same
+        # name (e.g. plasmid_sequencing.demux). Leave those names to __getattr__, as the eager imports used to.
+        if name in _LAZY_ATTRIBUTES and isinstance(value, types.ModuleType):
+            return
+        super().__setattr__(name, value)
+
+sys.modules[__name__].__class__ = _LazyModule
@@ -0,0 +1,5 @@
+## __main__
+import sys
+from .cli import main
+
+sys.exit(main())
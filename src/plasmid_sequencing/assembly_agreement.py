@@ -0,0 +1,273 @@
+## assembly_agreement
+"""
+Fast check of whether the replicate assemblies of a sample already agree, so consensus and polishing can be short-circuited.
+
+Contigs are compared through their canonical k-mers, packed 2 bits per base and hashed with vectorized numpy operations.
+Circular contigs are rotated and oriented onto a common anchor, the shared k-mer of smallest hash that occurs exactly once in
+every contig, so replicates that Flye started at different positions or on different strands compare equal.
+
+Usage:
+    python -m plasmid_sequencing.assembly_agreement subsampled_flye_assemblies [--k 21] [--min-identity 1.0]
+"""
+import os
+import numpy as np
+
+DEFAULT_K = 21  # Odd, so no k-mer is its own reverse complement and every anchor has a strand
+DEFAULT_MIN_IDENTITY = 1.0  # Replicates agree only if their normalized sequences are identical
+AGREEMENT_FASTA = 'replicate_agreement.fasta'
+
+_CODES = np.full(256, 4, dtype=np.uint8)
+for _base, _code in zip(b'ACGTacgt', [0, 1, 2, 3, 0, 1, 2, 3]):
+    _CODES[_base] = _code
+_COMPLEMENT = bytes.maketrans(b'ACGTNacgtn', b'TGCANtgcan')
+
+class AssemblyAgreement:
+    """
+    Result of comparing the replicate assemblies of a sample.
+
+    Attributes:
+        agree (bool): True if every replicate has the same number of contigs and each contig matches its counterpart in the first replicate
+            at least at min_identity (identical after rotation and orientation for min_identity 1.0).
+        identity (float): Lowest k-mer identity estimate between a contig of the first replicate and its counterpart in another replicate.
+        identical (bool): True if all replicates are identical after rotation and orientation.
+        n_contigs (list of int): Number of contigs of every replicate.
+        contigs (list of tuple): (name, sequence) of the first replicate's contigs, rotated and oriented onto their anchors.
+    """
+    __slots__ = ('agree', 'identity', 'identical', 'n_contigs', 'contigs')
+
+    def __init__(self, agree, identity, identical, n_contigs, contigs):
+        self.agree = agree
+        self.identity = identity
+        self.identical = identical
+        self.n_contigs = n_contigs
+        self.contigs = contigs
+
+    def __repr__(self):
+        return f"AssemblyAgreement(agree={self.agree}, identity={self.identity:.5f}, identical={self.identical}, n_contigs={self.n_contigs})"
+
+def read_fasta(path):
+    """Return (name, sequence) of every record in a FASTA file, sequences as upper case bytes."""
+    records = []
+    name, chunks = None, []
+    with open(path, 'rb') as fasta:
+        for line in fasta:
+            line = line.strip()
+            if line.startswith(b'>'):
+                if name is not None:
+                    records.append((name, b''.join(chunks).upper()))
+                name, chunks = line[1:].split()[0].decode() if len(line) > 1 else '', []
+            elif line:
+                chunks.append(line)
+    if name is not None:
+        records.append((name, b''.join(chunks).upper()))
+    return records
+
+def circular_contigs(assembly):
+    """
+    Circularity of the contigs of a Flye assembly, from the circ. column of assembly_info.txt next to it.
+
+    Returns:
+        circular (dict): Maps contig name to True or False. Empty if there is no assembly_info.txt.
+    """
+    info_path = os.path.join(os.path.dirname(assembly), 'assembly_info.txt')
+    circular = {}
+    if os.path.exists(info_path):
+        with open(info_path) as info:
+            for line in info:
+                if line.startswith('#') or not line.strip():
+                    continue
+                fields = line.rstrip('\n').split('\t')
+                circular[fields[0]] = fields[3] == 'Y'
+    return circular
+
+def kmer_hashes(sequence, k=DEFAULT_K, circular=False):
+    """
+    Forward and reverse complement 2-bit packed k-mers of a sequence, one per start position.
+
+    Parameters:
+        sequence (bytes): Sequence of the contig.
+        k (int): k-mer length, at most 31.
+        circular (bool): If True, k-mers wrapping around the end are included, so there is one per base.
+
+    Returns:
+        forward (np.ndarray): uint64 k-mers of the sequence.
+        reverse (np.ndarray): uint64 k-mers of the reverse complement strand, at the same positions.
+        valid (np.ndarray): False for k-mers containing a base other than ACGT.
+    """
+    if circular:
+        sequence = sequence + sequence[:k - 1]
+    codes = _CODES[np.frombuffer(sequence, dtype=np.uint8)]
+    n_kmers = len(codes) - k + 1
+    if n_kmers <= 0:
+        empty = np.zeros(0, dtype=np.uint64)
+        return empty, empty, np.zeros(0, dtype=bool)
+
+    invalid = (codes == 4).astype(np.int64)
+    valid = np.convolve(invalid, np.ones(k, dtype=np.int64), mode='valid') == 0
+    packed = np.minimum(codes, 3).astype(np.uint64)
+    complement = np.uint64(3) - packed
+    forward = np.zeros(n_kmers, dtype=np.uint64)
+    reverse = np.zeros(n_kmers, dtype=np.uint64)
+    for offset in range(k):
+        forward = (forward << np.uint64(2)) | packed[offset:offset + n_kmers]
+        reverse |= complement[offset:offset + n_kmers] << np.uint64(2 * offset)
+    return forward, reverse, valid
+
+def _mix(values):
+    """splitmix64 finalizer, so the anchor is not biased towards poly-A k-mers."""
+    values = values ^ (values >> np.uint64(30))
+    values = values * np.uint64(0xbf58476d1ce4e5b9)
+    values = values ^ (values >> np.uint64(27))
+    values = values * np.uint64(0x94d049bb133111eb)
+    return values ^ (values >> np.uint64(31))
+
+class _Contig:
+    """Canonical k-mer hashes of one contig and the bookkeeping to rotate it onto an anchor."""
+    __slots__ = ('name', 'sequence', 'circular', 'hashes', 'forward_strand', 'unique')
+
+    def __init__(self, name, sequence, circular, k):
+        self.name = name
+        self.sequence = sequence
+        self.circular = circular
+        forward, reverse, valid = kmer_hashes(sequence, k, circular)
+        forward, reverse = forward[valid], reverse[valid]
+        self.hashes = np.full(len(valid), np.iinfo(np.uint64).max, dtype=np.uint64)
+        self.hashes[valid] = _mix(np.minimum(forward, reverse))
+        self.forward_strand = np.zeros(len(valid), dtype=bool)
+        self.forward_strand[valid] = forward <= reverse
+        values, counts = np.unique(self.hashes[valid], return_counts=True)
+        self.unique = values[counts == 1]
+
+    def normalized(self, anchor, k):
+        """The sequence rotated to start at the anchor k-mer, on the strand the anchor is read forward on."""
+        position = int(np.flatnonzero(self.hashes == anchor)[0])
+        sequence = self.sequence
+        if not self.forward_strand[position]:
+            sequence = sequence.translate(_COMPLEMENT)[::-1]
+            position = (len(sequence) - position - k) % len(sequence)
+        if self.circular:
+            sequence = sequence[position:] + sequence[:position]
+        return sequence
+
+def kmer_identity(a, b, k=DEFAULT_K):
+    """
+    Sequence identity estimated from the Jaccard index of two canonical k-mer sets, as Mash does.
+
+    Parameters:
+        a, b (np.ndarray): Unique canonical k-mer hashes of the two sequences.
+        k (int): k-mer length.
+
+    Returns:
+        identity (float): 1.0 for identical sets, 0.0 for disjoint ones.
+    """
+    shared = len(np.intersect1d(a, b, assume_unique=True))
+    union = len(a) + len(b) - shared
+    if shared == 0 or union == 0:
+        return 0.0
+    jaccard = shared / union
+    return float((2 * jaccard / (1 + jaccard)) ** (1 / k))
+
+def compare_assemblies(assemblies, k=DEFAULT_K, min_identity=DEFAULT_MIN_IDENTITY):
+    """
+    Compare the replicate assemblies of a sample against the first one.
+
+    Each contig of the first replicate is paired with the contig of each other replicate sharing most of its k-mers. Paired circular
+    contigs are rotated and oriented onto their anchor before their sequences are compared; linear contigs are only oriented.
+    Contigs without assembly_info.txt are taken to be circular, as the workflow assembles plasmids.
+
+    Parameters:
+        assemblies (list of str): Paths to the replicates' assembly.fasta files.
+        k (int): k-mer length, odd and at most 31.
+        min_identity (float): k-mer identity every pair of contigs must reach. 1.0 requires identical normalized sequences.
+
+    Returns:
+        agreement (AssemblyAgreement): See AssemblyAgreement.
+    """
+    replicates = []
+    for assembly in assemblies:
+        circular = circular_contigs(assembly)
+        replicates.append([_Contig(name, sequence, circular.get(name, True), k) for name, sequence in read_fasta(assembly)])
+    n_contigs = [len(contigs) for contigs in replicates]
+    reference = replicates[0] if replicates else []
+    if not reference or any(count != len(reference) for count in n_contigs):
+        return AssemblyAgreement(False, 0.0, False, n_contigs, [])
+
+    identity = 1.0
+    identical = True
+    normalized = []
+    for contig in reference:
+        group = [contig]
+        for contigs in replicates[1:]:
+            overlaps = [len(np.intersect1d(contig.unique, other.unique, assume_unique=True)) for other in contigs]
+            group.append(contigs[int(np.argmax(overlaps))])
+        identity = min([identity] + [kmer_identity(contig.unique, other.unique, k) for other in group[1:]])
+
+        # The anchor is the smallest hash among the k-mers occurring exactly once in every contig of the group
+        shared = contig.unique
+        for other in group[1:]:
+            shared = np.intersect1d(shared, other.unique, assume_unique=True)
+        if len(shared) == 0:
+            identical = False
+            normalized.append((contig.name, contig.sequence))
+            continue
+        anchor = shared[0]
+        sequences = [member.normalized(anchor, k) for member in group]
+        identical = identical and all(sequence == sequences[0] for sequence in sequences[1:])
+        normalized.append((contig.name, sequences[0]))
+
+    agree = identical if min_identity >= 1 else identity >= min_identity
+    return AssemblyAgreement(agree, identity, identical, n_contigs, normalized)
+
+def write_fasta(records, output_path, line_width=80):
+    """Write (name, sequence) records to a FASTA file."""
+    with open(output_path, 'wb') as fasta:
+        for name, sequence in records:
+            fasta.write(b'>' + name.encode() + b'\n')
+            for start in range(0, len(sequence), line_width):
+                fasta.write(sequence[start:start + line_width] + b'\n')
+
+def check_directory(assembly_dir, k=DEFAULT_K, min_identity=DEFAULT_MIN_IDENTITY):
+    """
+    Compare the flye replicates of every sample in a flye output tree.
+
+    Parameters:
+        assembly_dir (str): Root directory of the flye outputs, holding the flye_* replicate directories of each sample.
+        k (int): k-mer length.
+        min_identity (float): See compare_assemblies.
+
+    Returns:
+        agreements (dict): Maps each sample directory, relative to assembly_dir, to its AssemblyAgreement.
+    """
+    agreements = {}
+    for root, dirs, files in os.walk(assembly_dir):
+        dirs.sort()
+        assemblies = [os.path.join(root, name, 'assembly.fasta') for name in dirs
+                      if name.startswith('flye_') and os.path.exists(os.path.join(root, name, 'assembly.fasta'))]
+        if len(assemblies) >= 2:
+            agreements[os.path.relpath(root, assembly_dir)] = compare_assemblies(assemblies, k, min_identity)
+    return agreements
+
+def main(argv=None):
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description='Check whether the flye replicates of every sample already agree.')
+    parser.add_argument('assembly_dir', help='Directory holding the flye assemblies, e.g. subsampled_flye_assemblies.')
+    parser.add_argument('--k', type=int, default=DEFAULT_K, help=f'k-mer length, odd and at most 31 (default: {DEFAULT_K}).')
+    parser.add_argument('--min-identity', type=float, default=DEFAULT_MIN_IDENTITY,
+                        help='k-mer identity the replicates must reach to agree (default: 1.0, identical after rotation and orientation).')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    agreements = check_directory(args.assembly_dir, args.k, args.min_identity)
+    print(f"{'sample':<40}{'agree':>7}{'identical':>11}{'identity':>10}  contigs")
+    for sample, agreement in agreements.items():
+        print(f"{sample:<40}{str(agreement.agree):>7}{str(agreement.identical):>11}{agreement.identity:>10.5f}  {','.join(map(str, agreement.n_contigs))}")
+    n_agree = sum(agreement.agree for agreement in agreements.values())
+    print(f"{n_agree} of {len(agreements)} samples agree ({time.perf_counter() - start:.2f} s)")
+    return 0
+
+if __name__ == '__main__':
+    import sys
+
+    sys.exit(main())
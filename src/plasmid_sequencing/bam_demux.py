@@ -0,0 +1,243 @@
+## bam_demux
+import os
+from collections import OrderedDict, deque
+import numpy as np
+
+DEFAULT_CHUNK_READS = 10000  # Reads classified and filtered together
+DEFAULT_FLUSH_BYTES = 4 << 20  # Buffered FASTQ text per sample before it is compressed and written
+
+def barcode_name(tag_value):
+    """
+    Map a barcode tag value to a sample name.
+
+    'SQK-RBK114-96_barcode01' and 'barcode01' both become 'barcode01'. Reads without a tag are 'unclassified'.
+    """
+    if tag_value is None:
+        return 'unclassified'
+    tag_value = str(tag_value)
+    if 'barcode' in tag_value:
+        return 'barcode' + tag_value.split('barcode')[-1]
+    return tag_value.replace(os.sep, '_') or 'unclassified'
+
+class _BoundedFiles:
+    """
+    Binary append handles for many output files, keeping at most max_open of them open.
+
+    The least recently written file is closed when another one has to be opened, and is reopened in append mode when it is written again.
+    """
+    def __init__(self, max_open):
+        self.max_open = max(1, max_open)
+        self.handles = OrderedDict()
+        self.created = set()
+
+    def write(self, path, data):
+        handle = self.handles.pop(path, None)
+        if handle is None:
+            if len(self.handles) >= self.max_open:
+                self.handles.popitem(last=False)[1].close()
+            handle = open(path, 'ab' if path in self.created else 'wb')
+            self.created.add(path)
+        self.handles[path] = handle
+        handle.write(data)
+
+    def close(self):
+        for handle in self.handles.values():
+            handle.close()
+        self.handles.clear()
+
+class _BoundedBamWriters:
+    """
+    pysam BAM writers for many output files, keeping at most max_open of them open.
+
+    A BAM file cannot be appended to, so a writer that was closed early continues in a numbered part file.
+    close() concatenates the parts of every sample into its final BAM.
+    """
+    def __init__(self, max_open, header):
+        self.max_open = max(1, max_open)
+        self.header = header
+        self.writers = OrderedDict()
+        self.parts = {}
+
+    def write(self, path, reads):
+        import pysam
+
+        writer = self.writers.pop(path, None)
+        if writer is None:
+            if len(self.writers) >= self.max_open:
+                self.writers.popitem(last=False)[1].close()
+            parts = self.parts.setdefault(path, [])
+            parts.append(path if not parts else f"{path[:-len('.bam')]}.part{len(parts)}.bam")
+            writer = pysam.AlignmentFile(parts[-1], 'wb', header=self.header)
+        self.writers[path] = writer
+        for read in reads:
+            writer.write(read)
+
+    def close(self):
+        import pysam
+
+        for writer in self.writers.values():
+            writer.close()
+        self.writers.clear()
+        for path, parts in self.parts.items():
+            if len(parts) > 1:
+                merged_path = path + '.merged'
+                pysam.cat('-o', merged_path, *parts)
+                for part in parts:
+                    os.remove(part)
+                os.replace(merged_path, path)
+
+def _fastq_records(reads):
+    """Format pysam reads as FASTQ text in their original (basecalled) orientation."""
+    lines = []
+    for read in reads:
+        qualities = read.get_forward_qualities()
+        quality_string = (np.frombuffer(qualities, dtype=np.uint8) + 33).tobytes() if qualities is not None else b'!' * read.query_length
+        lines.append(b'@%s\n%s\n+\n%s\n' % (read.query_name.encode(), read.get_forward_sequence().encode(), quality_string))
+    return b''.join(lines)
+
+def _mean_qualities(reads):
+    """Mean Phred score of every read, computed the same way as filter_fastqs.calculate_batch_mean_quality."""
+    from .filter_fastqs import calculate_batch_mean_quality
+
+    quality_arrays = [read.query_qualities for read in reads]
+    lengths = np.array([len(qualities) if qualities is not None else 0 for qualities in quality_arrays], dtype=np.int64)
+    offsets = np.zeros(len(reads) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    qualities = np.frombuffer(b''.join(bytes(qualities) for qualities in quality_arrays if qualities is not None), dtype=np.uint8)
+    # calculate_batch_mean_quality expects Phred+33 characters
+    return calculate_batch_mean_quality(qualities + np.uint8(33), offsets)
+
+def bam_demux(input_bam, split_dir='demultiplexed_fastqs', barcode_tag='BC', output_format='fastq', min_length=0, min_mean_quality=0,
+              threads=4, max_open_files=64, compresslevel=6, save_png=False):
+    """
+    Split a basecalled BAM into per-sample files on its barcode tag, without a separate dorado demux pass.
+
+    The input is decompressed with pysam's BGZF threads. Reads are classified and optionally filtered in chunks, then
+    buffered per sample; FASTQ buffers are gzip compressed as independent members on a thread pool and appended to the sample file.
+    At most max_open_files sample files are open at any time, however many barcodes the BAM holds.
+
+    Output layout: <split_dir>/<sample>/<bam name>_<sample>.fastq.gz (or .bam), with split_dir next to the input BAM.
+    If a length or quality threshold is given, read length and quality histograms of every sample are written to <sample>/histograms
+    exactly as process_directory writes them, and read_summary_statistics.txt is generated.
+
+    Parameters:
+        input_bam (str): Path to the basecalled BAM, with barcodes assigned by the basecaller.
+        split_dir (str): Name of the output directory, created next to the input BAM.
+        barcode_tag (str): SAM tag holding the barcode classification.
+        output_format (str): 'fastq' for gzipped FASTQ, 'bam' to keep every SAM tag.
+        min_length (int): Minimum read length to keep. 0 disables the length filter.
+        min_mean_quality (float): Minimum mean read Q-score to keep. 0 disables the quality filter.
+        threads (int): BGZF decompression threads for the input and gzip compression threads for FASTQ output.
+        max_open_files (int): Maximum number of sample files open at once.
+        compresslevel (int): gzip compression level of FASTQ output.
+        save_png (bool): Whether to save histogram PNGs when filtering.
+
+    Returns:
+        output_directory (str): String representing the output directory root.
+        sample_outputs (dict): Maps each sample name to its output file.
+    """
+    import pysam
+    from concurrent.futures import ThreadPoolExecutor
+    from .fastq_io import gzip_compress
+    from .filter_fastqs import ReadFilter
+    from .telemetry import stage_timer, path_bytes
+
+    if output_format not in ('fastq', 'bam'):
+        raise ValueError(f"Unknown output_format: {output_format}")
+
+    input_bam = os.path.abspath(input_bam)
+    bam_base = os.path.basename(input_bam).split('.bam')[0]
+    output_directory = os.path.join(os.path.dirname(input_bam), split_dir)
+    os.makedirs(output_directory, exist_ok=True)
+    suffix = '.fastq.gz' if output_format == 'fastq' else '.bam'
+    filtering = min_length > 0 or min_mean_quality > 0
+
+    sample_outputs = {}
+    read_filters = {}
+    buffers = {}
+    pending = deque()  # (path, future) compression jobs, written in submission order so per-sample read order is kept
+    n_reads = 0
+    n_kept = 0
+
+    def output_path(sample):
+        if sample not in sample_outputs:
+            sample_dir = os.path.join(output_directory, sample)
+            os.makedirs(sample_dir, exist_ok=True)
+            sample_outputs[sample] = os.path.join(sample_dir, f"{bam_base}_{sample}{suffix}")
+        return sample_outputs[sample]
+
+    def write_pending(limit):
+        while len(pending) > limit:
+            path, future = pending.popleft()
+            files.write(path, future.result())
+
+    def flush(sample):
+        data = b''.join(buffers.pop(sample))
+        pending.append((output_path(sample), pool.submit(gzip_compress, data, compresslevel)))
+        write_pending(2 * threads)
+
+    def process_chunk(reads):
+        nonlocal n_kept
+        if not reads:
+            return
+        samples = np.array([barcode_name(read.get_tag(barcode_tag) if read.has_tag(barcode_tag) else None) for read in reads])
+        if filtering:
+            lengths = np.array([read.query_length for read in reads], dtype=np.int64)
+            mean_qualities = _mean_qualities(reads)
+
+        for sample in np.unique(samples).tolist():
+            indices = np.flatnonzero(samples == sample)
+            if filtering:
+                if sample not in read_filters:
+                    read_filters[sample] = ReadFilter(min_length, min_mean_quality)
+                indices = indices[read_filters[sample].filter_reads(lengths[indices], mean_qualities[indices])]
+            selected = [reads[i] for i in indices.tolist()]
+            n_kept += len(selected)
+            path = output_path(sample)
+            if output_format == 'bam':
+                files.write(path, selected)
+                continue
+            sample_buffer = buffers.setdefault(sample, [])
+            sample_buffer.append(_fastq_records(selected))
+            if sum(len(block) for block in sample_buffer) >= DEFAULT_FLUSH_BYTES:
+                flush(sample)
+
+    print(f'Reading in {input_bam}')
+    with stage_timer('bam_demux', input_bam, threads=threads) as timer, \
+            pysam.AlignmentFile(input_bam, 'rb', check_sq=False, threads=threads) as bam, ThreadPoolExecutor(max_workers=threads) as pool:
+        files = _BoundedFiles(max_open_files) if output_format == 'fastq' else _BoundedBamWriters(max_open_files, bam.header)
+        try:
+            chunk = []
+            for read in bam:
+                if read.is_secondary or read.is_supplementary:
+                    continue
+                chunk.append(read)
+                if len(chunk) >= DEFAULT_CHUNK_READS:
+                    n_reads += len(chunk)
+                    process_chunk(chunk)
+                    chunk = []
+            n_reads += len(chunk)
+            process_chunk(chunk)
+            for sample in list(buffers):
+                flush(sample)
+            write_pending(0)
+        finally:
+            files.close()
+        timer.fields.update(n_reads=n_reads, n_passed=n_kept, bytes_read=path_bytes([input_bam]), bytes_written=path_bytes(sample_outputs.values()))
+
+    print(f"Split {n_reads} reads from {input_bam} into {len(sample_outputs)} samples in {output_directory} ({n_kept} reads kept)")
+
+    if filtering:
+        from .extract_histogram_stats import extract_histogram_stats
+        from .filter_fastqs import histogram_dir
+
+        for sample, read_filter in read_filters.items():
+            hist_dir = histogram_dir(os.path.join(output_directory, sample), output_path(sample))
+            hist_dir.mkdir(parents=True, exist_ok=True)
+            read_filter.write_histograms(hist_dir, save_png=False, summary_root=output_directory)
+        extract_histogram_stats(output_directory)
+        if save_png:
+            from .render_histograms import render_directory
+            render_directory(output_directory, threads)
+
+    return output_directory, sample_outputs
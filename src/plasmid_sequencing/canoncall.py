@@ -16,10 +16,8 @@ def canoncall(pod5_dir, model='/Users/josephmckenna/dorado-0.5.3-osx-arm64/dorad
         None
             Outputs a BAM file holding the canonical base calls output by the dorado basecaller.
     """
-    import subprocess
+    from .scheduler import run_command
     output = bam + bam_suffix
     command = ["dorado", "basecaller", model, pod5_dir, "--kit-name", barcode_kit, "-Y"]
-    command_string = " ".join(command)
-    print(f"Running {command_string}\n to generate {output}")
-    with open(output, "w") as outfile:
-        subprocess.run(command, stdout=outfile)
\ No newline at end of file
+    print(f"Basecalling {pod5_dir} to generate {output}")
+    run_command(command, name=f'dorado basecaller {output}', outputs=[output], stdout=output, inputs=[pod5_dir])
\ No newline at end of file
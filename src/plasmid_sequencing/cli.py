@@ -0,0 +1,418 @@
+## cli
+"""
+plasmid-seq command line interface.
+
+Every stage of full_plasmid_workflow can be run on its own, reading the directory layout the previous stage wrote:
+
+    plasmid-seq demux run.bam
+    plasmid-seq filter demultiplexed_fastqs
+    plasmid-seq trim filtered_demuliplexed_fastqs
+    plasmid-seq subsample filtered_demuliplexed_fastqs
+    plasmid-seq assemble subsampled_trimmed_filtered_demuliplexed_fastqs
+    plasmid-seq polish filtered_demuliplexed_fastqs subsampled_flye_assemblies
+    plasmid-seq consensus filtered_demuliplexed_fastqs subsampled_flye_assemblies
+    plasmid-seq run-all run.bam
+
+Stages run their per-file jobs as workflow tasks, recorded in the same manifest as run-all
+(workflow_manifest.json next to the input by default), so --resume skips files that are already done.
+"""
+import os
+import sys
+from pathlib import Path
+
+FILTERED_DIR = 'filtered_demuliplexed_fastqs'
+SUBSAMPLED_DIR = 'subsampled_trimmed_filtered_demuliplexed_fastqs'
+FLYE_DIR = 'subsampled_flye_assemblies'
+
+def _sibling_dir(input_path, name):
+    """Stage outputs are written next to the stage input, as the recursive_* helpers do."""
+    return Path(os.path.abspath(input_path)).parent / name
+
+def _trim_file(fastq, threads):
+    from .porechop import porechop
+    from .full_plasmid_workflow import _require_outputs
+
+    output_paths = porechop(fastq, recurse=False, output_suffix='porechopped', extra_end_trim=2, discard_middle=True, threads=threads)
+    _require_outputs(output_paths, 'porechop')
+    return output_paths[0]
+
+def _estimate_genome_size(fastq):
+    """Estimate the construct length of a FASTQ from its read length histogram."""
+    from .construct_length import estimate_construct_length
+    from .fastq_io import parse_fastq_batches
+    from .histograms import HistogramAccumulator, MAX_READ_LENGTH
+
+    read_lengths = HistogramAccumulator(bin_size=1, max_bins=MAX_READ_LENGTH)
+    for batch in parse_fastq_batches(fastq):
+        read_lengths.update(batch.lengths)
+    return estimate_construct_length(read_lengths).value, int(read_lengths.total)
+
+def _subsample_file(fastq, output_subdir, coverage, genome_size, iterations, min_depth, subsampler, cache=None):
+    from .rasusa import rasusa
+    from .subsample import subsample_fastq, plan_subsampling, parse_genome_size
+
+    if genome_size == 'auto' or min_depth is not None:
+        estimated_construct_length, n_bases = _estimate_genome_size(fastq)
+        if genome_size == 'auto':
+            genome_size = estimated_construct_length if estimated_construct_length > 0 else '10kb'
+        if min_depth is not None:
+            plan = plan_subsampling(n_bases, genome_size, coverage, iterations, min_depth)
+            print(f"{fastq}: {plan['depth']:.1f}x depth, {plan['iterations']} replicates at {plan['coverage']:.1f}x")
+            coverage, iterations = plan['coverage'], plan['iterations']
+
+    os.makedirs(output_subdir, exist_ok=True)
+    if subsampler == 'builtin':
+        return subsample_fastq(fastq, coverage, genome_size, iterations, output_subdir)
+    return rasusa(fastq, coverage, f'{parse_genome_size(genome_size):.0f}b', iterations, output_subdir, cache=cache)
+
+def _assemble_file(fastq, output_subdir, iteration, threads=1, cache=None):
+    from .flye import flye
+    from .full_plasmid_workflow import _require_outputs
+
+    os.makedirs(output_subdir, exist_ok=True)
+    output_path = flye(fastq, 1000, False, 0.1, output=iteration, output_dir=output_subdir, cache=cache, threads=threads)
+    assembly = os.path.join(output_path, 'assembly.fasta')
+    _require_outputs([assembly], 'flye')
+    return assembly
+
+def _polish_file(polishing_fastq, assembly, iteration, threads=1, cache=None):
+    from .full_plasmid_workflow import _polish_task
+
+    return _polish_task(polishing_fastq, assembly, iteration, threads=threads, cache=cache)
+
+def _trimmed_fastq(trimmed_root, rel_path):
+    """Return the trimmed FASTQ of a sample, or None if its directory holds none."""
+    sample_dir = trimmed_root / rel_path
+    trimmed = sorted(file for file in os.listdir(sample_dir) if '.fastq' in file and 'porechop' in file) if sample_dir.is_dir() else []
+    if not trimmed:
+        print(f"No trimmed FASTQ found in {sample_dir}")
+        return None
+    return sample_dir / trimmed[0]
+
+def _polishing_reads_file(trimmed_fastq, assemblies, sample_dir, polish_depth):
+    from .full_plasmid_workflow import _polishing_reads_task
+
+    return _polishing_reads_task(trimmed_fastq, *assemblies, sample_dir, polish_depth)
+
+def _consensus_file(agreement, polishing_fastq, output_dir, threads=1, scheduler=None):
+    from .full_plasmid_workflow import _consensus_task
+
+    return _consensus_task(polishing_fastq, agreement, output_dir, threads=threads, scheduler=scheduler)
+
+def _demux_tasks(args):
+    import functools
+    from .full_plasmid_workflow import _demux_task, _bam_demux_task
+    from .workflow_engine import Task
+
+    input_bam = os.path.abspath(args.input_bam)
+    if args.demultiplexer == 'bam':
+        threads = args.threads or os.cpu_count() or 1
+        return [Task('demux', functools.partial(_bam_demux_task, threads=threads), args=(input_bam,), inputs=[input_bam], threads=threads)]
+    return [Task('demux', _demux_task, args=(input_bam,), inputs=[input_bam])]
+
+def _filter_tasks(args):
+    from .full_plasmid_workflow import _filter_task, _find_fastqs
+    from .workflow_engine import Task
+
+    output_root = _sibling_dir(args.input_dir, args.output_dir)
+    tasks = []
+    for input_file, rel_path in _find_fastqs(args.input_dir):
+        sample = str(rel_path).split('.fastq')[0]
+        output_file = output_root / rel_path.parent / (rel_path.name.split('.fastq')[0] + '_filtered.fastq.gz')
+        output_file.parent.mkdir(parents=True, exist_ok=True)
+        tasks.append(Task(f'filter:{sample}', _filter_task, args=(str(input_file), str(output_file), args.min_length, args.min_quality, str(output_root)), inputs=[input_file]))
+    return tasks
+
+def _filter_finish(args):
+    from .extract_histogram_stats import extract_histogram_stats
+    from .render_histograms import render_directory
+
+    output_root = _sibling_dir(args.input_dir, args.output_dir)
+    extract_histogram_stats(output_root)
+    if args.png:
+        render_directory(output_root, args.jobs or args.threads or os.cpu_count() or 1)
+
+def _trim_tasks(args):
+    from .full_plasmid_workflow import _find_fastqs
+    from .workflow_engine import Task
+
+    tasks = []
+    for input_file, rel_path in _find_fastqs(args.input_dir):
+        if 'porechop' in input_file.name:
+            continue
+        tasks.append(Task(f'trim:{rel_path}', _trim_file, args=(str(input_file), args.porechop_threads), inputs=[input_file], threads=args.porechop_threads))
+    return tasks
+
+def _subsample_tasks(args):
+    import functools
+    from .full_plasmid_workflow import _find_fastqs
+    from .workflow_engine import Task
+
+    output_root = _sibling_dir(args.input_dir, args.output_dir)
+    subsample_file = functools.partial(_subsample_file, cache=args.cache)
+    tasks = []
+    for input_file, rel_path in _find_fastqs(args.input_dir):
+        if 'porechop' not in input_file.name:
+            continue
+        tasks.append(Task(f'subsample:{rel_path}', subsample_file, args=(str(input_file), str(output_root / rel_path.parent), args.coverage, args.genome_size, args.iterations, args.min_depth, args.subsampler),
+                          inputs=[input_file]))
+    return tasks
+
+def _assemble_tasks(args):
+    import functools
+    from .full_plasmid_workflow import _find_fastqs
+    from .workflow_engine import Task
+
+    output_root = _sibling_dir(args.input_dir, args.output_dir)
+    assemble_file = functools.partial(_assemble_file, cache=args.cache)
+    tasks = []
+    for input_file, rel_path in _find_fastqs(args.input_dir):
+        if 'subsample_' not in input_file.name:
+            continue
+        iteration = input_file.name.split('subsample_')[1].split('.fastq')[0]
+        tasks.append(Task(f'assemble:{rel_path}', assemble_file, args=(str(input_file), str(output_root / rel_path.parent), iteration), inputs=[input_file]))
+    return _with_flye_threads(tasks, args)
+
+def _polish_tasks(args):
+    import functools
+    from .workflow_engine import Task
+
+    polish_file = functools.partial(_polish_file, cache=args.cache)
+    trimmed_root = Path(args.trimmed_dir)
+    samples = {}
+    for root, dirs, files in os.walk(args.assembly_dir):
+        dirs.sort()
+        if 'assembly.fasta' not in files or not os.path.basename(root).startswith('flye_'):
+            continue
+        rel_path = Path(root).parent.relative_to(args.assembly_dir)
+        samples.setdefault(rel_path, []).append(Path(root) / 'assembly.fasta')
+
+    reads_tasks = []
+    polish_tasks = []
+    for rel_path, assemblies in samples.items():
+        trimmed = _trimmed_fastq(trimmed_root, rel_path)
+        if trimmed is None:
+            continue
+        # One polishing read set per sample, built for all of its assemblies and shared by their polishing jobs
+        sample_dir = Path(args.assembly_dir) / rel_path
+        reads_tasks.append(Task(f'polish_reads:{rel_path}', _polishing_reads_file, args=(str(trimmed), [str(assembly) for assembly in assemblies], str(sample_dir), args.polish_depth or None),
+                                inputs=[trimmed, *assemblies]))
+        for assembly in assemblies:
+            iteration = assembly.parent.name.split('_')[1]
+            polish_tasks.append(Task(f'polish:{rel_path / assembly.parent.name}', polish_file, args=(str(assembly), iteration), deps=[f'polish_reads:{rel_path}'],
+                                     inputs=[assembly]))
+    return reads_tasks + _with_flye_threads(polish_tasks, args)
+
+def _consensus_tasks(args):
+    import functools
+    from .flye import flye_threads
+    from .full_plasmid_workflow import _agreement_task
+    from .workflow_engine import Task
+
+    trimmed_root = Path(args.trimmed_dir)
+    samples = []
+    for root, dirs, files in os.walk(args.assembly_dir):
+        dirs.sort()
+        assemblies = [Path(root) / name / 'assembly.fasta' for name in dirs if name.startswith('flye_') and (Path(root) / name / 'assembly.fasta').exists()]
+        if not assemblies:
+            continue
+        rel_path = Path(root).relative_to(args.assembly_dir)
+        trimmed = _trimmed_fastq(trimmed_root, rel_path)
+        if trimmed is not None:
+            samples.append((rel_path, trimmed, assemblies))
+
+    # Every sample's clusters run side by side, so the threads are split as over the replicates of all samples
+    threads = args.flye_threads or flye_threads(sum(len(assemblies) for _, _, assemblies in samples), args.threads)
+    consensus_file = functools.partial(_consensus_file, threads=threads, scheduler=args.scheduler)
+    tasks = []
+    for rel_path, trimmed, assemblies in samples:
+        sample_dir = Path(args.assembly_dir) / rel_path
+        tasks.append(Task(f'agreement:{rel_path}', _agreement_task, args=(*[str(assembly) for assembly in assemblies], str(sample_dir), 1.0 if args.agreement else None),
+                          inputs=assemblies))
+        tasks.append(Task(f'polish_reads:{rel_path}', _polishing_reads_file, args=(str(trimmed), [str(assembly) for assembly in assemblies], str(sample_dir), args.polish_depth or None),
+                          inputs=[trimmed, *assemblies]))
+        tasks.append(Task(f'consensus:{rel_path}', consensus_file, args=(str(sample_dir / 'trycycler'),),
+                          deps=[f'agreement:{rel_path}', f'polish_reads:{rel_path}'], priority=3))
+    return tasks
+
+def _with_flye_threads(tasks, args):
+    """
+    Give every flye task --flye-threads, or an even share of --threads over all of them, and --flye-memory.
+
+    The thread count is bound to the task function rather than added to its args, so changing it does not invalidate the manifest.
+    """
+    import functools
+    from .flye import flye_threads
+
+    threads = args.flye_threads or flye_threads(len(tasks), args.threads)
+    for task in tasks:
+        task.func = functools.partial(task.func, threads=threads)
+        task.threads = threads
+        task.memory = args.flye_memory
+    return tasks
+
+def _run_all(args):
+    from .full_plasmid_workflow import full_plasmid_workflow
+
+    return full_plasmid_workflow(args.input_bam, max_threads=args.threads, max_jobs=args.jobs, resume=args.resume, manifest_path=args.manifest,
+                                 iterations=args.iterations, porechop_threads=args.porechop_threads, cache_dir=args.cache_dir,
+                                 subsampler=args.subsampler, streaming=args.streaming, tmpdir=args.tmpdir, demultiplexer=args.demultiplexer,
+                                 coverage=args.coverage, genome_size=args.genome_size, min_depth=args.min_depth, render_png=args.png,
+                                 flye_threads=args.flye_threads, max_memory=args.max_memory, flye_memory=args.flye_memory,
+                                 polish_depth=args.polish_depth or None, consensus=args.consensus, agreement_identity=1.0 if args.agreement else None)
+
+def build_parser():
+    """Return the argparse parser of the plasmid-seq command."""
+    import argparse
+    from .result_cache import add_cache_actions
+
+    common = argparse.ArgumentParser(add_help=False)
+    group = common.add_argument_group('resources')
+    group.add_argument('--threads', type=int, default=None, help='CPU budget shared by all jobs (default: number of CPUs).')
+    group.add_argument('--jobs', type=int, default=None, help='Maximum number of jobs running at once (default: --threads).')
+    group.add_argument('--resume', action=argparse.BooleanOptionalAction, default=True,
+                       help='Skip jobs the manifest records as complete with unchanged inputs (default: on).')
+    group.add_argument('--max-memory', default=None, help='Memory budget of all jobs running at once, e.g. 64G (default: not budgeted).')
+    group.add_argument('--tmpdir', default=None, help='Scratch directory for intermediate files, also exported as TMPDIR to external tools.')
+    group.add_argument('--manifest', default=None, help='Task manifest (default: workflow_manifest.json next to the input).')
+    group.add_argument('--cache-dir', default=None, help='Content-addressed result cache for subsampling, assembly and polishing.')
+    group.add_argument('--telemetry', default=None, metavar='PATH',
+                       help='Append per-job timing and resource use to this JSON-lines file and summarize it per stage at the end '
+                            '(run-all defaults to telemetry.jsonl next to the input BAM).')
+
+    subsample_options = argparse.ArgumentParser(add_help=False)
+    group = subsample_options.add_argument_group('subsampling')
+    group.add_argument('--coverage', type=float, default=200, help='Target coverage of each replicate (default: 200).')
+    group.add_argument('--iterations', type=int, default=3, help='Number of subsampled replicates (default: 3).')
+    group.add_argument('--min-depth', type=float, default=20, help='Samples shallower than this are not assembled (default: 20). 0 keeps coverage and replicates as given.')
+    group.add_argument('--subsampler', choices=['rasusa', 'builtin'], default='rasusa', help='rasusa processes or the in-process subsampler.')
+
+    parser = argparse.ArgumentParser(prog='plasmid-seq', description='Plasmid assembly from nanopore reads.')
+    flye_options = argparse.ArgumentParser(add_help=False)
+    group = flye_options.add_argument_group('flye')
+    group.add_argument('--flye-threads', type=int, default=None, help='Threads per flye job (default: --threads split over all replicates, at most 8).')
+    group.add_argument('--flye-memory', default=None, help='Memory each flye job reserves against --max-memory, e.g. 8G.')
+
+    polish_options = argparse.ArgumentParser(add_help=False)
+    group = polish_options.add_argument_group('polishing')
+    group.add_argument('--polish-depth', type=float, default=100,
+                       help="Polish with each sample's best reads up to this depth of the assembly length (default: 100). 0 uses every trimmed read.")
+
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    demux_parser = subparsers.add_parser('demux', parents=[common], help='Split a basecalled BAM into per-sample FASTQs.')
+    demux_parser.add_argument('input_bam')
+    demux_parser.add_argument('--demultiplexer', choices=['dorado', 'bam'], default='dorado', help="dorado demux, or 'bam' to split on the basecaller's barcode tags in process.")
+
+    filter_parser = subparsers.add_parser('filter', parents=[common], help='Filter demultiplexed FASTQs on read length and quality.')
+    filter_parser.add_argument('input_dir')
+    filter_parser.add_argument('--output-dir', default=FILTERED_DIR, help='Output directory name, created next to input_dir.')
+    filter_parser.add_argument('--min-length', type=int, default=500)
+    filter_parser.add_argument('--min-quality', type=float, default=12)
+    filter_parser.add_argument('--png', action=argparse.BooleanOptionalAction, default=True, help='Render QC histogram PNGs (default: on).')
+
+    trim_parser = subparsers.add_parser('trim', parents=[common], help='Trim adapters from filtered FASTQs with porechop.')
+    trim_parser.add_argument('input_dir')
+    trim_parser.add_argument('--porechop-threads', type=int, default=4)
+
+    subsample_parser = subparsers.add_parser('subsample', parents=[common, subsample_options], help='Subsample trimmed FASTQs into replicates.')
+    subsample_parser.add_argument('input_dir')
+    subsample_parser.add_argument('--output-dir', default=SUBSAMPLED_DIR, help='Output directory name, created next to input_dir.')
+    subsample_parser.add_argument('--genome-size', default='auto', help="Genome size such as 10kb, or 'auto' to estimate it per sample (default).")
+
+    assemble_parser = subparsers.add_parser('assemble', parents=[common, flye_options], help='Assemble every subsampled replicate with flye.')
+    assemble_parser.add_argument('input_dir')
+    assemble_parser.add_argument('--output-dir', default=FLYE_DIR, help='Output directory name, created next to input_dir.')
+
+    polish_parser = subparsers.add_parser('polish', parents=[common, flye_options, polish_options], help='Polish every flye assembly with the trimmed reads of its sample.')
+    polish_parser.add_argument('trimmed_dir', help='Directory holding the trimmed FASTQs, e.g. filtered_demuliplexed_fastqs.')
+    polish_parser.add_argument('assembly_dir', help='Directory holding the flye assemblies, e.g. subsampled_flye_assemblies.')
+
+    consensus_parser = subparsers.add_parser('consensus', parents=[common, flye_options, polish_options],
+                                             help='Build a Trycycler consensus of the flye replicates of every sample, reading the depth-capped polishing set.')
+    consensus_parser.add_argument('trimmed_dir', help='Directory holding the trimmed FASTQs, e.g. filtered_demuliplexed_fastqs.')
+    consensus_parser.add_argument('assembly_dir', help='Directory holding the flye assemblies, e.g. subsampled_flye_assemblies.')
+    consensus_parser.add_argument('--agreement', action=argparse.BooleanOptionalAction, default=True,
+                                  help='Skip Trycycler for samples whose replicates are identical after rotation and orientation (default: on).')
+
+    run_parser = subparsers.add_parser('run-all', parents=[common, subsample_options, flye_options, polish_options], help='Run the full workflow from a basecalled BAM.')
+    run_parser.add_argument('input_bam')
+    run_parser.add_argument('--demultiplexer', choices=['dorado', 'bam'], default='dorado')
+    run_parser.add_argument('--porechop-threads', type=int, default=4)
+    run_parser.add_argument('--genome-size', default='10kb', help='Genome size used when a construct length cannot be estimated (default: 10kb).')
+    run_parser.add_argument('--streaming', action='store_true', help='Filter, trim and subsample each sample in one streaming task.')
+    run_parser.add_argument('--png', action=argparse.BooleanOptionalAction, default=True, help='Render QC histogram PNGs (default: on).')
+    run_parser.add_argument('--consensus', action=argparse.BooleanOptionalAction, default=True, help='Build a Trycycler consensus of every sample (default: on).')
+    run_parser.add_argument('--agreement', action=argparse.BooleanOptionalAction, default=True,
+                            help='Skip Trycycler and the polishing of all but one replicate for samples whose replicates are identical (default: on).')
+
+    cache_parser = subparsers.add_parser('cache', help='List, prune or clear the result cache.')
+    cache_parser.add_argument('--cache-dir', default=None, help='Cache directory (default: $PLASMID_SEQ_CACHE_DIR or ~/.cache/plasmid_sequencing).')
+    add_cache_actions(cache_parser)
+
+    return parser
+
+_STAGES = {
+    'demux': ('input_bam', _demux_tasks),
+    'filter': ('input_dir', _filter_tasks),
+    'trim': ('input_dir', _trim_tasks),
+    'subsample': ('input_dir', _subsample_tasks),
+    'assemble': ('input_dir', _assemble_tasks),
+    'polish': ('trimmed_dir', _polish_tasks),
+    'consensus': ('trimmed_dir', _consensus_tasks),
+}
+
+def main(argv=None):
+    """Entry point of the plasmid-seq command. Returns 0 if every task completed or was skipped, 1 otherwise."""
+    args = build_parser().parse_args(argv)
+
+    if args.command == 'cache':
+        from .result_cache import DEFAULT_MAX_BYTES, cache_command
+
+        cache_command(args.cache_dir, args.action, getattr(args, 'max_size', DEFAULT_MAX_BYTES))
+        return 0
+    if args.tmpdir:
+        import tempfile
+
+        os.makedirs(args.tmpdir, exist_ok=True)
+        os.environ['TMPDIR'] = os.path.abspath(args.tmpdir)
+        tempfile.tempdir = None
+    if getattr(args, 'min_depth', None) == 0:
+        args.min_depth = None
+    if args.telemetry:
+        from .telemetry import set_telemetry_path
+
+        set_telemetry_path(args.telemetry)
+
+    if args.command == 'run-all':
+        _, failed = _run_all(args)
+    else:
+        from .result_cache import ResultCache
+        from .scheduler import JobScheduler
+        from .workflow_engine import WorkflowEngine
+
+        input_attribute, build_tasks = _STAGES[args.command]
+        manifest_path = args.manifest or _sibling_dir(getattr(args, input_attribute), 'workflow_manifest.json')
+        args.cache = ResultCache(args.cache_dir) if args.cache_dir else None
+        args.scheduler = JobScheduler(args.threads, args.jobs, args.max_memory)
+        engine = WorkflowEngine(manifest_path, scheduler=args.scheduler, resume=args.resume)
+        tasks = build_tasks(args)
+        if not tasks:
+            print(f"Nothing to do for {args.command}")
+        engine.run(tasks)
+        if args.command == 'filter':
+            _filter_finish(args)
+        failed = engine.failed
+        if args.telemetry and os.path.exists(args.telemetry):
+            from .telemetry import write_summary
+
+            write_summary(args.telemetry)
+
+    failed = {name: reason for name, reason in failed.items() if not reason.startswith('skipped') and reason != 'dependency skipped'}
+    if failed:
+        print(f"{len(failed)} tasks failed: {', '.join(sorted(failed))}")
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,142 @@
+## construct_length
+import numpy as np
+
+DEFAULT_BINS_PER_DECADE = 100  # Log-spaced bins are about 2.3% wide
+DEFAULT_SMOOTHING_BINS = 1.5  # Standard deviation of the Gaussian smoothing kernel, in bins
+DEFAULT_TOLERANCE = 0.05  # Relative window around the estimate used for refinement and confidence
+DEFAULT_UPPER_QUANTILE = 0.999  # Values above this quantile (e.g. chimeric reads) are outside the search range by default
+DEFAULT_PROMINENCE = 0.5  # Minimum height and prominence of a peak, relative to the tallest smoothed bin
+
+class PeakEstimate:
+    """
+    Result of a histogram peak search.
+
+    Attributes:
+        value (float): The estimate, e.g. the construct length in bp. NaN if the histogram was empty.
+        confidence (float): Fraction of the values in the search range that lie within the tolerance window around the estimate.
+        method (str): 'peak' if a prominent peak was found, 'mode' if the tallest smoothed bin was used instead, 'none' if there was no data.
+        peaks (list of float): Centres of every prominent peak in the search range, in increasing order.
+        n_values (int): Number of values in the search range.
+    """
+    __slots__ = ('value', 'confidence', 'method', 'peaks', 'n_values')
+
+    def __init__(self, value, confidence, method, peaks, n_values):
+        self.value = value
+        self.confidence = confidence
+        self.method = method
+        self.peaks = peaks
+        self.n_values = n_values
+
+    def __repr__(self):
+        return f"PeakEstimate(value={self.value:.1f}, confidence={self.confidence:.2f}, method={self.method!r}, peaks={len(self.peaks)})"
+
+
+def _smooth(values, sigma):
+    if sigma <= 0:
+        return values
+    radius = int(np.ceil(4 * sigma))
+    offsets = np.arange(-radius, radius + 1)
+    kernel = np.exp(-0.5 * (offsets / sigma) ** 2)
+    # 'full' then trimmed, because 'same' returns the longer of the two inputs when the kernel is longer than values
+    return np.convolve(values, kernel / kernel.sum(), mode='full')[radius:radius + len(values)]
+
+def estimate_histogram_peak(counts, edges, lower=None, upper=None, log_bins=True, bins_per_decade=DEFAULT_BINS_PER_DECADE,
+                            smoothing=DEFAULT_SMOOTHING_BINS, tolerance=DEFAULT_TOLERANCE, prominence=DEFAULT_PROMINENCE):
+    """
+    Find the highest-valued prominent peak of a histogram.
+
+    The counts are rebinned onto a coarse grid (log-spaced by default, so the grid size depends on the dynamic range and not on the
+    longest value), smoothed with a Gaussian kernel and searched for peaks only between lower and upper. The peak position is then
+    refined on the original bins as the median of the values within the tolerance window around it. If no bin passes the prominence
+    threshold, the tallest smoothed bin is used.
+
+    Parameters:
+        counts (np.ndarray): Histogram counts.
+        edges (np.ndarray): Bin edges, one longer than counts.
+        lower (float | None): Lower end of the search range. Defaults to the first edge.
+        upper (float | None): Upper end of the search range. Defaults to the DEFAULT_UPPER_QUANTILE quantile of the data.
+        log_bins (bool): Rebin onto log-spaced bins (for read lengths) rather than keeping the original bins (for quality scores).
+        bins_per_decade (int): Resolution of the log-spaced grid.
+        smoothing (float): Standard deviation of the smoothing kernel in grid bins. 0 disables smoothing.
+        tolerance (float): Relative half-width of the refinement and confidence window.
+        prominence (float): Minimum height and prominence of a peak, relative to the tallest smoothed bin.
+
+    Returns:
+        estimate (PeakEstimate)
+    """
+    from scipy.signal import find_peaks
+
+    edges = np.asarray(edges, dtype=np.float64)
+    # Number of values below every edge. Interpolating it gives the count below any position, assuming values are spread evenly inside a bin.
+    cumulative = np.concatenate(([0], np.cumsum(counts, dtype=np.float64)))
+    total = cumulative[-1]
+    if total == 0:
+        return PeakEstimate(float('nan'), 0.0, 'none', [], 0)
+
+    def count_below(positions):
+        return np.interp(positions, edges, cumulative)
+
+    lower = edges[0] if lower is None else max(float(lower), edges[0])
+    upper = float(np.interp(DEFAULT_UPPER_QUANTILE * total, cumulative, edges)) if upper is None else min(float(upper), edges[-1])
+    n_in_range = count_below(upper) - count_below(lower)
+    if upper <= lower or n_in_range <= 0:
+        # Nothing in the requested range, so search everything rather than fail
+        lower, upper = edges[0], edges[-1]
+        n_in_range = total
+
+    if log_bins:
+        lower = max(lower, 1.0)
+        n_bins = max(int(np.ceil(np.log10(upper / lower) * bins_per_decade)), 1)
+        grid = np.geomspace(lower, upper, n_bins + 1)
+    else:
+        grid = edges[(edges > lower) & (edges < upper)]
+        grid = np.concatenate(([lower], grid, [upper]))
+    # Counts per unit of the data, so wider log bins at long lengths do not shift the peak upwards
+    density = np.diff(count_below(grid)) / np.diff(grid)
+    smoothed = _smooth(density, smoothing)
+    centres = np.sqrt(grid[:-1] * grid[1:]) if log_bins else (grid[:-1] + grid[1:]) / 2
+
+    # Pad with zeros so a maximum in the first or last bin still counts as a peak
+    threshold = prominence * smoothed.max()
+    peak_indices, _ = find_peaks(np.concatenate(([0], smoothed, [0])), height=threshold, prominence=threshold)
+    peak_indices -= 1
+    if len(peak_indices):
+        chosen = peak_indices[-1]
+        method = 'peak'
+    else:
+        chosen = int(np.argmax(smoothed))
+        method = 'mode'
+
+    # Refine on the original bins: median of the values within the tolerance window around the chosen grid bin
+    centre = centres[chosen]
+    window = np.array([centre * (1 - tolerance), centre * (1 + tolerance)])
+    window_counts = count_below(window)
+    if window_counts[1] > window_counts[0]:
+        value = float(np.interp(window_counts.mean(), cumulative, edges))
+    else:
+        value = float(centre)
+
+    window = np.array([value * (1 - tolerance), value * (1 + tolerance)])
+    confidence = float(np.diff(count_below(window))[0] / n_in_range)
+
+    return PeakEstimate(value, min(confidence, 1.0), method, centres[peak_indices].tolist(), int(round(n_in_range)))
+
+def estimate_construct_length(accumulator, min_length=0, max_length=None, **kwargs):
+    """
+    Estimate the construct length of a sample from its read length histogram.
+
+    The longest prominent peak of the read length distribution is used. If the library was not over-tagmented, this is
+    the full-length plasmid. Reads shorter than min_length (e.g. the filter threshold) and the longest 0.1% of reads are
+    outside the search range by default, so a few chimeric reads cannot move the estimate.
+
+    Parameters:
+        accumulator (HistogramAccumulator): Read length histogram.
+        min_length (int): Shortest construct length considered.
+        max_length (int | None): Longest construct length considered.
+        **kwargs: Passed on to estimate_histogram_peak.
+
+    Returns:
+        estimate (PeakEstimate)
+    """
+    counts, edges = accumulator.histogram()
+    return estimate_histogram_peak(counts, edges, lower=min_length, upper=max_length, **kwargs)
@@ -14,7 +14,7 @@ def demux(input_path, barcode_kit='SQK-RBK114-96', split_dir='demultiplexed_fast
         output_directory (str): String representing the output directory root.
     """
     import os
-    import subprocess
+    from .scheduler import run_command
 
     command = ["dorado", "demux", "--kit-name", barcode_kit, '--output-dir', split_dir]
 
@@ -22,12 +22,9 @@ def demux(input_path, barcode_kit='SQK-RBK114-96', split_dir='demultiplexed_fast
         command.append('--emit-fastq')
 
     command.append(input_path)
-    command_string = " ".join(command)
-    print(f"Running {command_string}\n to generate demultiplexed outputs")
-
-    subprocess.run(command)
-
     input_directory = os.path.dirname(input_path)
     output_directory = os.path.join(input_directory, split_dir)
 
+    run_command(command, name=f'dorado demux {input_path}', outputs=[output_directory], inputs=[input_path])
+
     return output_directory
\ No newline at end of file
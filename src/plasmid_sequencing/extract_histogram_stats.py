@@ -2,57 +2,52 @@
 
 def extract_histogram_stats(input_path):
     """
-    
+    Summarize every histogram text file under input_path into read_summary_statistics.txt.
+
+    Statistics are kept per histogram file in a SQLite store (summary_store.SummaryStore) in input_path.
+    Histograms written by a filter that was given the store are recorded straight from their accumulators; any other
+    histogram file is loaded only if it is new or changed since it was last summarized. The report is then generated
+    from the store, so adding samples to a tree only costs the new samples.
+
     Parameters:
+        input_path (str): Root directory containing sample subdirectories, each with a histograms folder holding a directory per FASTQ.
 
+    Returns:
+        output_file (str): Path of read_summary_statistics.txt.
     """
     import os
     import numpy as np
+    from .summary_store import SummaryStore, histogram_sample, summarize_histogram
+
+    histogram_paths = []
+    n_loaded = 0
+    with SummaryStore(input_path) as store:
+        # Traverse the directory tree
+        for subdir, dirs, files in os.walk(input_path):
+            dirs.sort()
+            # Check if the current folder is a FASTQ's folder inside "histograms", or a "histograms" folder of an older run
+            if "histograms" not in (os.path.basename(subdir), os.path.basename(os.path.dirname(subdir))):
+                continue
+            sample_name = histogram_sample(subdir)
+
+            # Process each histogram file in the current folder
+            for file in sorted(files):
+                if not file.endswith(".txt"):  # Only process .txt files
+                    continue
+                file_path = os.path.join(subdir, file)
+                histogram_paths.append(file_path)
+                if store.is_current(file_path):
+                    continue
+
+                # Load the histogram data
+                data = np.loadtxt(file_path, ndmin=2)
+                if len(data) == 0:
+                    continue
+                store.upsert(file_path, sample_name, summarize_histogram(data[:, 0], data[:, 1], data[:, 2]))
+                n_loaded += 1
+
+        store.prune(histogram_paths)
+        output_file = store.write_report()
 
-    # Root directory containing sample subdirectories
-    output_file = os.path.join(input_path, "read_summary_statistics.txt")
-
-    # Initialize a list to hold the results
-    summary = []
-
-    # Traverse the directory tree
-    for subdir, dirs, files in os.walk(input_path):
-        # Check if the current folder is named "histograms"
-        if os.path.basename(subdir) == "histograms":
-            # Extract the sample name (two levels above)
-            sample_name = os.path.basename(os.path.dirname(subdir))
-            
-            # Process each histogram file in the current "histograms" folder
-            for file in files:
-                if file.endswith(".txt"):  # Only process .txt files
-                    file_path = os.path.join(subdir, file)
-                    
-                    # Load the histogram data
-                    data = np.loadtxt(file_path)
-                    start_edges = data[:, 0]
-                    end_edges = data[:, 1]
-                    counts = data[:, 2]
-                    
-                    # Calculate the statistics
-                    total_counts = np.sum(counts)
-                    mean_count = np.mean(counts)
-                    median_count = np.median(counts)
-                    range_edges = end_edges[-1] - start_edges[0]
-                    weighted_mean = np.sum(counts * (start_edges + end_edges) / 2) / total_counts
-                    
-                    # Append the results as a row to the summary
-                    summary.append([
-                        sample_name, file, total_counts, mean_count, 
-                        median_count, range_edges, weighted_mean
-                    ])
-
-    # Sort the summary by sample name (ascending order)
-    summary = sorted(summary, key=lambda x: x[0])
-
-    # Write the summary to a file
-    with open(output_file, "w") as f:
-        # Write the header row
-        f.write("Sample\tHistogram File\tTotal Counts\tMean Count\tMedian Count\tRange of Edges\tWeighted Mean\n")
-        # Write the data rows
-        for row in summary:
-            f.write(f"{row[0]}\t{row[1]}\t{row[2]:.2f}\t{row[3]:.2f}\t{row[4]:.2f}\t{row[5]:.2f}\t{row[6]:.2f}\n")
+    print(f"Summarized {len(histogram_paths)} histograms ({n_loaded} loaded from text) to: {output_file}")
+    return output_file
@@ -15,8 +15,8 @@ def fastcat(input, recurse=True, output_directory='concatenated_fastqs', file_su
         max_length (bool | int): -b option is the maximum read length that will be included in the concatenated FASTQ output.
         min_quality (bool | int) -q option is the minimum Q-score that will be included in the concatenated FASTQ output.
     """
-    import subprocess
     import os
+    from .scheduler import run_command
 
     if os.path.isdir(input):
         input_isdir = True
@@ -51,8 +51,5 @@ def fastcat(input, recurse=True, output_directory='concatenated_fastqs', file_su
         command_list += output_command_list     
 
     command_list.append(input)   
-    command_string = ' '.join(command_list)
 
-    print(f"Running {command_string}")        
-
-    subprocess.run(command_list)
\ No newline at end of file
+    run_command(command_list, name=f'fastcat {input}', inputs=[input])
\ No newline at end of file
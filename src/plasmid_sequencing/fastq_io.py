@@ -0,0 +1,503 @@
+## fastq_io
+import gzip
+import shutil
+import struct
+import subprocess
+import zlib
+import numpy as np
+
+try:
+    from isal import igzip as _isal_gzip
+    from isal import isal_zlib as _isal_zlib
+except ImportError:  # python-isal is an optional fast path
+    _isal_gzip = None
+    _isal_zlib = None
+
+DEFAULT_CHUNK_SIZE = 1 << 20  # 1 MiB of raw FASTQ per read() call
+LONG_READ_THRESHOLD = 1024  # Sequence length above which quality lines are skipped instead of scanned
+
+BGZF_BLOCK_SIZE = 0xff00  # Uncompressed bytes per BGZF block, as written by htslib
+# Empty block that terminates every BGZF file
+BGZF_EOF = b'\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00\x1b\x00\x03\x00\x00\x00\x00\x00\x00\x00\x00\x00'
+
+_NEWLINE = ord('\n')
+_CARRIAGE_RETURN = ord('\r')
+
+class FastqBatch:
+    """
+    A batch of FASTQ records that share one bytes buffer.
+
+    Every record is stored as the start and end offsets of its four lines (header, sequence, separator, quality) into `buffer`.
+    Line ends exclude the newline (and any carriage return), so `buffer[starts[i, 1]:ends[i, 1]]` is the sequence of record i.
+
+    Attributes:
+        buffer (bytes): Raw FASTQ text holding every record in the batch.
+        starts (np.ndarray): int64 array of shape (n_records, 4) with the start offset of each line.
+        ends (np.ndarray): int64 array of shape (n_records, 4) with the end offset of each line.
+        record_ends (np.ndarray): int64 array with the offset one past the final newline of each record.
+        has_carriage_returns (bool): True if any line in the batch ended in a carriage return.
+    """
+    __slots__ = ('buffer', 'starts', 'ends', 'record_ends', 'has_carriage_returns')
+
+    def __init__(self, buffer, starts, ends, record_ends, has_carriage_returns=False):
+        self.buffer = buffer
+        self.starts = starts
+        self.ends = ends
+        self.record_ends = record_ends
+        self.has_carriage_returns = has_carriage_returns
+
+    def __len__(self):
+        return len(self.starts)
+
+    @property
+    def record_starts(self):
+        """Offset of the first byte of every record."""
+        return self.starts[:, 0]
+
+    @property
+    def lengths(self):
+        """Read length of every record."""
+        return self.ends[:, 1] - self.starts[:, 1]
+
+    @property
+    def quality_starts(self):
+        """Offset of the first quality character of every record."""
+        return self.starts[:, 3]
+
+    @property
+    def quality_lengths(self):
+        """Number of quality characters of every record."""
+        return self.ends[:, 3] - self.starts[:, 3]
+
+    def line(self, i, line_index):
+        """Return line `line_index` (0 header, 1 sequence, 2 separator, 3 quality) of record i as bytes."""
+        return self.buffer[self.starts[i, line_index]:self.ends[i, line_index]]
+
+    def record_bytes(self, i):
+        """Return record i exactly as it appears in the input, including newlines."""
+        return self.buffer[self.starts[i, 0]:self.record_ends[i]]
+
+    def quality_array(self):
+        """
+        Gather the quality strings of every record into one contiguous array.
+
+        Returns:
+            qualities (np.ndarray): uint8 array holding the raw (Phred+33) quality characters of all records back to back.
+            offsets (np.ndarray): int64 array of length n_records + 1; record i spans qualities[offsets[i]:offsets[i + 1]].
+        """
+        quality_lengths = self.quality_lengths
+        offsets = np.zeros(len(quality_lengths) + 1, dtype=np.int64)
+        np.cumsum(quality_lengths, out=offsets[1:])
+        view = np.frombuffer(self.buffer, dtype=np.uint8)
+        positions = np.arange(offsets[-1], dtype=np.int64) + np.repeat(self.quality_starts - offsets[:-1], quality_lengths)
+        return view[positions], offsets
+
+    def records_bytes(self, indices):
+        """
+        Return the selected records as one block of FASTQ text ready to be written out.
+
+        Records are copied verbatim unless the batch had Windows line endings, in which case they are rebuilt with newlines only.
+        """
+        buffer = self.buffer
+        if not self.has_carriage_returns:
+            return b''.join([buffer[s:e] for s, e in zip(self.starts[indices, 0].tolist(), self.record_ends[indices].tolist())])
+        lines = []
+        for row_starts, row_ends in zip(self.starts[indices].tolist(), self.ends[indices].tolist()):
+            lines.extend(buffer[s:e] for s, e in zip(row_starts, row_ends))
+        lines.append(b'')
+        return b'\n'.join(lines)
+
+    def records(self):
+        """Yield (header, sequence, separator, quality) string tuples, matching the legacy parse_fastq output."""
+        buffer = self.buffer
+        for row_starts, row_ends in zip(self.starts.tolist(), self.ends.tolist()):
+            yield tuple(buffer[s:e].decode() for s, e in zip(row_starts, row_ends))
+
+def _find_newlines_vectorized(view):
+    """Return the (n_records, 4) newline offsets of every complete record using one NumPy scan of the buffer."""
+    newlines = np.flatnonzero(view == _NEWLINE)
+    n_records = len(newlines) // 4
+    return newlines[:n_records * 4].reshape(n_records, 4)
+
+def _find_newlines_skipping_quality(buffer):
+    """
+    Return the (n_records, 4) newline offsets of every complete record using bytes.find.
+
+    The quality line is as long as the sequence line, so it is skipped rather than scanned.
+    For long nanopore reads this touches roughly half of the buffer and beats a full NumPy scan.
+    """
+    find = buffer.find
+    size = len(buffer)
+    newlines = []
+    append = newlines.append
+    position = 0
+    while position < size:
+        header_end = find(b'\n', position)
+        sequence_end = find(b'\n', header_end + 1)
+        separator_end = find(b'\n', sequence_end + 1)
+        if header_end < 0 or sequence_end < 0 or separator_end < 0:
+            break
+        quality_end = separator_end + sequence_end - header_end
+        if quality_end >= size:
+            break
+        if buffer[quality_end] != _NEWLINE:
+            raise ValueError(f"Sequence and quality lengths differ in FASTQ record: {buffer[position:header_end][:80]!r}")
+        append((header_end, sequence_end, separator_end, quality_end))
+        position = quality_end + 1
+    return np.array(newlines, dtype=np.int64).reshape(-1, 4)
+
+def _split_records(buffer):
+    """
+    Locate every complete four-line record in a buffer.
+
+    Parameters:
+        buffer (bytes): Raw FASTQ text beginning at a record boundary.
+
+    Returns:
+        batch (FastqBatch | None): Complete records found in the buffer, or None if there are none.
+        consumed (int): Number of bytes of the buffer covered by the returned batch.
+    """
+    view = np.frombuffer(buffer, dtype=np.uint8)
+
+    # Pick the newline search from the length of the first read in the buffer
+    header_end = buffer.find(b'\n')
+    sequence_end = buffer.find(b'\n', header_end + 1)
+    if header_end >= 0 and sequence_end - header_end > LONG_READ_THRESHOLD:
+        newlines = _find_newlines_skipping_quality(buffer)
+    else:
+        newlines = _find_newlines_vectorized(view)
+
+    n_records = len(newlines)
+    if n_records == 0:
+        return None, 0
+
+    record_ends = newlines[:, 3] + 1
+
+    starts = np.empty((n_records, 4), dtype=np.int64)
+    starts[0, 0] = 0
+    starts[1:, 0] = record_ends[:-1]
+    starts[:, 1:] = newlines[:, :3] + 1
+
+    # Strip Windows line endings the same way str.strip() did in the line-by-line parser
+    ends = newlines.astype(np.int64)
+    has_carriage_return = view[np.maximum(ends - 1, 0)] == _CARRIAGE_RETURN
+    has_carriage_return &= ends > starts
+    ends -= has_carriage_return
+
+    return FastqBatch(buffer, starts, ends, record_ends, bool(has_carriage_return.any())), int(record_ends[-1])
+
+def iter_fastq_batches(handle, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Parse an open binary FASTQ stream into batches of records.
+
+    Parameters:
+        handle (file object): A binary file-like object positioned at the start of a record.
+        chunk_size (int): Number of bytes requested from the stream per read.
+
+    Returns:
+        Generator of FastqBatch objects, in file order.
+    """
+    leftover = b''
+    while True:
+        chunk = handle.read(chunk_size)
+        final = not chunk
+        buffer = leftover + chunk if leftover else chunk
+
+        if final:
+            # Ignore trailing blank lines and terminate a final record that lacks a newline
+            if not buffer.strip():
+                return
+            if not buffer.endswith(b'\n'):
+                buffer += b'\n'
+
+        batch, consumed = _split_records(buffer)
+        if batch is not None:
+            yield batch
+        leftover = buffer[consumed:]
+
+        if final:
+            if leftover.strip():
+                raise ValueError(f"Truncated FASTQ record at end of input: {leftover[:80]!r}")
+            return
+
+def parse_fastq_batches(file_path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Parse a FASTQ file into batches of records using large binary reads.
+
+    Parameters:
+        file_path (str | Path): Path to the FASTQ file.
+        chunk_size (int): Number of bytes read from disk per call.
+
+    Returns:
+        Generator of FastqBatch objects, in file order.
+    """
+    with open_fastq(file_path) as fq:
+        yield from iter_fastq_batches(fq, chunk_size)
+
+def is_gzipped(file_path):
+    """Return True if the file starts with the gzip magic number."""
+    with open(file_path, 'rb') as handle:
+        return handle.read(2) == b'\x1f\x8b'
+
+def open_fastq(file_path):
+    """
+    Open a plain or gzip compressed FASTQ for binary reading.
+
+    Compression is detected from the file content rather than the extension. python-isal is used for decompression when installed.
+
+    Parameters:
+        file_path (str | Path): Path to the FASTQ file.
+
+    Returns:
+        handle (file object): A binary file-like object.
+    """
+    if not is_gzipped(file_path):
+        return open(file_path, 'rb')
+    if _isal_gzip is not None:
+        return _isal_gzip.open(file_path, 'rb')
+    return gzip.open(file_path, 'rb')
+
+class PipedCompressor:
+    """
+    Binary writer that streams data through an external multithreaded gzip compressor (pigz) into a file.
+    """
+    def __init__(self, file_path, compresslevel=6, threads=4, executable='pigz'):
+        self._outfile = open(file_path, 'wb')
+        command = [executable, '-c', '-n', f'-{compresslevel}', '-p', str(threads)]
+        self._process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=self._outfile)
+        self._command_string = ' '.join(command)
+
+    def write(self, data):
+        return self._process.stdin.write(data)
+
+    def close(self):
+        if self._process.stdin.closed:
+            return
+        self._process.stdin.close()
+        returncode = self._process.wait()
+        self._outfile.close()
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, self._command_string)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+def _bgzf_blocks(data, compresslevel):
+    """
+    Compress up to BGZF_BLOCK_SIZE bytes into BGZF blocks.
+
+    Returns:
+        blocks (list): (uncompressed size, block bytes) pairs. Data that does not compress below the 64 KiB block limit is split.
+    """
+    if _isal_zlib is not None:
+        deflated = _isal_zlib.compress(data, min(compresslevel, _isal_zlib.ISAL_BEST_COMPRESSION), -15)
+    else:
+        compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, -15)
+        deflated = compressor.compress(data) + compressor.flush()
+    block_size = len(deflated) + 26
+    if block_size > 0x10000:
+        half = len(data) // 2
+        return _bgzf_blocks(data[:half], compresslevel) + _bgzf_blocks(data[half:], compresslevel)
+    header = b'\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00' + struct.pack('<H', block_size - 1)
+    return [(len(data), header + deflated + struct.pack('<II', zlib.crc32(data), len(data)))]
+
+class BgzfWriter:
+    """
+    Binary writer producing BGZF, the blocked gzip variant used by BAM and tabix.
+
+    A BGZF file is a valid gzip file for every gzip reader, but its independent blocks also allow random access:
+    a virtual offset (compressed block start << 16 | offset inside the block) locates any byte of the uncompressed stream.
+    Blocks are compressed on a thread pool when threads > 1.
+
+    Parameters:
+        file_path (str | Path): Path to the output file.
+        compresslevel (int): Deflate compression level.
+        threads (int): Number of blocks compressed concurrently.
+    """
+    def __init__(self, file_path, compresslevel=6, threads=1):
+        self._outfile = open(file_path, 'wb')
+        self.compresslevel = compresslevel
+        self._buffer = bytearray()
+        self._pending = []
+        self._pool = None
+        if threads > 1:
+            from concurrent.futures import ThreadPoolExecutor
+            self._pool = ThreadPoolExecutor(max_workers=threads)
+        self._threads = threads
+        self._uncompressed_offset = 0
+        self._compressed_offset = 0
+        # Uncompressed and compressed start offsets of every block written so far
+        self._block_starts = []
+        self.closed = False
+
+    def tell(self):
+        """Offset in the uncompressed stream of the next byte written."""
+        return self._uncompressed_offset + len(self._buffer)
+
+    def write(self, data):
+        self._buffer += data
+        while len(self._buffer) >= BGZF_BLOCK_SIZE:
+            self._submit(bytes(self._buffer[:BGZF_BLOCK_SIZE]))
+            del self._buffer[:BGZF_BLOCK_SIZE]
+        return len(data)
+
+    def _submit(self, data):
+        if self._pool is None:
+            self._write_blocks(_bgzf_blocks(data, self.compresslevel))
+            return
+        self._pending.append(self._pool.submit(_bgzf_blocks, data, self.compresslevel))
+        while len(self._pending) > 2 * self._threads:
+            self._write_blocks(self._pending.pop(0).result())
+
+    def _write_blocks(self, blocks):
+        for size, block in blocks:
+            self._block_starts.append((self._uncompressed_offset, self._compressed_offset))
+            self._outfile.write(block)
+            self._uncompressed_offset += size
+            self._compressed_offset += len(block)
+
+    def virtual_offsets(self, uncompressed_offsets):
+        """Convert offsets in the uncompressed stream into BGZF virtual offsets. Only valid after close()."""
+        uncompressed_offsets = np.asarray(uncompressed_offsets, dtype=np.uint64)
+        starts = np.array(self._block_starts, dtype=np.uint64).reshape(-1, 2)
+        block = np.searchsorted(starts[:, 0], uncompressed_offsets, side='right') - 1
+        return (starts[block, 1] << np.uint64(16)) | (uncompressed_offsets - starts[block, 0])
+
+    def close(self):
+        if self.closed:
+            return
+        if self._buffer:
+            self._submit(bytes(self._buffer))
+            self._buffer.clear()
+        for future in self._pending:
+            self._write_blocks(future.result())
+        self._pending = []
+        if self._pool is not None:
+            self._pool.shutdown()
+        self._outfile.write(BGZF_EOF)
+        self._outfile.close()
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+def is_bgzf(file_path):
+    """Return True if the file starts with a BGZF block header."""
+    with open(file_path, 'rb') as handle:
+        header = handle.read(16)
+    return len(header) == 16 and header[:4] == b'\x1f\x8b\x08\x04' and header[12:14] == b'BC'
+
+def _read_bgzf_block(handle, block_offset):
+    """Return the decompressed data of the BGZF block starting at block_offset, and the offset of the next block."""
+    handle.seek(block_offset)
+    header = handle.read(18)
+    if len(header) < 18:
+        return b'', block_offset
+    block_size = struct.unpack('<H', header[16:18])[0] + 1
+    body = handle.read(block_size - 18)
+    return zlib.decompress(body[:-8], -15), block_offset + block_size
+
+def bgzf_virtual_offsets(file_path, uncompressed_offsets):
+    """
+    Convert offsets in the uncompressed stream of an existing BGZF file into virtual offsets.
+
+    Only block headers and trailers are read, so this is fast even for large files.
+    """
+    starts = []
+    uncompressed_start = 0
+    block_offset = 0
+    with open(file_path, 'rb') as handle:
+        while True:
+            handle.seek(block_offset)
+            header = handle.read(18)
+            if len(header) < 18:
+                break
+            block_size = struct.unpack('<H', header[16:18])[0] + 1
+            handle.seek(block_offset + block_size - 4)
+            data_size = struct.unpack('<I', handle.read(4))[0]
+            if data_size:
+                starts.append((uncompressed_start, block_offset))
+            uncompressed_start += data_size
+            block_offset += block_size
+    starts = np.array(starts, dtype=np.uint64).reshape(-1, 2)
+    uncompressed_offsets = np.asarray(uncompressed_offsets, dtype=np.uint64)
+    block = np.searchsorted(starts[:, 0], uncompressed_offsets, side='right') - 1
+    return (starts[block, 1] << np.uint64(16)) | (uncompressed_offsets - starts[block, 0])
+
+def fetch_bgzf(handle, virtual_offset, size):
+    """
+    Read size uncompressed bytes starting at a BGZF virtual offset.
+
+    Parameters:
+        handle (file object): BGZF file opened in binary mode.
+        virtual_offset (int): Compressed block start << 16 | offset inside the decompressed block.
+        size (int): Number of uncompressed bytes to read, which may span several blocks.
+    """
+    block_offset, within_block = int(virtual_offset) >> 16, int(virtual_offset) & 0xffff
+    chunks = []
+    needed = size
+    while needed > 0:
+        data, next_offset = _read_bgzf_block(handle, block_offset)
+        if not data and next_offset == block_offset:
+            raise ValueError(f"BGZF file ends before virtual offset {virtual_offset} + {size} bytes")
+        piece = data[within_block:within_block + needed]
+        within_block = 0
+        chunks.append(piece)
+        needed -= len(piece)
+        block_offset = next_offset
+    return b''.join(chunks)
+
+def gzip_compress(data, compresslevel=6):
+    """
+    Compress bytes into one complete gzip member, using python-isal when installed.
+
+    Members written one after another to the same file form a valid multi-member gzip file,
+    so output can be compressed in independent blocks (e.g. on worker threads) and appended.
+    """
+    if _isal_gzip is not None:
+        return _isal_gzip.compress(data, compresslevel=min(compresslevel, _isal_gzip.ISAL_BEST_COMPRESSION), mtime=0)
+    return gzip.compress(data, compresslevel=compresslevel, mtime=0)
+
+def open_compressed_output(file_path, compresslevel=6, threads=1, compressor='auto'):
+    """
+    Open a gzip compressed file for binary writing.
+
+    Parameters:
+        file_path (str | Path): Path to the output file.
+        compresslevel (int): gzip compression level from 1 (fastest) to 9 (smallest).
+        threads (int): Number of compression threads. More than one thread requires pigz on the PATH.
+        compressor (str): 'auto', 'pigz', 'isal', 'gzip' or 'bgzf'.
+            'auto' picks pigz when threads > 1 and it is installed, otherwise python-isal when installed, otherwise the gzip module.
+            python-isal supports levels 0-3, so higher levels are capped at 3 on that path.
+            'bgzf' writes blocked gzip that can be read at random offsets (see BgzfWriter); it is never picked by 'auto'.
+
+    The gzip header carries no timestamp, so identical reads always give an identical file.
+
+    Returns:
+        handle (file object): A binary writer that must be closed to finish the gzip stream.
+    """
+    if compressor == 'auto':
+        if threads > 1 and shutil.which('pigz'):
+            compressor = 'pigz'
+        elif _isal_gzip is not None:
+            compressor = 'isal'
+        else:
+            compressor = 'gzip'
+
+    if compressor == 'pigz':
+        return PipedCompressor(file_path, compresslevel, threads)
+    elif compressor == 'bgzf':
+        return BgzfWriter(file_path, compresslevel, threads)
+    elif compressor == 'isal':
+        if _isal_gzip is None:
+            raise ImportError("compressor='isal' requires the python-isal package")
+        return _isal_gzip.IGzipFile(file_path, 'wb', compresslevel=min(compresslevel, _isal_gzip.ISAL_BEST_COMPRESSION), mtime=0)
+    elif compressor == 'gzip':
+        return gzip.GzipFile(file_path, 'wb', compresslevel=compresslevel, mtime=0)
+    raise ValueError(f"Unknown compressor: {compressor}")
@@ -4,19 +4,13 @@ import os
 from pathlib import Path
 import statistics
 import numpy as np
-import matplotlib.pyplot as plt
+from .fastq_io import parse_fastq_batches, open_compressed_output
+from .histograms import HistogramAccumulator, MAX_READ_LENGTH
 
 def parse_fastq(file_path):
     """Generator to parse a FASTQ file and yield read tuples."""
-    with open(file_path, "r") as fq:
-        while True:
-            header = fq.readline().strip()
-            if not header:
-                break  # End of file
-            sequence = fq.readline().strip()
-            separator = fq.readline().strip()
-            quality = fq.readline().strip()
-            yield header, sequence, separator, quality
+    for batch in parse_fastq_batches(file_path):
+        yield from batch.records()
 
 def calculate_median_quality(quality_string):
     """Calculate the median quality score from a quality string."""
@@ -32,168 +26,337 @@ def calculate_mean_quality(quality_string):
     # Calculate and return the mean
     return sum(q_scores) / len(q_scores) if q_scores else 0.0
 
-def write_histogram_to_file(data, bin_size, output_path, label, filter_threshold, n_passed, save_png=True):
+# Error probability of every possible Phred+33 quality character
+_PHRED_ERROR_PROBABILITIES = 10.0 ** (-(np.arange(256, dtype=np.float64) - 33) / 10)
+
+def calculate_batch_mean_quality(qualities, offsets, error_averaged=False):
+    """
+    Calculate the mean quality score of every read in a batch.
+
+    Params:
+        qualities (np.ndarray): uint8 array of raw (Phred+33) quality characters for all reads back to back.
+        offsets (np.ndarray): Array of length n_reads + 1; read i spans qualities[offsets[i]:offsets[i + 1]].
+        error_averaged (bool): If True, average the per-base error probabilities and convert the mean back to a Phred score.
+            If False, take the arithmetic mean of the Phred scores, identical to calculate_mean_quality.
+
+    Returns:
+        mean_qualities (np.ndarray): float64 array with the mean quality of each read. Reads without bases get 0.0.
+    """
+    lengths = np.diff(offsets)
+    mean_qualities = np.zeros(len(lengths), dtype=np.float64)
+    nonempty = lengths > 0
+    if not nonempty.any():
+        return mean_qualities
+
+    read_starts = offsets[:-1][nonempty]
+    if error_averaged:
+        error_sums = np.add.reduceat(_PHRED_ERROR_PROBABILITIES[qualities], read_starts)
+        mean_qualities[nonempty] = -10 * np.log10(error_sums / lengths[nonempty])
+    else:
+        # Integer sums keep the division bit-identical to sum(q_scores) / len(q_scores)
+        phred_sums = np.add.reduceat(qualities, read_starts, dtype=np.int64) - 33 * lengths[nonempty]
+        mean_qualities[nonempty] = phred_sums / lengths[nonempty]
+    return mean_qualities
+
+def calculate_batch_median_quality(qualities, offsets):
+    """
+    Calculate the median quality score of every read in a batch.
+
+    Quality characters are counted per read into one bin per character value in the batch's observed range, so the median
+    is found from cumulative counts without sorting, in n_reads * (max - min + 1) counts rather than n_reads * 256.
+
+    Params:
+        qualities (np.ndarray): uint8 array of raw (Phred+33) quality characters for all reads back to back.
+        offsets (np.ndarray): Array of length n_reads + 1; read i spans qualities[offsets[i]:offsets[i + 1]].
+
+    Returns:
+        median_qualities (np.ndarray): float64 array matching calculate_median_quality for each read. Reads without bases get NaN.
+    """
+    lengths = np.diff(offsets)
+    n_reads = len(lengths)
+    if len(qualities) == 0:
+        return np.full(n_reads, np.nan)
+    q_min = int(qualities.min())
+    n_bins = int(qualities.max()) - q_min + 1
+    read_index = np.repeat(np.arange(n_reads, dtype=np.int64), lengths)
+    counts = np.bincount(read_index * n_bins + (qualities - q_min), minlength=n_reads * n_bins).reshape(n_reads, n_bins)
+    cumulative_counts = np.cumsum(counts, axis=1)
+
+    # The k-th smallest value (0-based) is the first bin whose cumulative count exceeds k
+    lower = (cumulative_counts <= ((lengths - 1) // 2)[:, None]).sum(axis=1)
+    upper = (cumulative_counts <= (lengths // 2)[:, None]).sum(axis=1)
+    median_qualities = (lower + upper) / 2 + q_min - 33
+    median_qualities[lengths == 0] = np.nan
+    return median_qualities
+
+def calculate_batch_min_quality(qualities, offsets):
+    """
+    Calculate the minimum quality score of every read in a batch.
+
+    Params:
+        qualities (np.ndarray): uint8 array of raw (Phred+33) quality characters for all reads back to back.
+        offsets (np.ndarray): Array of length n_reads + 1; read i spans qualities[offsets[i]:offsets[i + 1]].
+
+    Returns:
+        min_qualities (np.ndarray): int64 array with the lowest Phred score of each read. Reads without bases get -1.
+    """
+    lengths = np.diff(offsets)
+    min_qualities = np.full(len(lengths), -1, dtype=np.int64)
+    nonempty = lengths > 0
+    if nonempty.any():
+        min_qualities[nonempty] = np.minimum.reduceat(qualities, offsets[:-1][nonempty]).astype(np.int64) - 33
+    return min_qualities
+
+def histogram_dir(output_subdir, fastq_path):
+    """
+    Histogram directory of one FASTQ: output_subdir/histograms/<FASTQ name without its .fastq suffix>.
+
+    Every FASTQ gets its own directory, so FASTQs filtered side by side in the same sample directory never write to the same histogram files.
+    """
+    return Path(output_subdir) / "histograms" / os.path.basename(str(fastq_path)).split('.fastq')[0]
+
+def write_histogram_to_file(accumulator, output_path, label, filter_threshold, n_passed, save_png=True):
     """
     Generate and save histogram data to a text file.
     
     Params:
-        data (list): List of numerical data (e.g., read lengths or quality scores).
-        bin_size (int): Bin size for histogram.
+        accumulator (HistogramAccumulator): Binned counts of the numerical data (e.g., read lengths or quality scores).
         output_path (Path): Path to the output file.
         label (str): Label for the histogram (e.g., 'Length' or 'Quality').
         filter_threshold (float): Threshold for read filtering on a given data metric
         n_passed (int): Number of reads passing the current QC metric
+        save_png (bool): If True the PNG is drawn right away. If False only its plot data is saved, for render_histograms.render_directory.
 
     Returns:
         estimated_construct_length (int): Estimated construct length based on read length peak calling
     """
-    from scipy.signal import find_peaks
-
-    min_val = min(data)
-    max_val = max(data)
-    n_data = len(data)
-    range_vals = max_val - min_val
-    bins = np.arange(min_val, max_val + bin_size, bin_size)
-    histogram, edges = np.histogram(data, bins=bins)
-    threshold = max(histogram)/2
-    mean_annotation_y = threshold * 1.8
-    distance_threshold = range_vals // 20
-    peaks, _ = find_peaks(histogram, height=threshold, prominence=threshold, distance=distance_threshold)
+    from .construct_length import estimate_histogram_peak
+    from .render_histograms import save_plot_data, render_histogram_png
 
-    estimated_construct_length = (edges[peaks[-1]] + edges[peaks[-1] + 1]) / 2 # Use the peak calling to get the largest read length peak. If the sample is not over-tagmented in the library-prep, this is likely the plasmid size
+    bin_size = accumulator.bin_size
+    histogram, edges = accumulator.histogram()
+    # Use the peak calling to get the largest read length peak. If the sample is not over-tagmented in the library-prep, this is likely the plasmid size
+    # Read lengths are searched on log-spaced bins from the filter threshold up, quality scores on their own bins
+    estimate = estimate_histogram_peak(histogram, edges, lower=filter_threshold, log_bins=isinstance(bin_size, int))
+    estimated_construct_length = estimate.value
+    peaks = estimate.peaks
+    print(f"{label} peak: {estimate.value:.1f} ({estimate.method}, confidence {estimate.confidence:.2f})")
 
     txt_path = output_path / f"{label.lower().replace(' ', '_')}s.txt"
 
+    # Only occupied bins are written, in one vectorized call
+    occupied = np.flatnonzero(histogram)
+    rows = np.column_stack([np.round(edges[occupied], 1), np.round(edges[occupied + 1], 1), histogram[occupied]])
+    fmt = '%d\t%d\t%d' if isinstance(bin_size, int) else '%f\t%f\t%d'
     with open(txt_path, "w") as hist_file:
-        for i in range(len(histogram)):
-            start = round(edges[i], 1)
-            end = round(edges[i + 1], 1)
-            count = histogram[i]
-            if count > 0:
-                if type(bin_size) == int:
-                    hist_file.write(f"{int(start)}\t{int(end)}\t{count}\n")
-                elif type(bin_size) == float:
-                    hist_file.write(f"{start:1f}\t{end:1f}\t{count}\n")
+        np.savetxt(hist_file, rows, fmt=fmt)
     print(f"{label} histogram saved to: {txt_path}")
 
-    # Optionally save histogram as PNG
+    # Save the plot data so the PNG can be drawn later by render_histograms, off the filtering path
+    data_path = save_plot_data(output_path, label, accumulator, filter_threshold, n_passed, peaks)
     if save_png:
-        png_path = output_path / f"{label.lower().replace(' ', '_')}_histogram.png"
-        plt.figure(figsize=(10, 6))
-        plt.hist(data, bins=bins, color="blue", edgecolor="black", alpha=0.7)
-        plt.xlabel(label)
-        plt.ylabel("Frequency")
-
-        # Plot a vertical line for the filter_threshold
-        plt.axvline(filter_threshold, color='green', linestyle='solid', linewidth=1)
-        
-        # Annotate the threshold on the plot
-        plt.text(filter_threshold + 0.1, mean_annotation_y, 
-                f'Threshold: {filter_threshold:.1f}', color='green', fontsize=10)
-
-        mean_val = np.mean(data)
-        # Plot a vertical line for the mean
-        plt.axvline(mean_val, color='purple', linestyle='dashed', linewidth=0.5)
-        
-        # Annotate the mean on the plot
-        plt.text(mean_val + 0.1, mean_annotation_y, 
-                f'Mean: {mean_val:.1f}', color='purple', fontsize=10)
-    
-        # Annotate the peaks
-        for peak in peaks:
-            # Getting the x-coordinate of the peak (midpoint of the bin)
-            peak_x = (edges[peak] + edges[peak + 1]) / 2
-            peak_y = histogram[peak]
-            
-            # Annotating the peak on the plot (vertical dashed line)
-            plt.axvline(x=peak_x, color='red', linestyle='--', linewidth=0.5)
-            plt.annotate(f"Peak: {peak_x:.1f}", 
-                        xy=(peak_x, peak_y), 
-                        xytext=(peak_x + 0.2, peak_y + 0.05),  # Adjust annotation position
-                        fontsize=10, color='red')
-        plt.title(f"{label} Distribution from {n_data} total unfiltered reads: {n_passed} reads above threshold")
-        plt.grid(axis='y', alpha=0.75)
-        plt.tight_layout()
-        plt.savefig(png_path)
-        plt.close()
-        print(f"{label} histogram PNG saved to: {png_path}")
+        render_histogram_png(data_path)
     
     return estimated_construct_length
 
-def filter_fastq_and_generate_histograms(input_path, output_path, hist_dir, min_length, min_mean_quality, save_png):
+class ReadFilter:
+    """
+    Length and mean quality filter that collects QC histograms of every read it is shown.
+
+    The same filter is used whether reads come from a FASTQ on disk or from an upstream stage of a streaming pipeline.
+
+    Parameters:
+        min_length (int): Minimum read length to keep.
+        min_mean_quality (float): Minimum mean read Q-score to keep.
+    """
+    def __init__(self, min_length, min_mean_quality):
+        self.min_length = min_length
+        self.min_mean_quality = min_mean_quality
+        self.read_lengths = HistogramAccumulator(bin_size=1, max_bins=MAX_READ_LENGTH)
+        self.quality_scores = HistogramAccumulator(bin_size=0.1)
+        self.n_passed_length_threshold = 0
+        self.n_passed_quality_threshold = 0
+        self.n_passed = 0
+        self.passed_bases = 0
+
+    def filter(self, batch):
+        """
+        Record the lengths and mean qualities of a FastqBatch and return the indices of the reads that pass both thresholds.
+        """
+        return self.filter_reads(batch.lengths, calculate_batch_mean_quality(*batch.quality_array()))
+
+    def filter_reads(self, lengths, mean_qualities):
+        """
+        Record read lengths and mean qualities computed elsewhere and return the indices of the reads that pass both thresholds.
+        """
+        # Collect metrics for histogram
+        self.read_lengths.update(lengths)
+        self.quality_scores.update(mean_qualities)
+
+        passed_length = lengths >= self.min_length
+        passed_quality = mean_qualities >= self.min_mean_quality
+        self.n_passed_length_threshold += int(passed_length.sum())
+        self.n_passed_quality_threshold += int(passed_quality.sum())
+
+        passed = np.flatnonzero(passed_length & passed_quality)
+        self.n_passed += len(passed)
+        self.passed_bases += int(lengths[passed].sum())
+        return passed
+
+    def write_histograms(self, hist_dir, save_png=True, summary_root=None):
+        """
+        Write the read length and quality histograms to hist_dir.
+        If summary_root is given, their summary statistics are also recorded in the summary store there (see summary_store),
+        so extract_histogram_stats does not have to reload them.
+
+        Returns:
+            estimated_construct_length (int): Estimated construct length based on peak calling of read lengths
+        """
+        hist_dir = Path(hist_dir)
+        estimated_construct_length = write_histogram_to_file(self.read_lengths, hist_dir, "Read Length", self.min_length, self.n_passed_length_threshold, save_png)
+        write_histogram_to_file(self.quality_scores, hist_dir, "Quality Score", self.min_mean_quality, self.n_passed_quality_threshold, save_png)
+        if summary_root is not None:
+            from .summary_store import record_histograms
+            record_histograms(summary_root, hist_dir, {'read_lengths.txt': self.read_lengths, 'quality_scores.txt': self.quality_scores})
+        return estimated_construct_length
+
+def filter_fastq_and_generate_histograms(input_path, output_path, hist_dir, min_length, min_mean_quality, save_png, compresslevel=6, compress_threads=1,
+                                         write_index=False, compressor='auto', summary_root=None):
     """
     Filter reads in a FASTQ file and generate histogram data for read lengths and quality.
+    Plain and gzipped inputs are both accepted. If output_path ends in .gz the filtered reads are compressed as they are written.
+    If write_index is True, a read index (offset, length, mean quality, read id hash of every kept read) is saved next to the output.
+    Use compressor='bgzf' to keep random access by offset possible on a compressed output.
+    If summary_root is given, the histogram statistics are recorded in the summary store of that directory (see summary_store).
+    Timing, peak memory and read counts are recorded as a telemetry event, and the filter runs under cProfile if $PLASMID_SEQ_PROFILE_DIR is set (see telemetry).
 
     Returns:
         estimated_construct_length (int): Estimated construct length based on peak calling of read lengths
     """
-    read_lengths = []
-    quality_scores = []
-    n_passed_length_threshold = 0
-    n_passed_quality_threshold = 0
+    from .read_index import ReadIndexWriter
+    from .telemetry import stage_timer, profiled, path_bytes
 
-    with open(output_path, "w") as out_fq:
-        for header, sequence, separator, quality in parse_fastq(input_path):
-            read_length = len(sequence)
-            mean_quality = calculate_mean_quality(quality)
+    read_filter = ReadFilter(min_length, min_mean_quality)
+    index_writer = ReadIndexWriter(output_path) if write_index else None
+    sample_name = os.path.basename(str(input_path)).split('.fastq')[0]
 
-            # Collect metrics for histogram
-            read_lengths.append(read_length)
-            quality_scores.append(mean_quality)
+    if str(output_path).endswith('.gz'):
+        out_fq = open_compressed_output(output_path, compresslevel, compress_threads, compressor)
+    else:
+        out_fq = open(output_path, "wb")
 
-            if read_length >= min_length:
-                n_passed_length_threshold += 1
-            if mean_quality >= min_mean_quality:
-                n_passed_quality_threshold += 1
+    with stage_timer('filter', str(input_path)) as timer, profiled(f'filter_{sample_name}'):
+        with out_fq:
+            _filter_batches(input_path, out_fq, read_filter, index_writer)
 
-            # Apply filters
-            if read_length >= min_length and mean_quality >= min_mean_quality:
-                out_fq.write(f"{header}\n{sequence}\n{separator}\n{quality}\n")
+        if index_writer is not None:
+            index_writer.save(getattr(out_fq, 'virtual_offsets', None))
 
-    # Write histogram data to text files
-    estimated_construct_length = write_histogram_to_file(read_lengths, 1, hist_dir, "Read Length", min_length, n_passed_length_threshold, save_png)
-    best_quality_mode = write_histogram_to_file(quality_scores, 1, hist_dir, "Quality Score", min_mean_quality, n_passed_quality_threshold, save_png)
+        # Write histogram data to text files
+        estimated_construct_length = read_filter.write_histograms(hist_dir, save_png, summary_root)
 
+        timer.fields.update(n_reads=read_filter.read_lengths.n, n_passed=read_filter.n_passed, bases_passed=read_filter.passed_bases,
+                            bytes_read=path_bytes([input_path]), bytes_written=path_bytes([output_path]))
     return estimated_construct_length
 
-def process_directory(input_dir, output_dir='filtered_demuliplexed_fastqs', min_length=500, min_mean_quality=12, save_png=True):
+def _filter_batches(input_path, out_fq, read_filter, index_writer=None):
+    """Filtering hot path: parse, score, filter and write every batch of input_path. Kept as its own function so profilers report it by name."""
+    for batch in parse_fastq_batches(input_path):
+        batch_mean_qualities = calculate_batch_mean_quality(*batch.quality_array())
+        passed = read_filter.filter_reads(batch.lengths, batch_mean_qualities)
+        if len(passed):
+            out_fq.write(batch.records_bytes(passed))
+            if index_writer is not None:
+                index_writer.add(batch, passed, batch_mean_qualities)
+
+def _filter_fastq_job(job):
+    """
+    Run filter_fastq_and_generate_histograms for one FASTQ inside a worker process.
+
+    Everything the job prints is captured and returned, so the parent can print each file's log as one uninterrupted block.
     """
-    Recursively iterate over FASTQ files in a directory and process them.
+    import contextlib
+    import io
+
+    input_file, output_file, hist_dir, filter_args = job
+    log = io.StringIO()
+    with contextlib.redirect_stdout(log):
+        print(f"Processing: {input_file} -> {output_file}")
+        estimated_construct_length = filter_fastq_and_generate_histograms(input_file, output_file, hist_dir, *filter_args)
+    return estimated_construct_length, log.getvalue()
+
+def process_directory(input_dir, output_dir='filtered_demuliplexed_fastqs', min_length=500, min_mean_quality=12, save_png=True, compress=True, compresslevel=6, compress_threads=1, workers=1,
+                      write_index=True, bgzf=False):
+    """
+    Recursively iterate over FASTQ files (.fastq or .fastq.gz) in a directory and process them.
+
+    Params:
+        input_dir (str): Path to the directory of demultiplexed FASTQs.
+        output_dir (str): Name of the output directory, created next to input_dir.
+        min_length (int): Minimum read length to keep.
+        min_mean_quality (float): Minimum mean read Q-score to keep.
+        save_png (bool): Whether to save histogram PNGs. They are rendered after every FASTQ has been filtered, using the same number of workers.
+        compress (bool): If True, filtered FASTQs are gzip compressed while they are written. If False, they are left uncompressed.
+        compresslevel (int): gzip compression level used when compress is True.
+        compress_threads (int): Compression threads per output. Values above 1 use pigz when it is installed.
+        workers (int): Number of FASTQs filtered concurrently in a process pool. 1 processes the files one after another in this process.
+        write_index (bool): If True, a read index (<fastq>.idx.npy, see read_index) is saved next to every filtered FASTQ.
+        bgzf (bool): If True and compress is True, filtered FASTQs are written as BGZF so indexed reads can be fetched by offset.
     
     Return:
         output_dir
         sample_fastq_to_read_length_mapping (dict): For each processed FASTQ, maps the estimated construct size from that FASTQ.
+            Entries are ordered by FASTQ path, independent of the number of workers.
     """
-    from .gzip_fastqs import gzip_fastqs
+    from concurrent.futures import ProcessPoolExecutor
     from .extract_histogram_stats import extract_histogram_stats
 
-
     input_dir = Path(input_dir)
     parent_dir = input_dir.parent
     output_dir = parent_dir / Path(output_dir)
     output_dir.mkdir(exist_ok=True)
 
-    sample_fastq_to_read_length_mapping = {}
+    # PNGs are rendered from the saved plot data once filtering is done, so the filtering jobs never load matplotlib
+    filter_args = (min_length, min_mean_quality, False, compresslevel, compress_threads, write_index, 'bgzf' if bgzf else 'auto', str(output_dir))
+    jobs = []
 
-    for root, _, files in os.walk(input_dir):
+    for root, dirs, files in os.walk(input_dir):
+        dirs.sort()
         rel_path = Path(root).relative_to(input_dir)
         output_subdir = output_dir / rel_path
         output_subdir.mkdir(parents=True, exist_ok=True)
 
-        for file in files:
-            if file.endswith(".fastq"):
+        for file in sorted(files):
+            if file.endswith(".fastq") or file.endswith(".fastq.gz"):
                 input_file = Path(root) / file
                 input_base_minus_suffix = file.split('.fastq')[0]
                 new_basename = input_base_minus_suffix + '_filtered.fastq'
+                if compress:
+                    new_basename += '.gz'
                 output_file = output_subdir / new_basename
-                hist_dir = output_subdir / "histograms"
-                hist_dir.mkdir(exist_ok=True)
+                hist_dir = histogram_dir(output_subdir, input_file)
+                hist_dir.mkdir(parents=True, exist_ok=True)
+                jobs.append((input_file, output_file, hist_dir, filter_args))
 
-                print(f"Processing: {input_file} -> {output_file}")
-                estimated_construct_length = filter_fastq_and_generate_histograms(input_file, output_file, hist_dir, min_length, min_mean_quality, save_png)
-                sample_fastq_to_read_length_mapping[output_file] = estimated_construct_length
+    sample_fastq_to_read_length_mapping = {}
+
+    if workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+            futures = [pool.submit(_filter_fastq_job, job) for job in jobs]
+            # Collect in submission order so logs and the mapping do not depend on which worker finishes first
+            for job, future in zip(jobs, futures):
+                estimated_construct_length, log = future.result()
+                print(log, end='')
+                sample_fastq_to_read_length_mapping[job[1]] = estimated_construct_length
+    else:
+        for input_file, output_file, hist_dir, _ in jobs:
+            print(f"Processing: {input_file} -> {output_file}")
+            estimated_construct_length = filter_fastq_and_generate_histograms(input_file, output_file, hist_dir, *filter_args)
+            sample_fastq_to_read_length_mapping[output_file] = estimated_construct_length
 
     extract_histogram_stats(output_dir)
-    gzip_fastqs(output_dir)
+    if save_png:
+        from .render_histograms import render_directory
+        render_directory(output_dir, workers)
 
     return output_dir, sample_fastq_to_read_length_mapping
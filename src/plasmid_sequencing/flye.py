@@ -1,9 +1,26 @@
 ## flye
-import subprocess
 import os
 from pathlib import Path
+from .scheduler import JobScheduler, run_command
 
-def flye(input, min_overlap=1000, nano_hq=0.02, nano_raw=False, output='0', output_dir=False):
+MAX_FLYE_THREADS = 8  # Plasmid-sized assemblies gain little from more threads, so spare cores go to running more replicates side by side
+
+def flye_threads(n_jobs, max_threads=None, max_threads_per_job=MAX_FLYE_THREADS):
+    """
+    Threads per Flye job so that n_jobs assemblies run side by side on max_threads cores.
+
+    Parameters:
+        n_jobs (int): Number of Flye jobs that can run at the same time, e.g. samples x replicates.
+        max_threads (int | None): Cores available. Defaults to the number of CPUs.
+        max_threads_per_job (int): Upper limit per job.
+
+    Returns:
+        threads (int): Threads per job, at least 1.
+    """
+    max_threads = max_threads or os.cpu_count() or 1
+    return max(1, min(max_threads_per_job, max_threads // max(1, n_jobs)))
+
+def flye(input, min_overlap=1000, nano_hq=0.02, nano_raw=False, output='0', output_dir=False, scheduler=None, cache=None, genome_size=None, threads=1, memory=None):
     """
     De novo genome assembly
     
@@ -14,16 +31,24 @@ def flye(input, min_overlap=1000, nano_hq=0.02, nano_raw=False, output='0', outp
         nano_raw (bool): --nano-raw. 
         output (str): -o specifies the output directory suffix.
         output_dir (bool | str): If False, just output subsample into the same directory as the input file. If a string is passed, pass it into that output directory.
+        scheduler (JobScheduler | None): If given, the assembly is queued on it and this call returns without waiting for flye to finish.
+        cache (ResultCache | None): If given, the assembly is restored from this content-addressed cache when the same inputs, tool version and arguments were run before.
+        genome_size (str | int | None): --genome-size hint, e.g. the estimated construct length in bases.
+        threads (int): --threads given to flye, and reserved on the scheduler.
+        memory (str | int | None): Memory reserved on the scheduler while flye runs, e.g. '4G'. Flye itself has no memory limit.
 
     Return:
         output_path (str): Path to the output flye directory
     """
 
-    command_list = ['flye']
+    command_list = ['flye', '--threads', str(threads)]
     read_error_list = []
     
     if min_overlap:
         command_list += ['--min-overlap', str(min_overlap)]
+
+    if genome_size:
+        command_list += ['--genome-size', str(genome_size)]
         
     if nano_hq:
         command_list += ['--nano-hq']
@@ -41,14 +66,11 @@ def flye(input, min_overlap=1000, nano_hq=0.02, nano_raw=False, output='0', outp
 
     command_list += [str(input)] + read_error_list + output_list
 
-    command_string = " ".join(command_list)
-    print(f"Running {command_string}")
-
-    subprocess.run(command_list)
+    run_command(command_list, threads=threads, scheduler=scheduler, name=f'flye {output_path}', outputs=[output_path], cache=cache, inputs=[input], memory=memory)
 
     return output_path
 
-def recursive_flye(input_dir, output_dir='subsampled_flye_assemblies', min_overlap=1000, nano_hq=0.02, nano_raw=False):
+def recursive_flye(input_dir, output_dir='subsampled_flye_assemblies', min_overlap=1000, nano_hq=0.02, nano_raw=False, scheduler=None, cache=None, threads=None, memory=None):
     """
     Recursively search a directory for all fastq files. Produce a de novo assembly for every FASTQ.
 
@@ -59,6 +81,10 @@ def recursive_flye(input_dir, output_dir='subsampled_flye_assemblies', min_overl
         nano_raw (bool): --nano-raw. 
         output (str): -o specifies the output directory suffix.
         output_dir (bool | str): If False, just output subsample into the same directory as the input file. If a string is passed, pass it into that output directory.
+        scheduler (JobScheduler | None): Scheduler to run the assemblies on. If None, a scheduler using every CPU is created.
+        cache (ResultCache | None): Content-addressed cache passed to every job.
+        threads (int | None): Threads per assembly. If None, the scheduler's threads are split over the assemblies (see flye_threads).
+        memory (str | int | None): Memory reserved on the scheduler by every assembly.
 
     Returns:
         output_dir (str): String representing the root directory that outputs will be stored in.
@@ -70,7 +96,9 @@ def recursive_flye(input_dir, output_dir='subsampled_flye_assemblies', min_overl
     output_dir.mkdir(exist_ok=True)
 
     output_file_list = []
+    scheduler = scheduler or JobScheduler()
 
+    jobs = []
     for root, _, files in os.walk(input_dir):
         rel_path = Path(root).relative_to(input_dir)
         output_subdir = output_dir / rel_path
@@ -81,7 +109,15 @@ def recursive_flye(input_dir, output_dir='subsampled_flye_assemblies', min_overl
                 input_file = Path(root) / file
                 flye_iteration = file.split('subsample_')[1]
                 flye_iteration = flye_iteration.split('.fastq')[0]
-                output_file = flye(input_file, min_overlap, nano_hq, nano_raw, output=flye_iteration, output_dir=output_subdir)
-                output_file_list.append(output_file)
+                jobs.append((input_file, flye_iteration, output_subdir))
+
+    threads = threads or flye_threads(len(jobs), scheduler.max_threads)
+    with scheduler.batch() as batch:
+        for input_file, flye_iteration, output_subdir in jobs:
+            output_file = flye(input_file, min_overlap, nano_hq, nano_raw, output=flye_iteration, output_dir=output_subdir, scheduler=scheduler, cache=cache,
+                               threads=threads, memory=memory)
+            output_file_list.append(output_file)
+
+    batch.wait()
 
     return output_dir, output_file_list
\ No newline at end of file
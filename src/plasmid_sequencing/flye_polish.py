@@ -1,9 +1,9 @@
 ## flye
-import subprocess
 import os
 from pathlib import Path
+from .scheduler import JobScheduler, run_command
 
-def flye_polish(input, draft, nano_hq=0.02, nano_raw=False, output='0', output_dir=False):
+def flye_polish(input, draft, nano_hq=0.02, nano_raw=False, output='0', output_dir=False, scheduler=None, cache=None, threads=1, memory=None):
     """
     De novo genome assembly
     
@@ -14,12 +14,16 @@ def flye_polish(input, draft, nano_hq=0.02, nano_raw=False, output='0', output_d
         nano_raw (bool): --nano-raw. 
         output (str): -o specifies the output directory suffix.
         output_dir (bool | str): If False, just output subsample into the same directory as the input file. If a string is passed, pass it into that output directory.
+        scheduler (JobScheduler | None): If given, the polishing job is queued on it and this call returns without waiting for flye to finish.
+        cache (ResultCache | None): If given, the polished assembly is restored from this content-addressed cache when the same inputs, tool version and arguments were run before.
+        threads (int): --threads given to flye, and reserved on the scheduler.
+        memory (str | int | None): Memory reserved on the scheduler while flye runs, e.g. '4G'.
 
     Return:
         output_path (str): Path to the output flye directory
     """
 
-    command_list = ['flye', '--polish-target', draft]
+    command_list = ['flye', '--threads', str(threads), '--polish-target', draft]
     read_error_list = []
         
     if nano_hq:
@@ -38,24 +42,79 @@ def flye_polish(input, draft, nano_hq=0.02, nano_raw=False, output='0', output_d
 
     command_list += [str(input)] + read_error_list + output_list
 
-    command_string = " ".join(command_list)
-    print(f"Running {command_string}")
-
-    subprocess.run(command_list)
+    run_command(command_list, threads=threads, scheduler=scheduler, name=f'flye polish {output_path}', outputs=[output_path], cache=cache, inputs=[input, draft], memory=memory)
 
     return output_path
 
-def recursive_flye_polish(input_dir, output_dir):
+def flye_assemble_and_polish(input, reads, output='0', output_dir=False, min_overlap=1000, nano_hq=0.02, nano_raw=False, genome_size=None,
+                             threads=1, memory=None, scheduler=None, cache=None, polish_depth=None):
+    """
+    Assemble one subsampled replicate with flye and polish the assembly with the sample's reads as a single job.
+
+    Polishing starts the moment this replicate's assembly finishes, on the threads the assembly held, instead of waiting
+    for every other assembly as recursive_flye followed by recursive_flye_polish does.
+
+    Parameters:
+        input (str): Path to the subsampled FASTQ to assemble.
+        reads (str): Path to the FASTQ used for polishing, e.g. the sample's trimmed reads.
+        output (str): Replicate suffix of the flye_<output> and flye_<output>_polished directories.
+        output_dir (bool | str): Directory of the assembly. If False, next to the input.
+        min_overlap (bool | int): --min-overlap of the assembly.
+        nano_hq (bool | float): --nano-hq read error rate, see flye.
+        nano_raw (bool): --nano-raw.
+        genome_size (str | int | None): --genome-size hint of the assembly.
+        threads (int): --threads of both flye runs, reserved on the scheduler for the whole job.
+        memory (str | int | None): Memory reserved on the scheduler for the whole job.
+        scheduler (JobScheduler | None): If given, the job is queued on it and a Future is returned.
+        cache (ResultCache | None): Content-addressed cache of both flye runs.
+        polish_depth (int | float | None): If given, polish with the best reads up to this depth of the assembly length
+            (see polishing_reads.prepare_polishing_reads), built next to the assembly directory and shared with the sample's other replicates.
+
+    Returns:
+        (assembly_path, polished_path) (tuple of str): The flye output directories. polished_path is None if flye produced no assembly.
+            A Future resolving to the tuple if a scheduler is given.
+    """
+    from .flye import flye
+
+    def run():
+        assembly_path = flye(input, min_overlap, nano_hq, nano_raw, output=output, output_dir=output_dir, cache=cache, genome_size=genome_size, threads=threads)
+        draft = os.path.join(assembly_path, 'assembly.fasta')
+        if not os.path.exists(draft):
+            print(f"No assembly in {assembly_path}, not polishing")
+            return assembly_path, None
+        polishing_reads = reads
+        if polish_depth:
+            from .polishing_reads import prepare_polishing_reads
+            polishing_reads = prepare_polishing_reads(reads, [draft], os.path.dirname(assembly_path), polish_depth)
+        return assembly_path, flye_polish(polishing_reads, draft, nano_hq, nano_raw, output=output, cache=cache, threads=threads)
+
+    if scheduler is not None:
+        return scheduler.submit_call(run, threads=threads, name=f'flye assemble and polish {input}', memory=memory)
+    return run()
+
+def recursive_flye_polish(input_dir, output_dir, scheduler=None, cache=None, threads=None, memory=None, polish_depth=None):
     """
     Recursively search a directory for all assemblies. Polish all assemblies
 
     Parameters:
         input_dir (str): Path to the directory containing the trimmed sample FASTQ.
         output_dir (str): Path to root directory of the flye outputs
+        scheduler (JobScheduler | None): Scheduler to run the polishing jobs on. If None, a scheduler using every CPU is created.
+        cache (ResultCache | None): Content-addressed cache passed to every job.
+        threads (int | None): Threads per polishing job. If None, the scheduler's threads are split over the jobs (see flye.flye_threads).
+        memory (str | int | None): Memory reserved on the scheduler by every polishing job.
+        polish_depth (int | float | None): If given, each sample is polished with its best reads up to this depth of the assembly length
+            (see polishing_reads.prepare_polishing_reads), selected once and shared by all its assemblies.
 
     Returns:
-        None
+        results (list of JobResult): Exit code, wall time and output directory of every polishing job.
     """
+    from .flye import flye_threads
+    from .polishing_reads import prepare_polishing_reads
+
+    scheduler = scheduler or JobScheduler()
+    jobs = []
+
     for sample_id in os.listdir(input_dir):
         sample_dir_a = os.path.join(input_dir, sample_id)
         sample_dir_b = os.path.join(output_dir, sample_id)
@@ -72,6 +131,7 @@ def recursive_flye_polish(input_dir, output_dir):
         fastq_file = os.path.join(sample_dir_a, fastq_files[0])
         print(f"Found FASTQ file: {fastq_file}")
         
+        sample_jobs = []
         # Iterate through subdirectories of the output_dir
         for sub_dir in os.listdir(sample_dir_b):
             if 'flye' in sub_dir:
@@ -89,9 +149,65 @@ def recursive_flye_polish(input_dir, output_dir):
 
                 i = sub_dir.split('_')[1]
                 
-                # Run polishing operation
-                try:
-                    flye_polish(fastq_file, fasta_file, output=i)
-                except subprocess.CalledProcessError as e:
-                    print(f"Error during polishing: {e}")
-                    continue
\ No newline at end of file
+                sample_jobs.append((fastq_file, fasta_file, i))
+
+        if polish_depth and sample_jobs:
+            fastq_file = prepare_polishing_reads(fastq_file, [job[1] for job in sample_jobs], sample_dir_b, polish_depth)
+            sample_jobs = [(fastq_file, fasta_file, i) for _, fasta_file, i in sample_jobs]
+        jobs.extend(sample_jobs)
+
+    # Queue polishing operations
+    threads = threads or flye_threads(len(jobs), scheduler.max_threads)
+    with scheduler.batch() as batch:
+        for fastq_file, fasta_file, i in jobs:
+            flye_polish(fastq_file, fasta_file, output=i, scheduler=scheduler, cache=cache, threads=threads, memory=memory)
+    return batch.wait()
+
+def recursive_flye_and_polish(input_dir, reads_dir, output_dir='subsampled_flye_assemblies', min_overlap=1000, nano_hq=0.02, nano_raw=False,
+                              threads=None, memory=None, scheduler=None, cache=None, polish_depth=None):
+    """
+    Recursively assemble and polish every subsampled replicate, each as one flye_assemble_and_polish job.
+
+    Parameters:
+        input_dir (str): Directory of the subsampled FASTQs (<sample>/<name>_subsample_<i>.fastq).
+        reads_dir (str): Directory holding the trimmed reads of every sample (<sample>/<name>_porechopped.fastq[.gz]) used for polishing.
+        output_dir (str): Name of the assembly directory, created next to input_dir.
+        min_overlap (bool | int): --min-overlap of the assemblies.
+        nano_hq (bool | float): --nano-hq read error rate.
+        nano_raw (bool): --nano-raw.
+        threads (int | None): Threads per replicate. If None, the scheduler's threads are split over the replicates (see flye.flye_threads).
+        memory (str | int | None): Memory reserved on the scheduler by every replicate.
+        scheduler (JobScheduler | None): Scheduler to run the jobs on. If None, a scheduler using every CPU is created.
+        cache (ResultCache | None): Content-addressed cache passed to every flye run.
+        polish_depth (int | float | None): If given, polish with each sample's best reads up to this depth of the assembly length.
+
+    Returns:
+        results (list of tuple): (assembly_path, polished_path) of every replicate, in sorted input order.
+    """
+    from .flye import flye_threads
+
+    input_dir = Path(input_dir)
+    output_dir = input_dir.parent / Path(output_dir)
+    scheduler = scheduler or JobScheduler()
+
+    jobs = []
+    for root, dirs, files in os.walk(input_dir):
+        dirs.sort()
+        rel_path = Path(root).relative_to(input_dir)
+        sample_reads_dir = Path(reads_dir) / rel_path
+        reads = sorted(file for file in os.listdir(sample_reads_dir) if '.fastq' in file and 'porechop' in file) if sample_reads_dir.is_dir() else []
+        for file in sorted(files):
+            if 'subsample_' not in file or not (file.endswith(".fastq") or file.endswith(".fastq.gz")):
+                continue
+            if not reads:
+                print(f"No trimmed FASTQ found in {sample_reads_dir}")
+                break
+            (output_dir / rel_path).mkdir(parents=True, exist_ok=True)
+            iteration = file.split('subsample_')[1].split('.fastq')[0]
+            jobs.append((Path(root) / file, sample_reads_dir / reads[0], iteration, output_dir / rel_path))
+
+    threads = threads or flye_threads(len(jobs), scheduler.max_threads)
+    futures = [flye_assemble_and_polish(str(input_file), str(reads), iteration, str(output_subdir), min_overlap, nano_hq, nano_raw,
+                                        threads=threads, memory=memory, scheduler=scheduler, cache=cache, polish_depth=polish_depth)
+               for input_file, reads, iteration, output_subdir in jobs]
+    return [future.result() for future in futures]
@@ -1,6 +1,223 @@
 ## full_plasmid_workflow
+import functools
+import os
+from pathlib import Path
 
-def full_plasmid_workflow(input_bam):
+def _require_outputs(paths, step):
+    """Raise if an external tool exited without producing its expected outputs."""
+    missing = [str(path) for path in paths if not os.path.exists(path)]
+    if missing:
+        raise RuntimeError(f"{step} did not produce: {', '.join(missing)}")
+
+def _demux_task(input_bam):
+    from .demux import demux
+
+    demultiplexed_fastq_dir = demux(input_bam, barcode_kit='SQK-RBK114-96', split_dir='demultiplexed_fastqs', emit_fastq=True)
+    _require_outputs([demultiplexed_fastq_dir], 'dorado demux')
+    return demultiplexed_fastq_dir
+
+def _bam_demux_task(input_bam, threads=1):
+    from .bam_demux import bam_demux
+
+    demultiplexed_fastq_dir, _ = bam_demux(input_bam, split_dir='demultiplexed_fastqs', threads=threads)
+    return demultiplexed_fastq_dir
+
+def _filter_task(input_file, output_file, min_length, min_mean_quality, summary_root=None):
+    import numpy as np
+    from .filter_fastqs import filter_fastq_and_generate_histograms, histogram_dir
+    from .read_index import load_read_index
+
+    hist_dir = histogram_dir(Path(output_file).parent, input_file)
+    hist_dir.mkdir(parents=True, exist_ok=True)
+    print(f"Processing: {input_file} -> {output_file}")
+    estimated_construct_length = filter_fastq_and_generate_histograms(input_file, output_file, hist_dir, min_length, min_mean_quality, False, write_index=True,
+                                                                      summary_root=summary_root)
+    lengths = load_read_index(output_file)['length']
+    # Only the histogram data files are returned: the PNGs rendered into hist_dir later must not change the inputs of dependent tasks
+    histograms = [str(hist_dir / name) for name in ('read_lengths.txt', 'quality_scores.txt')]
+    return {'fastq': str(output_file), 'histograms': histograms, 'estimated_construct_length': float(estimated_construct_length),
+            'n_reads': len(lengths), 'n_bases': int(lengths.sum(dtype=np.int64))}
+
+def _histogram_stats_task(*filter_results_and_root):
+    from .extract_histogram_stats import extract_histogram_stats
+
+    filtered_root = filter_results_and_root[-1]
+    extract_histogram_stats(filtered_root)
+    return os.path.join(filtered_root, "read_summary_statistics.txt")
+
+def _render_task(*filter_results_and_root, workers=1):
+    from .render_histograms import render_directory
+
+    return render_directory(filter_results_and_root[-1], workers)
+
+def _trim_task(filter_result, threads):
+    from .porechop import porechop
+
+    output_paths = porechop(filter_result['fastq'], recurse=False, output_suffix='porechopped', extra_end_trim=2, discard_middle=True, threads=threads)
+    _require_outputs(output_paths, 'porechop')
+    return output_paths[0]
+
+def _sample_genome_size(filter_result, genome_size):
+    """Use the construct length estimated while filtering, falling back to the fixed genome size if there was no estimate."""
+    estimated_construct_length = filter_result['estimated_construct_length']
+    return estimated_construct_length if estimated_construct_length > 0 else genome_size
+
+def _plan_sample(filter_result, coverage, genome_size, iterations, min_depth):
+    """Adapt coverage and replicate count to the depth of the filtered reads. min_depth None keeps them as given."""
+    import numpy as np
+    from .subsample import plan_subsampling
+
+    if min_depth is None:
+        return coverage, iterations
+    n_bases = filter_result.get('n_bases')
+    if n_bases is None:
+        # Filter results recorded by an older run do not carry the base count, but the read index has it
+        from .read_index import load_read_index
+        n_bases = int(load_read_index(filter_result['fastq'])['length'].sum(dtype=np.int64))
+    plan = plan_subsampling(n_bases, genome_size, coverage, iterations, min_depth)
+    print(f"{filter_result['fastq']}: {plan['depth']:.1f}x depth, {plan['iterations']} replicates at {plan['coverage']:.1f}x")
+    return plan['coverage'], plan['iterations']
+
+def _subsample_task(trimmed_fastq, filter_result, output_subdir, coverage, genome_size, iterations, min_depth, cache=None):
+    from .rasusa import rasusa
+    from .subsample import parse_genome_size
+
+    genome_size = _sample_genome_size(filter_result, genome_size)
+    coverage, iterations = _plan_sample(filter_result, coverage, genome_size, iterations, min_depth)
+    os.makedirs(output_subdir, exist_ok=True)
+    output_file_list = rasusa(trimmed_fastq, coverage, f'{parse_genome_size(genome_size):.0f}b', iterations, output_subdir, cache=cache)
+    _require_outputs(output_file_list, 'rasusa')
+    return output_file_list
+
+def _builtin_subsample_task(trimmed_fastq, filter_result, output_subdir, coverage, genome_size, iterations, min_depth):
+    from .subsample import subsample_fastq
+
+    genome_size = _sample_genome_size(filter_result, genome_size)
+    coverage, iterations = _plan_sample(filter_result, coverage, genome_size, iterations, min_depth)
+    os.makedirs(output_subdir, exist_ok=True)
+    return subsample_fastq(trimmed_fastq, coverage, genome_size, iterations, output_subdir)
+
+def _stream_task(input_file, output_subdir, hist_dir, trimmed_output, coverage, genome_size, iterations, porechop_threads, tmpdir, min_depth, summary_root=None):
+    from .streaming_pipeline import stream_filter_trim_subsample
+
+    os.makedirs(output_subdir, exist_ok=True)
+    result = stream_filter_trim_subsample(input_file, output_subdir, hist_dir, 500, 12, coverage, None, iterations, porechop_threads,
+                                          trimmed_output=trimmed_output, tmpdir=tmpdir, save_png=False, min_depth=min_depth,
+                                          summary_root=summary_root, default_genome_size=genome_size)
+    _require_outputs(result['subsamples'] + [path for path in [result['trimmed']] if path], 'streaming filter/trim/subsample')
+    return result
+
+def _assemble_task(subsample_list, filter_result, iteration, output_subdir, min_overlap, nano_hq, nano_raw, threads=1, cache=None):
+    from .flye import flye
+    from .workflow_engine import TaskSkipped
+
+    if iteration >= len(subsample_list):
+        raise TaskSkipped(f"the sample has {len(subsample_list)} subsampled replicates")
+    # Flye's genome size hint is the construct length estimated while filtering
+    estimated_construct_length = filter_result['estimated_construct_length']
+    genome_size = int(round(estimated_construct_length)) if estimated_construct_length > 0 else None
+    os.makedirs(output_subdir, exist_ok=True)
+    output_path = flye(subsample_list[iteration], min_overlap, nano_hq, nano_raw, output=str(iteration), output_dir=output_subdir, cache=cache, genome_size=genome_size,
+                       threads=threads)
+    assembly = os.path.join(output_path, 'assembly.fasta')
+    _require_outputs([assembly], 'flye')
+    return assembly
+
+def _polishing_reads_task(trimmed_fastq, *assemblies_and_args):
+    from .polishing_reads import prepare_polishing_reads
+
+    sample_dir, polish_depth = assemblies_and_args[-2:]
+    if not polish_depth:
+        return trimmed_fastq
+    # Replicates that were skipped are left out. Every replicate that was assembled has finished, so the set does not depend on task timing
+    assemblies = [assembly for assembly in assemblies_and_args[:-2] if assembly]
+    return prepare_polishing_reads(trimmed_fastq, assemblies, sample_dir, polish_depth)
+
+def _stream_polishing_reads_task(stream_result, *args):
+    from .workflow_engine import TaskSkipped
+
+    if not stream_result['trimmed']:
+        raise TaskSkipped("the sample has no trimmed reads")
+    return _polishing_reads_task(stream_result['trimmed'], *args)
+
+def _polish_task(polishing_fastq, assembly, iteration, threads=1, cache=None):
+    from .flye_polish import flye_polish
+
+    output_path = flye_polish(polishing_fastq, assembly, output=str(iteration), cache=cache, threads=threads)
+    polished_assembly = os.path.join(output_path, 'polished_1.fasta')
+    _require_outputs([output_path], 'flye polish')
+    return polished_assembly if os.path.exists(polished_assembly) else output_path
+
+def _agreement_task(*assemblies_and_args):
+    from .assembly_agreement import AGREEMENT_FASTA, DEFAULT_MIN_IDENTITY, compare_assemblies, write_fasta
+    from .polishing_reads import assembly_length
+    from .workflow_engine import TaskSkipped
+
+    sample_dir, min_identity = assemblies_and_args[-2:]
+    # Replicates that were skipped or produced an empty assembly are left out
+    replicates = [(iteration, assembly) for iteration, assembly in enumerate(assemblies_and_args[:-2]) if assembly and assembly_length(assembly) > 0]
+    if len(replicates) < 2:
+        raise TaskSkipped(f"a consensus needs at least 2 replicate assemblies, the sample has {len(replicates)}")
+    agreement = compare_assemblies([assembly for _, assembly in replicates], min_identity=min_identity or DEFAULT_MIN_IDENTITY)
+    agree = agreement.agree and min_identity is not None
+    output_path = os.path.join(sample_dir, AGREEMENT_FASTA)
+    if agree:
+        write_fasta(agreement.contigs, output_path)
+    elif os.path.exists(output_path):
+        os.remove(output_path)
+    print(f"{sample_dir}: {len(replicates)} replicates {'agree' if agreement.agree else 'differ'}, k-mer identity {agreement.identity:.5f}, contigs {agreement.n_contigs}"
+          + ('' if min_identity is not None else ' (not used, the agreement check is off)'))
+    return {'agree': agree, 'identical': agreement.identical, 'identity': agreement.identity, 'n_contigs': agreement.n_contigs,
+            'representative': replicates[0][0], 'assemblies': [assembly for _, assembly in replicates], 'assembly': output_path if agree else None}
+
+def _consensus_task(polishing_fastq, agreement, output_dir, threads=1, scheduler=None):
+    import shutil
+    from .trycycler import CONSENSUS_FASTA, trycycler_sample
+
+    if agreement['agree']:
+        # The replicates already agree, so the first one, rotated and oriented onto its anchor, is the consensus
+        os.makedirs(output_dir, exist_ok=True)
+        consensus = os.path.join(output_dir, CONSENSUS_FASTA)
+        shutil.copyfile(agreement['assembly'], consensus)
+        print(f"Replicates agree, skipping Trycycler: {consensus}")
+        return consensus
+    # Trycycler aligns every read several times over, so it gets the depth-capped read set shared with polishing
+    consensus = trycycler_sample(agreement['assemblies'], polishing_fastq, output_dir, threads, scheduler=scheduler, priority=3)
+    _require_outputs([consensus], 'trycycler')
+    return consensus
+
+def _replicate_polish_task(polishing_fastq, assembly, agreement, iteration, threads=1, cache=None):
+    from .workflow_engine import TaskSkipped
+
+    if agreement['agree'] and int(iteration) != agreement['representative']:
+        raise TaskSkipped(f"the replicates agree, so only replicate {agreement['representative']} is polished")
+    return _polish_task(polishing_fastq, assembly, iteration, threads=threads, cache=cache)
+
+def _stream_assemble_task(stream_result, *args, threads=1, cache=None):
+    return _assemble_task(stream_result['subsamples'], stream_result, *args, threads=threads, cache=cache)
+
+def _find_fastqs(input_dir):
+    """Return (input FASTQ, path relative to input_dir) for every FASTQ under input_dir, in sorted order."""
+    fastqs = []
+    for root, dirs, files in os.walk(input_dir):
+        dirs.sort()
+        for file in sorted(files):
+            if file.endswith(".fastq") or file.endswith(".fastq.gz"):
+                input_file = Path(root) / file
+                fastqs.append((input_file, input_file.relative_to(input_dir)))
+    return fastqs
+
+def _write_telemetry_summary():
+    """Write the per-stage summary of the current telemetry file, if telemetry is on and anything was recorded."""
+    from .telemetry import telemetry_path, write_summary
+
+    events_path = telemetry_path()
+    if events_path is not None and os.path.exists(events_path):
+        write_summary(events_path)
+
+def full_plasmid_workflow(input_bam, max_threads=None, max_jobs=None, resume=True, manifest_path=None, iterations=3, porechop_threads=4, cache_dir=None, cache_max_size='100G', subsampler='rasusa', streaming=False, tmpdir=None, demultiplexer='dorado',
+                          coverage=200, genome_size='10kb', min_depth=20, render_png=True, telemetry=True, flye_threads=None, max_memory=None, flye_memory=None, polish_depth=100,
+                          consensus=True, agreement_identity=1.0):
     """
     De novo genome assembly. Starts from a single basecalled BAM.
     Steps:
@@ -8,41 +225,189 @@ def full_plasmid_workflow(input_bam):
     2) demultiplexed FASTQs -> filtered, demultiplexed FASTQs (Filtered on read quality and read length metrics).
     3) Filtered, demultiplexed FASTQs -> Trimmed, filtered, demultiplexed FASTQs. (Porechop removal of adapters).
     4) Subsample in triplicate the trimmed, filtered, demultiplexed FASTQs. (Rasusa).
+       Each sample is subsampled to the requested coverage of its own estimated construct length, and shallow samples get fewer replicates or are skipped.
     5) De novo assembly of subsampled replicates for each sample. (Flye).
     6) Generate a consensus assembly from the Flye replicates for each sample. (Trycycler).
-    7) Polish the consensus assembly to deal with indels in the assembly.
+       Clusters of each sample are reconciled, aligned and their consensus built concurrently, without manual curation (see trycycler.trycycler_sample).
+       Replicates are first compared in process (see assembly_agreement). If they already agree, the first replicate is the consensus.
+    7) Polish the consensus assembly to deal with indels in the assembly. Each Flye replicate is polished as well, or only the first if the replicates agree.
     8) Align reads to the polished assembly. Generate coverage statistics.
-    
+
+    After demultiplexing, every sample runs through its own chain of tasks, so one sample can be assembling while another is still being trimmed.
+    Later stages take priority over earlier ones when threads free up, so a replicate is polished as soon as its own assembly is done.
+    Completed tasks are recorded in a manifest keyed by the content of their inputs and their parameters.
+    Rerunning the workflow skips finished tasks and only runs what failed, changed or was never reached.
+
     Parameters:
         input_bam (str): Path to the input BAM file.
+        max_threads (int | None): CPU budget shared by all external tools. Defaults to the number of CPUs.
+        max_jobs (int | None): Maximum number of external tools running at once.
+        resume (bool): If True, skip tasks the manifest records as complete with unchanged inputs.
+        manifest_path (str | None): Location of the task manifest. Defaults to workflow_manifest.json next to the input BAM.
+        iterations (int): Number of subsampled replicates assembled per sample.
+        porechop_threads (int): Threads given to each porechop job.
+        cache_dir (str | None): If given, subsampling, assembly and polishing outputs are cached here and restored on identical reruns.
+        cache_max_size (str | int): Size cap of the result cache, e.g. '100G'.
+        subsampler (str): 'rasusa' runs one rasusa process per replicate.
+            'builtin' writes every replicate in one pass over the trimmed reads, using each sample's estimated construct length as the genome size.
+        streaming (bool): If True, filtering, trimming and subsampling run as one streaming task per sample (see streaming_pipeline).
+            Only the trimmed reads, needed for polishing, and the subsamples are written to the output tree. The subsampler is always 'builtin'.
+        tmpdir (str | None): Scratch directory for the streaming mode's filtered reads. Defaults to $TMPDIR or /tmp.
+        demultiplexer (str): 'dorado' runs dorado demux. 'bam' splits the BAM in process on the barcode tags assigned during basecalling.
+        coverage (int | float): Target coverage of every subsampled replicate.
+        genome_size (str | int): Genome size used for samples whose construct length could not be estimated.
+        min_depth (int | float | None): Samples with less filtered depth than this are not assembled, and samples too shallow for distinct
+            replicates at the target coverage are subsampled at lower coverage or assembled once (see subsample.plan_subsampling).
+            None subsamples every sample at the target coverage with every replicate.
+        render_png (bool): If True, QC histogram PNGs are rendered in a separate task once every sample has been filtered.
+            If False, only their plot data is saved; render it later with python -m plasmid_sequencing.render_histograms.
+        telemetry (bool): If True, timing and resource use of every task and external tool are appended to telemetry.jsonl next to the input BAM,
+            unless PLASMID_SEQ_TELEMETRY already names a file, and a per-stage summary is written next to it when the workflow ends.
+            If False, nothing is recorded during the workflow. PLASMID_SEQ_TELEMETRY is left as it was before the call either way.
+        flye_threads (int | None): Threads of every flye assembly and polishing job. If None, max_threads is split over all replicates (see flye.flye_threads).
+        max_memory (str | int | None): Memory budget of all jobs running at once, e.g. '64G'. None does not budget memory.
+        flye_memory (str | int | None): Memory reserved by every flye job against max_memory, e.g. '8G'.
+        polish_depth (int | float | None): Assemblies are polished with the sample's best trimmed reads up to this depth of the assembly length
+            (see polishing_reads), built once per sample after all its replicates are assembled, and shared by its replicates and Trycycler. None polishes with every trimmed read.
+        consensus (bool): If True, a Trycycler consensus is built from the Flye replicates of every sample with at least 2 assemblies,
+            in the trycycler directory next to them.
+        agreement_identity (float | None): Replicates whose contigs all match at this k-mer identity agree, and skip Trycycler and the polishing
+            of all but the first replicate. 1.0 requires identical sequences after rotation and orientation. None never skips.
 
+    Returns:
+        results (dict): Maps each completed task name to its result.
+        failed (dict): Maps each failed or skipped task name to the reason.
     """
-    from .demux import demux
-    from .filter_fastqs import process_directory
-    from .porechop import porechop
-    from .rasusa import recursive_rasusa
-    from .flye import recursive_flye
-    from .flye_polish import recursive_flye_polish
+    from .filter_fastqs import histogram_dir
+    from .result_cache import ResultCache
+    from .scheduler import JobScheduler
+    from .telemetry import telemetry_path, telemetry_to
+    from .workflow_engine import Task, WorkflowEngine
 
-    # 1) Demultiplex the input BAM file.
-    demultiplexed_fastq_dir = demux(input_bam, barcode_kit='SQK-RBK114-96', split_dir='demultiplexed_fastqs', emit_fastq=True)
+    if subsampler not in ('rasusa', 'builtin'):
+        raise ValueError(f"Unknown subsampler: {subsampler}")
+    if demultiplexer not in ('dorado', 'bam'):
+        raise ValueError(f"Unknown demultiplexer: {demultiplexer}")
+
+    input_bam = os.path.abspath(input_bam)
+    root_dir = Path(input_bam).parent
+    manifest_path = manifest_path or root_dir / 'workflow_manifest.json'
+    # Telemetry goes to the events file of this call only, and PLASMID_SEQ_TELEMETRY is restored when the workflow ends
+    events_path = (telemetry_path() or root_dir / 'telemetry.jsonl') if telemetry else None
+    with telemetry_to(events_path):
+        scheduler = JobScheduler(max_threads, max_jobs, max_memory)
+        engine = WorkflowEngine(manifest_path, scheduler=scheduler, resume=resume)
+        cache = ResultCache(cache_dir, cache_max_size) if cache_dir else None
+        subsample_task = functools.partial(_subsample_task, cache=cache)
+
+        # 1) Demultiplex the input BAM file.
+        if demultiplexer == 'bam':
+            bam_demux_task = functools.partial(_bam_demux_task, threads=scheduler.max_threads)
+            engine.run([Task('demux', bam_demux_task, args=(input_bam,), inputs=[input_bam], threads=scheduler.max_threads)])
+        else:
+            engine.run([Task('demux', _demux_task, args=(input_bam,), inputs=[input_bam])])
+        if 'demux' not in engine.results:
+            _write_telemetry_summary()
+            return engine.results, engine.failed
+        demultiplexed_fastq_dir = Path(engine.results['demux'])
+
+        filtered_root = root_dir / 'filtered_demuliplexed_fastqs'
+        subsample_root = root_dir / 'subsampled_trimmed_filtered_demuliplexed_fastqs'
+        flye_root = root_dir / 'subsampled_flye_assemblies'
+
+        fastqs = _find_fastqs(demultiplexed_fastq_dir)
+        if flye_threads is None:
+            from .flye import flye_threads as plan_flye_threads
+            flye_threads = plan_flye_threads(len(fastqs) * iterations, scheduler.max_threads)
+        flye_options = {'threads': flye_threads, 'memory': flye_memory}
+        # Thread counts are bound to the task functions rather than passed as task args, so they are not part of the manifest keys
+        assemble_task = functools.partial(_assemble_task, threads=flye_threads, cache=cache)
+        polish_task = functools.partial(_polish_task, threads=flye_threads, cache=cache)
+        stream_assemble_task = functools.partial(_stream_assemble_task, threads=flye_threads, cache=cache)
+        replicate_polish_task = functools.partial(_replicate_polish_task, threads=flye_threads, cache=cache)
+        consensus_task = functools.partial(_consensus_task, threads=flye_threads, scheduler=scheduler)
+
+        tasks = []
+        filter_task_names = []
+        for input_file, rel_path in fastqs:
+            sample = str(rel_path).split('.fastq')[0]
+            output_file = filtered_root / rel_path.parent / (rel_path.name.split('.fastq')[0] + '_filtered.fastq.gz')
+            output_file.parent.mkdir(parents=True, exist_ok=True)
+
+            if streaming:
+                # 2-4) Filter, porechop and subsample in one pass, keeping the trimmed reads for polishing
+                hist_dir = str(histogram_dir(output_file.parent, input_file))
+                trimmed_output = str(output_file).replace('_filtered.fastq', '_filtered_porechopped.fastq')
+                tasks.append(Task(f'stream:{sample}', _stream_task, args=(str(input_file), str(subsample_root / rel_path.parent), hist_dir, trimmed_output, coverage, genome_size, iterations, porechop_threads, tmpdir, min_depth, str(filtered_root)),
+                                  inputs=[input_file], threads=porechop_threads))
+                filter_task_names.append(f'stream:{sample}')
+                tasks.append(Task(f'agreement:{sample}', _agreement_task, args=(str(flye_root / rel_path.parent), agreement_identity),
+                                  optional_deps=[f'assemble:{sample}:{iteration}' for iteration in range(iterations)], priority=3))
+                tasks.append(Task(f'polish_reads:{sample}', _stream_polishing_reads_task, args=(str(flye_root / rel_path.parent), polish_depth), deps=[f'stream:{sample}'],
+                                  optional_deps=[f'assemble:{sample}:{iteration}' for iteration in range(iterations)], priority=2))
+                for iteration in range(iterations):
+                    tasks.append(Task(f'assemble:{sample}:{iteration}', stream_assemble_task, args=(iteration, str(flye_root / rel_path.parent), 1000, False, 0.1),
+                                      deps=[f'stream:{sample}'], priority=1, **flye_options))
+                    if iteration == 0:
+                        tasks.append(Task(f'polish:{sample}:{iteration}', polish_task, args=(iteration,), deps=[f'polish_reads:{sample}', f'assemble:{sample}:{iteration}'],
+                                          priority=2, **flye_options))
+                    else:
+                        tasks.append(Task(f'polish:{sample}:{iteration}', replicate_polish_task, args=(iteration,),
+                                          deps=[f'polish_reads:{sample}', f'assemble:{sample}:{iteration}', f'agreement:{sample}'], priority=2, **flye_options))
+                if consensus:
+                    tasks.append(Task(f'consensus:{sample}', consensus_task, args=(str(flye_root / rel_path.parent / 'trycycler'),),
+                                      deps=[f'polish_reads:{sample}', f'agreement:{sample}'], priority=3))
+                continue
+
+            # 2) Filter the demultiplexed FASTQ on read quality and read length thresholds.
+            tasks.append(Task(f'filter:{sample}', _filter_task, args=(str(input_file), str(output_file), 500, 12, str(filtered_root)), inputs=[input_file]))
+            filter_task_names.append(f'filter:{sample}')
+
+            # 3) Porechop the filtered FASTQ
+            tasks.append(Task(f'trim:{sample}', _trim_task, args=(porechop_threads,), deps=[f'filter:{sample}'], threads=porechop_threads))
 
-    # 2) Filter the demultiplexed FASTQs on read quality and read length thresholds.
-    demultiplexed_filtered_fastq_dir, sample_to_read_mapping = process_directory(demultiplexed_fastq_dir, output_dir='filtered_demuliplexed_fastqs', min_length=500, min_mean_quality=12, save_png=True)
+            # 4) Rasusa the porechopped file to create subsamples
+            if subsampler == 'builtin':
+                tasks.append(Task(f'subsample:{sample}', _builtin_subsample_task, args=(str(subsample_root / rel_path.parent), coverage, genome_size, iterations, min_depth), deps=[f'trim:{sample}', f'filter:{sample}']))
+            else:
+                tasks.append(Task(f'subsample:{sample}', subsample_task, args=(str(subsample_root / rel_path.parent), coverage, genome_size, iterations, min_depth), deps=[f'trim:{sample}', f'filter:{sample}']))
 
-    # 3) Porechop the filtered_demultiplexed_fastqs
-    porechop(demultiplexed_filtered_fastq_dir, recurse=True, output_suffix='porechopped', extra_end_trim=2, discard_middle=True)
+            for iteration in range(iterations):
+                # 5) For each subsampled FASTQ, produce a de novo assembled scaffold using flye
+                tasks.append(Task(f'assemble:{sample}:{iteration}', assemble_task, args=(iteration, str(flye_root / rel_path.parent), 1000, False, 0.1),
+                                  deps=[f'subsample:{sample}', f'filter:{sample}'], priority=1, **flye_options))
 
-    #4) Rasusa the porechopped files to create subsamples
-    rasusa_root_dir, rasusa_sample_file_list = recursive_rasusa(demultiplexed_filtered_fastq_dir, output_dir='subsampled_trimmed_filtered_demuliplexed_fastqs', coverage=200, genome_size='10kb', iterations=3, search_string='porechop')
+                # 7) Polish the flye assembly using flye. Replicates after the first wait for the agreement check, as they are not polished if the replicates agree.
+                if iteration == 0:
+                    tasks.append(Task(f'polish:{sample}:{iteration}', polish_task, args=(iteration,), deps=[f'polish_reads:{sample}', f'assemble:{sample}:{iteration}'],
+                                      priority=2, **flye_options))
+                else:
+                    tasks.append(Task(f'polish:{sample}:{iteration}', replicate_polish_task, args=(iteration,),
+                                      deps=[f'polish_reads:{sample}', f'assemble:{sample}:{iteration}', f'agreement:{sample}'], priority=2, **flye_options))
 
-    #5) For each subsampled FASTQ, produce a de novo assembled scaffold using flye
-    flye_root_dir, flye_sample_list = recursive_flye(rasusa_root_dir, min_overlap=1000, nano_hq=False, nano_raw=0.1)
+            # The polishing read set is built once every replicate of the sample has been assembled or skipped, and shared by polishing and Trycycler
+            tasks.append(Task(f'polish_reads:{sample}', _polishing_reads_task, args=(str(flye_root / rel_path.parent), polish_depth), deps=[f'trim:{sample}'],
+                              optional_deps=[f'assemble:{sample}:{iteration}' for iteration in range(iterations)], priority=2))
 
-    #6) Polish all of the flye assemblies using flye.
-    recursive_flye_polish(demultiplexed_filtered_fastq_dir, flye_root_dir)
+            # 6) Compare the flye replicates in process, then build their consensus using Trycycler unless they already agree.
+            # The consensus task drives Trycycler's stages as scheduler jobs of their own.
+            tasks.append(Task(f'agreement:{sample}', _agreement_task, args=(str(flye_root / rel_path.parent), agreement_identity),
+                              optional_deps=[f'assemble:{sample}:{iteration}' for iteration in range(iterations)], priority=3))
+            if consensus:
+                tasks.append(Task(f'consensus:{sample}', consensus_task, args=(str(flye_root / rel_path.parent / 'trycycler'),),
+                                  deps=[f'polish_reads:{sample}', f'agreement:{sample}'], priority=3))
 
+        # Summarize the read histograms once every sample has been filtered
+        tasks.append(Task('histogram_stats', _histogram_stats_task, args=(str(filtered_root),), deps=filter_task_names))
+        if render_png:
+            render_workers = min(4, scheduler.max_threads)
+            render_task = functools.partial(_render_task, workers=render_workers)
+            tasks.append(Task('render_histograms', render_task, args=(str(filtered_root),), deps=filter_task_names, threads=render_workers))
 
+        engine.run(tasks)
 
+        if engine.failed:
+            print(f"{len(engine.failed)} tasks did not complete: {', '.join(sorted(engine.failed))}")
 
-    
+        _write_telemetry_summary()
+        return engine.results, engine.failed
@@ -1,30 +1,78 @@
 ## gzip_fastqs
 
-def gzip_fastqs(root_dir, delete_unzipped=True):
+def _gzip_file(file_path, delete_unzipped, compresslevel, threads, compressor):
+    """
+    Gzip one FASTQ file atomically: compress to <file>.gz.tmp, rename it to <file>.gz, then delete the original if requested.
+
+    An interrupted run therefore never leaves a truncated .gz next to a deleted original; at worst a .gz.tmp is left behind,
+    and it is overwritten on the next run.
+
+    Returns:
+        gzipped_file_path (str): Path of the compressed file.
+    """
+    import os
+    import shutil
+    from .fastq_io import open_compressed_output
+
+    gzipped_file_path = file_path + '.gz'
+    temp_path = gzipped_file_path + '.tmp'
+    try:
+        with open(file_path, 'rb') as f_in, open_compressed_output(temp_path, compresslevel, threads, compressor) as f_out:
+            shutil.copyfileobj(f_in, f_out, 1 << 20)
+        os.replace(temp_path, gzipped_file_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    # Optionally, delete the original FASTQ file after gzipping
+    if delete_unzipped:
+        os.remove(file_path)
+    return gzipped_file_path
+
+def gzip_fastqs(root_dir, delete_unzipped=True, compresslevel=9, workers=1, threads=1, compressor='auto'):
     """
     Gzip all FASTQ files within the specified directory and its subdirectories.
-    
-    param 
-        root_dir: The root directory to start searching for FASTQ files.
+
+    Files are compressed concurrently on a pool of workers threads, largest first. zlib releases the GIL while compressing,
+    so the workers run on separate cores. For a few large files, threads > 1 compresses each file in parallel blocks instead:
+    with pigz if it is on the PATH, otherwise as BGZF (see fastq_io.BgzfWriter), which every gzip reader accepts.
+    Every file is written to a temporary name and renamed when complete.
+
+    Parameters:
+        root_dir (str): The root directory to start searching for FASTQ files.
+        delete_unzipped (bool): Whether to delete each original FASTQ once its .gz is complete.
+        compresslevel (int): gzip compression level from 1 (fastest) to 9 (smallest). Defaults to 9, as gzip.open does; pass e.g. 6 for faster compression of slightly larger files.
+        workers (int): Number of files compressed at once.
+        threads (int): Compression threads per file.
+        compressor (str): 'auto', 'pigz', 'isal', 'gzip' or 'bgzf' (see fastq_io.open_compressed_output).
+
+    Returns:
+        gzipped_files (list of str): Paths of the compressed files.
     """
     import os
     import shutil
-    import gzip
+    from concurrent.futures import ThreadPoolExecutor
+
+    if compressor == 'auto' and threads > 1 and not shutil.which('pigz'):
+        compressor = 'bgzf'
+
     # Walk through the directory recursively
-    for dirpath, _, filenames in os.walk(root_dir):
-        for filename in filenames:
+    file_paths = []
+    for dirpath, dirnames, filenames in os.walk(root_dir):
+        dirnames.sort()
+        for filename in sorted(filenames):
             # Process only .fastq files
             if filename.endswith('.fastq'):
-                file_path = os.path.join(dirpath, filename)
-                gzipped_file_path = file_path + '.gz'
-                
-                # Open the original FASTQ file and the gzipped file
-                with open(file_path, 'rb') as f_in:
-                    with gzip.open(gzipped_file_path, 'wb') as f_out:
-                        shutil.copyfileobj(f_in, f_out)
-                
-                # Optionally, delete the original FASTQ file after gzipping
-                if delete_unzipped:
-                    os.remove(file_path)
-                
-                print(f"Compressed: {file_path} -> {gzipped_file_path}")
\ No newline at end of file
+                file_paths.append(os.path.join(dirpath, filename))
+    file_paths.sort(key=os.path.getsize, reverse=True)
+
+    def compress(file_path):
+        return _gzip_file(file_path, delete_unzipped, compresslevel, threads, compressor)
+
+    gzipped_files = []
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for file_path, gzipped_file_path in zip(file_paths, pool.map(compress, file_paths)):
+            print(f"Compressed: {file_path} -> {gzipped_file_path}")
+            gzipped_files.append(gzipped_file_path)
+    return gzipped_files
@@ -0,0 +1,88 @@
+## histograms
+import numpy as np
+
+MAX_READ_LENGTH = 100_000  # Read lengths at or above this share one overflow bin, so a few long chimeric reads do not grow the histogram
+
+class HistogramAccumulator:
+    """
+    Streaming histogram with fixed-width bins anchored at zero.
+
+    Memory depends on the range of observed values, not on how many values were added, and is bounded by max_bins if it is given.
+    Accumulators built from different chunks or worker processes can be combined with merge().
+
+    Attributes:
+        bin_size (int | float): Width of every bin. Bin i covers [i * bin_size, (i + 1) * bin_size).
+        max_bins (int | None): If given, values at or above max_bins * bin_size are counted in one overflow bin, bin max_bins.
+            n, total, min_value and max_value still cover their exact values.
+        counts (np.ndarray): int64 count of values in every bin from zero up to the largest value seen, or the overflow bin.
+        n (int): Number of values added.
+        total (float): Sum of the values added, used for the exact mean.
+        min_value (float): Smallest value added.
+        max_value (float): Largest value added.
+    """
+    def __init__(self, bin_size=1, max_bins=None):
+        self.bin_size = bin_size
+        self.max_bins = max_bins
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.n = 0
+        self.total = 0.0
+        self.min_value = np.inf
+        self.max_value = -np.inf
+
+    def _bin_indices(self, values):
+        # Round before flooring so that e.g. 12.3 / 0.1 = 122.99999999999999 lands in bin 123
+        return np.floor(np.round(values / self.bin_size, 6)).astype(np.int64)
+
+    def update(self, values):
+        """Add a batch of non-negative values to the histogram."""
+        values = np.asarray(values)
+        if values.size == 0:
+            return
+        indices = self._bin_indices(values)
+        if indices.min() < 0:
+            raise ValueError("HistogramAccumulator only accepts non-negative values")
+        if self.max_bins is not None:
+            indices = np.minimum(indices, self.max_bins)
+
+        batch_counts = np.bincount(indices)
+        if len(batch_counts) > len(self.counts):
+            self.counts = np.pad(self.counts, (0, len(batch_counts) - len(self.counts)))
+        self.counts[:len(batch_counts)] += batch_counts
+
+        self.n += values.size
+        self.total += float(values.sum())
+        self.min_value = min(self.min_value, values.min().item())
+        self.max_value = max(self.max_value, values.max().item())
+
+    def merge(self, other):
+        """Add the counts of another accumulator with the same bin size and max_bins into this one."""
+        if other.bin_size != self.bin_size:
+            raise ValueError(f"Cannot merge histograms with bin sizes {self.bin_size} and {other.bin_size}")
+        if other.max_bins != self.max_bins:
+            raise ValueError(f"Cannot merge histograms with max_bins {self.max_bins} and {other.max_bins}")
+        if len(other.counts) > len(self.counts):
+            self.counts = np.pad(self.counts, (0, len(other.counts) - len(self.counts)))
+        self.counts[:len(other.counts)] += other.counts
+        self.n += other.n
+        self.total += other.total
+        self.min_value = min(self.min_value, other.min_value)
+        self.max_value = max(self.max_value, other.max_value)
+        return self
+
+    @property
+    def mean(self):
+        return self.total / self.n if self.n else 0.0
+
+    def histogram(self):
+        """
+        Return the counts between the lowest and highest occupied bin.
+
+        Returns:
+            counts (np.ndarray): Counts of every bin from the lowest to the highest occupied bin, including empty bins in between.
+            edges (np.ndarray): Bin edges, one longer than counts.
+        """
+        if self.n == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(1)
+        first, last = np.flatnonzero(self.counts)[[0, -1]]
+        edges = np.arange(first, last + 2) * self.bin_size
+        return self.counts[first:last + 1], edges
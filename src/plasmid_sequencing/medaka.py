@@ -1,6 +1,7 @@
 ## medaka
+from .scheduler import JobScheduler, run_command
 
-def medaka(input, draft, output=0, threads=4):
+def medaka(input, draft, output=0, threads=4, scheduler=None, cache=None):
     """
     Assembly polishing
     
@@ -9,72 +10,85 @@ def medaka(input, draft, output=0, threads=4):
         draft (str): Path to the draft assembly to polish.
         output (int): An int to append to the medaka consensus output as a suffix.
         threads (int): Number of threads to allocate
+        scheduler (JobScheduler | None): If given, the polishing job is queued on it and this call returns without waiting for medaka to finish.
+        cache (ResultCache | None): If given, the consensus is restored from this content-addressed cache when the same inputs, tool version and arguments were run before.
 
     Return:
         output_path (str): Path to the output flye directory
     """
-    import subprocess
     import os
 
     parent_dir = os.path.dirname(draft)
     output_dir_basename = f'medaka_consensus_{output}'
     output_path = os.path.join(parent_dir, output_dir_basename)
 
-    command_list = ['medaka_consensus', '-i', input, '-d', draft, '-o', output_path, '-t', threads]
-    command_string = " ".join(command_list)
-    print(f'Running: {command_string}')
+    command_list = ['medaka_consensus', '-i', str(input), '-d', str(draft), '-o', output_path, '-t', str(threads)]
 
-    subprocess.run(command_list)
+    run_command(command_list, threads=threads, scheduler=scheduler, name=f'medaka {output_path}', outputs=[output_path], cache=cache, inputs=[input, draft])
 
-def recursive_medaka(input_dir, output_dir):
+    return output_path
+
+def recursive_medaka(input_dir, output_dir, threads=4, scheduler=None, cache=None, polish_depth=None):
     """
     Polish the de novo flye assemblies.
 
     Parameters:
         input_dir (str): Path to the directory containing the trimmed sample FASTQ.
         output_dir (str): Path to root directory of the flye outputs
+        threads (int): Number of threads to allocate to each medaka job.
+        scheduler (JobScheduler | None): Scheduler to run the polishing jobs on. If None, a scheduler using every CPU is created.
+        cache (ResultCache | None): Content-addressed cache passed to every job.
+        polish_depth (int | float | None): If given, each sample is polished with its best reads up to this depth of the assembly length
+            (see polishing_reads.prepare_polishing_reads), selected once and shared by all its assemblies.
 
     Returns:
-        None
+        results (list of JobResult): Exit code, wall time and output directory of every polishing job.
 
     """
     import os
-    import subprocess
+    from .polishing_reads import prepare_polishing_reads
+
+    scheduler = scheduler or JobScheduler()
 
-    for sample_id in os.listdir(input_dir):
-        sample_dir_a = os.path.join(input_dir, sample_id)
-        sample_dir_b = os.path.join(output_dir, sample_id)
+    with scheduler.batch() as batch:
+        for sample_id in os.listdir(input_dir):
+            sample_dir_a = os.path.join(input_dir, sample_id)
+            sample_dir_b = os.path.join(output_dir, sample_id)
         
-        # Check if sample directories exist
-        if not os.path.isdir(sample_dir_a) or not os.path.isdir(sample_dir_b):
-            continue
+            # Check if sample directories exist
+            if not os.path.isdir(sample_dir_a) or not os.path.isdir(sample_dir_b):
+                continue
         
-        # Locate the FASTQ file in the input_dir
-        fastq_files = [f for f in os.listdir(sample_dir_a) if '.fastq' in f and 'porechop' in f]
-        if not fastq_files:
-            print(f"No FASTQ file found in {sample_dir_a}")
-            continue
-        fastq_file = os.path.join(sample_dir_a, fastq_files[0])
-        print(f"Found FASTQ file: {fastq_file}")
+            # Locate the FASTQ file in the input_dir
+            fastq_files = [f for f in os.listdir(sample_dir_a) if '.fastq' in f and 'porechop' in f]
+            if not fastq_files:
+                print(f"No FASTQ file found in {sample_dir_a}")
+                continue
+            fastq_file = os.path.join(sample_dir_a, fastq_files[0])
+            print(f"Found FASTQ file: {fastq_file}")
         
-        # Iterate through subdirectories of the output_dir
-        for i, sub_dir in enumerate(os.listdir(sample_dir_b)):
-            if 'flye' in sub_dir:
-                fasta_dir = os.path.join(sample_dir_b, sub_dir)
-                if not os.path.isdir(fasta_dir):
-                    continue
+            sample_jobs = []
+            # Iterate through subdirectories of the output_dir
+            for i, sub_dir in enumerate(os.listdir(sample_dir_b)):
+                if 'flye' in sub_dir:
+                    fasta_dir = os.path.join(sample_dir_b, sub_dir)
+                    if not os.path.isdir(fasta_dir):
+                        continue
             
-                # Locate the FASTA file in the subdirectory
-                fasta_files = [f for f in os.listdir(fasta_dir) if f == 'assembly.fasta']
-                if not fasta_files:
-                    print(f"No FASTA file found in {fasta_dir}")
-                    continue
-                fasta_file = os.path.join(fasta_dir, fasta_files[0])
-                print(f"Found FASTA file: {fasta_file}")
+                    # Locate the FASTA file in the subdirectory
+                    fasta_files = [f for f in os.listdir(fasta_dir) if f == 'assembly.fasta']
+                    if not fasta_files:
+                        print(f"No FASTA file found in {fasta_dir}")
+                        continue
+                    fasta_file = os.path.join(fasta_dir, fasta_files[0])
+                    print(f"Found FASTA file: {fasta_file}")
                 
-                # Run polishing operation
-                try:
-                    medaka(fastq_file, fasta_file, output=i)
-                except subprocess.CalledProcessError as e:
-                    print(f"Error during polishing: {e}")
-                    continue
\ No newline at end of file
+                    sample_jobs.append((fasta_file, i))
+
+            if polish_depth and sample_jobs:
+                fastq_file = prepare_polishing_reads(fastq_file, [fasta_file for fasta_file, _ in sample_jobs], sample_dir_b, polish_depth)
+            for fasta_file, i in sample_jobs:
+                # Queue polishing operation
+                medaka(fastq_file, fasta_file, output=i, threads=threads, scheduler=scheduler, cache=cache)
+
+    return batch.wait()
\ No newline at end of file
@@ -0,0 +1,159 @@
+## polishing_reads
+import json
+import os
+import threading
+import numpy as np
+
+DEFAULT_POLISH_DEPTH = 100  # Depth of the polishing read set. Consensus accuracy stops improving well below the depth of a typical plasmid sample
+POLISHING_READS_PREFIX = 'polishing_reads'
+
+_LOCKS = {}
+_LOCKS_GUARD = threading.Lock()
+
+def assembly_length(assembly):
+    """
+    Total contig length of a Flye assembly, from assembly_info.txt next to it, or from the FASTA if that file is missing.
+
+    Parameters:
+        assembly (str): Path to assembly.fasta or to the Flye output directory.
+
+    Returns:
+        length (int): Sum of the contig lengths. 0 if the assembly is empty or missing.
+    """
+    assembly_dir = assembly if os.path.isdir(assembly) else os.path.dirname(assembly)
+    info_path = os.path.join(assembly_dir, 'assembly_info.txt')
+    if os.path.exists(info_path):
+        length = 0
+        with open(info_path) as info:
+            for line in info:
+                if line.startswith('#') or not line.strip():
+                    continue
+                length += int(line.split('\t')[1])
+        return length
+
+    fasta_path = assembly if not os.path.isdir(assembly) else os.path.join(assembly, 'assembly.fasta')
+    if not os.path.exists(fasta_path):
+        return 0
+    with open(fasta_path) as fasta:
+        return sum(len(line.strip()) for line in fasta if not line.startswith('>'))
+
+def select_polishing_reads(input_path, output_path, target_bases, reference_length):
+    """
+    Stream a FASTQ once and write its best reads, up to target_bases, for polishing.
+
+    Reads are ranked by min(length, reference_length) / reference_length times their error-averaged mean Q-score, so full-length,
+    accurate reads come first and reads longer than the construct (e.g. chimeras or dimers) gain nothing from the extra length.
+    Only the current selection is held in memory, which is bounded by target_bases, whatever the depth of the input.
+    Selected reads are written in input order.
+
+    Parameters:
+        input_path (str): Trimmed reads of the sample (.fastq or .fastq.gz).
+        output_path (str): Output FASTQ, gzipped if it ends in .gz.
+        target_bases (int): Total bases to select. The last selected read may cross it.
+        reference_length (int): Assembly length the read lengths are scored against.
+
+    Returns:
+        stats (dict): n_input_reads, n_input_bases, n_reads and n_bases.
+    """
+    from .fastq_io import parse_fastq_batches, open_compressed_output
+    from .filter_fastqs import calculate_batch_mean_quality
+
+    kept_scores = np.zeros(0)
+    kept_lengths = np.zeros(0, dtype=np.int64)
+    kept_order = np.zeros(0, dtype=np.int64)
+    kept_records = []
+    n_input_reads = 0
+    n_input_bases = 0
+
+    for batch in parse_fastq_batches(input_path):
+        lengths = batch.lengths
+        mean_qualities = calculate_batch_mean_quality(*batch.quality_array(), error_averaged=True)
+        scores = np.minimum(lengths, reference_length) / reference_length * mean_qualities
+
+        all_scores = np.concatenate([kept_scores, scores])
+        all_lengths = np.concatenate([kept_lengths, lengths])
+        all_order = np.concatenate([kept_order, np.arange(n_input_reads, n_input_reads + len(batch))])
+        # Best score first, earlier reads first among equal scores
+        ranking = np.lexsort((all_order, -all_scores))
+        bases_before = np.cumsum(all_lengths[ranking]) - all_lengths[ranking]
+        selected = ranking[bases_before < target_bases]
+
+        n_kept = len(kept_records)
+        kept_records = [kept_records[i] if i < n_kept else batch.record_bytes(i - n_kept) for i in selected.tolist()]
+        kept_scores, kept_lengths, kept_order = all_scores[selected], all_lengths[selected], all_order[selected]
+        n_input_reads += len(batch)
+        n_input_bases += int(lengths.sum())
+
+    temp_path = output_path + '.tmp'
+    handle = open_compressed_output(temp_path) if output_path.endswith('.gz') else open(temp_path, 'wb')
+    with handle:
+        for i in np.argsort(kept_order, kind='stable').tolist():
+            handle.write(kept_records[i])
+    os.replace(temp_path, output_path)
+
+    return {'n_input_reads': n_input_reads, 'n_input_bases': n_input_bases, 'n_reads': len(kept_records), 'n_bases': int(kept_lengths.sum())}
+
+def prepare_polishing_reads(trimmed_fastq, assemblies, output_dir, depth=DEFAULT_POLISH_DEPTH):
+    """
+    Build the polishing read set of a sample, capped at depth x its assembly length, or reuse the one already built.
+
+    The set is keyed by the trimmed reads, the depth and the digests and lengths of the assemblies it is built for, and its
+    file name carries that key, so callers passing the same assemblies, in this or a later run, wait for and reuse one set,
+    while a different set of assemblies never overwrites it. The assembly length is the median over the given assemblies.
+
+    Parameters:
+        trimmed_fastq (str): Trimmed reads of the sample.
+        assemblies (list of str): The sample's Flye assemblies (assembly.fasta paths or output directories).
+        output_dir (str): Directory the set is written to, e.g. the sample's assembly directory.
+        depth (int | float): Target depth of the set.
+
+    Returns:
+        polishing_fastq (str): Path of the read set. The trimmed FASTQ itself if no assembly length is known
+            or the sample is not deeper than the target.
+    """
+    import hashlib
+    from .workflow_engine import file_digest
+
+    assembly_keys = []
+    for assembly in assemblies:
+        length = assembly_length(str(assembly))
+        if length > 0:
+            fasta_path = os.path.join(assembly, 'assembly.fasta') if os.path.isdir(assembly) else str(assembly)
+            assembly_keys.append([file_digest(fasta_path), length])
+    if not assembly_keys:
+        print(f"No assembly length known for {trimmed_fastq}; polishing with every read")
+        return trimmed_fastq
+    assembly_keys.sort()
+    reference_length = int(np.median([length for _, length in assembly_keys]))
+
+    source = os.stat(trimmed_fastq)
+    source_key = {'source': os.path.abspath(trimmed_fastq), 'source_size': source.st_size, 'source_mtime_ns': source.st_mtime_ns, 'depth': depth,
+                  'assemblies': assembly_keys}
+    key_digest = hashlib.sha256(json.dumps(source_key, sort_keys=True).encode()).hexdigest()[:12]
+    output_path = os.path.join(os.path.abspath(output_dir), f'{POLISHING_READS_PREFIX}_{depth:g}x_{key_digest}.fastq.gz')
+    stats_path = output_path[:-len('.fastq.gz')] + '.json'
+
+    with _LOCKS_GUARD:
+        lock = _LOCKS.setdefault(output_path, threading.Lock())
+    with lock:
+        if os.path.exists(stats_path):
+            with open(stats_path) as handle:
+                stats = json.load(handle)
+            if all(stats.get(key) == value for key, value in source_key.items()):
+                return stats['polishing_fastq']
+
+        os.makedirs(output_dir, exist_ok=True)
+        stats = select_polishing_reads(trimmed_fastq, output_path, int(depth * reference_length), reference_length)
+        if stats['n_reads'] == stats['n_input_reads']:
+            # Nothing was left out, so the set would only duplicate the trimmed reads
+            os.remove(output_path)
+            polishing_fastq = trimmed_fastq
+        else:
+            polishing_fastq = output_path
+        print(f"Polishing reads for {trimmed_fastq}: {stats['n_reads']} of {stats['n_input_reads']} reads, "
+              f"{stats['n_bases'] / reference_length:.0f}x of {stats['n_input_bases'] / reference_length:.0f}x over {reference_length} bp")
+
+        stats.update(source_key, polishing_fastq=polishing_fastq, reference_length=reference_length)
+        with open(stats_path, 'w') as handle:
+            json.dump(stats, handle, indent=2)
+    return polishing_fastq
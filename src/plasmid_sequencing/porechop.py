@@ -1,6 +1,7 @@
 ## porechop
+from .scheduler import JobScheduler, run_command
 
-def porechop(input, recurse=True, output_suffix='porechopped', extra_end_trim=2, discard_middle=True):
+def porechop(input, recurse=True, output_suffix='porechopped', extra_end_trim=2, discard_middle=True, threads=4, scheduler=None):
     """
     Trim out adapter and barcode sequences from concatenated fastqs.
     
@@ -10,11 +11,12 @@ def porechop(input, recurse=True, output_suffix='porechopped', extra_end_trim=2,
         output_suffix (str): String to append to the end of the input basename.
         extra_end_trim (bool | int): How many extra bases to remove adjacent to the adapter.
         discard_middle (bool): Whether to discard reads that have middle adapters
+        threads (int): --threads passed to each porechop job.
+        scheduler (JobScheduler | None): Scheduler to run the trimming jobs on. If None, a scheduler using every CPU is created.
 
     Return:
-        None
+        output_paths (list of str): Paths of the trimmed FASTQs.
     """
-    import subprocess
     import os
 
     if os.path.isdir(input) and recurse:
@@ -28,9 +30,9 @@ def porechop(input, recurse=True, output_suffix='porechopped', extra_end_trim=2,
     elif '.fastq' in os.path.basename(input):
         fastq_files = [input]
     else:
-        return
+        return []
     
-    options = []
+    options = ['--threads', str(threads)]
 
     if extra_end_trim:
         options += ['--extra_end_trim', str(extra_end_trim)]
@@ -38,14 +40,21 @@ def porechop(input, recurse=True, output_suffix='porechopped', extra_end_trim=2,
     if discard_middle:
         options.append('--discard_middle')
 
-    for fastq in fastq_files:
-        input_basename = os.path.basename(fastq)
-        split_basename = input_basename.split('.fastq')
-        output_basename = split_basename[0] + '_' + output_suffix + '.fastq.gz'
-        output_path = os.path.join(os.path.dirname(fastq), output_basename)
-        command_list = ['porechop', '-i', fastq, '-o', output_path]
-        command_list += options
+    scheduler = scheduler or JobScheduler()
+    output_paths = []
 
-        subprocess.run(command_list)
+    with scheduler.batch() as batch:
+        for fastq in fastq_files:
+            input_basename = os.path.basename(fastq)
+            split_basename = input_basename.split('.fastq')
+            output_basename = split_basename[0] + '_' + output_suffix + '.fastq.gz'
+            output_path = os.path.join(os.path.dirname(fastq), output_basename)
+            command_list = ['porechop', '-i', fastq, '-o', output_path]
+            command_list += options
 
-    return
\ No newline at end of file
+            run_command(command_list, threads=threads, scheduler=scheduler, name=f'porechop {output_basename}', outputs=[output_path])
+            output_paths.append(output_path)
+
+    batch.wait()
+
+    return output_paths
\ No newline at end of file
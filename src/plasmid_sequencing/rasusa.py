@@ -1,9 +1,9 @@
 ## rasusa
 from pathlib import Path
-import subprocess
 import os
+from .scheduler import JobScheduler, run_command
 
-def rasusa(input, coverage=200, genome_size='10kb', iterations=3, output_dir=False):
+def rasusa(input, coverage=200, genome_size='10kb', iterations=3, output_dir=False, scheduler=None, cache=None):
     """
     Randomly subsample a FASTQ to a given average coverage.
     
@@ -13,6 +13,8 @@ def rasusa(input, coverage=200, genome_size='10kb', iterations=3, output_dir=Fal
         genome_size (str): Target genome size in bases.
         iterations (int): The int number of subsample files to write.
         output_dir (bool | str): If False, just output subsample into the same directory as the input file. If a string is passed, pass it into that output directory.
+        scheduler (JobScheduler | None): If given, the subsampling jobs are queued on it instead of run one after another.
+        cache (ResultCache | None): If given, each subsample is restored from this content-addressed cache when the same inputs, tool version and arguments were run before.
 
     Returns:
         output_file_list (list of str): List of filepaths of the rasusa subsamples
@@ -35,16 +37,13 @@ def rasusa(input, coverage=200, genome_size='10kb', iterations=3, output_dir=Fal
 
         command_list += random_seed + output_list
 
-        command_string = " ".join(command_list)
-        print(f"Running {command_string}")
-
-        subprocess.run(command_list)
+        run_command(command_list, threads=1, scheduler=scheduler, name=f'rasusa {output_basename}', outputs=[output_path], cache=cache, inputs=[input])
 
         output_file_list.append(output_path)
 
     return output_file_list
 
-def recursive_rasusa(input_dir, output_dir='subsampled_trimmed_filtered_demuliplexed_fastqs', coverage=200, genome_size='10kb', iterations=3, search_string='porechop'):
+def recursive_rasusa(input_dir, output_dir='subsampled_trimmed_filtered_demuliplexed_fastqs', coverage=200, genome_size='10kb', iterations=3, search_string='porechop', scheduler=None, cache=None):
     """
     Recursively search a directory for all fastq files. Produce subsamples of a given coverage for each FASTQ.
 
@@ -54,6 +53,8 @@ def recursive_rasusa(input_dir, output_dir='subsampled_trimmed_filtered_demulipl
         genome_size (str): Target genome size in bases.
         iterations (int): The int number of subsample files to write.
         output_dir (bool | str): If False, just output subsample into the same directory as the input file. If a string is passed, pass it into that output directory.
+        scheduler (JobScheduler | None): Scheduler to run the subsampling jobs on. If None, a scheduler using every CPU is created.
+        cache (ResultCache | None): Content-addressed cache passed to every job.
 
     Returns:
         output_dir (str): String representing the root directory that outputs will be stored in.
@@ -65,17 +66,21 @@ def recursive_rasusa(input_dir, output_dir='subsampled_trimmed_filtered_demulipl
     output_dir.mkdir(exist_ok=True)
 
     output_file_list_of_lists =[]
+    scheduler = scheduler or JobScheduler()
+
+    with scheduler.batch() as batch:
+        for root, _, files in os.walk(input_dir):
+            rel_path = Path(root).relative_to(input_dir)
+            output_subdir = output_dir / rel_path
+            output_subdir.mkdir(parents=True, exist_ok=True)
 
-    for root, _, files in os.walk(input_dir):
-        rel_path = Path(root).relative_to(input_dir)
-        output_subdir = output_dir / rel_path
-        output_subdir.mkdir(parents=True, exist_ok=True)
+            for file in files:
+                if file.endswith(".fastq") or file.endswith(".fastq.gz") and search_string in file:
+                    input_file = Path(root) / file
 
-        for file in files:
-            if file.endswith(".fastq") or file.endswith(".fastq.gz") and search_string in file:
-                input_file = Path(root) / file
+                    output_file_list = rasusa(input_file, coverage, genome_size, iterations, output_subdir, scheduler=scheduler, cache=cache)
+                    output_file_list_of_lists.append(output_file_list)
 
-                output_file_list = rasusa(input_file, coverage, genome_size, iterations, output_subdir)
-                output_file_list_of_lists.append(output_file_list)
+    batch.wait()
 
     return output_dir, output_file_list_of_lists
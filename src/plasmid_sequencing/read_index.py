@@ -0,0 +1,178 @@
+## read_index
+import hashlib
+import os
+import numpy as np
+
+# One row per FASTQ record. Saved as a .npy structured array so it can be memory mapped.
+READ_INDEX_DTYPE = np.dtype([
+    ('offset', '<u8'),  # Byte offset of the record in the FASTQ, or its BGZF virtual offset if the FASTQ is BGZF compressed
+    ('size', '<u4'),  # Bytes in the record, including newlines
+    ('length', '<u4'),  # Read length
+    ('mean_quality', '<f4'),  # Mean Phred score, as used by the quality filter
+    ('id_hash', '<u8'),  # 64-bit BLAKE2b hash of the read id
+])
+
+def read_index_path(fastq_path):
+    """Return the path of the sidecar index of a FASTQ: <fastq>.idx.npy."""
+    return str(fastq_path) + '.idx.npy'
+
+def hash_read_id(read_id):
+    """Return the 64-bit hash stored in the index for a read id (str or bytes, without the leading @)."""
+    if isinstance(read_id, str):
+        read_id = read_id.encode()
+    return int.from_bytes(hashlib.blake2b(read_id, digest_size=8).digest(), 'little')
+
+def _batch_id_hashes(batch, indices):
+    buffer = batch.buffer
+    hashes = []
+    for start, end in zip(batch.starts[indices, 0].tolist(), batch.ends[indices, 0].tolist()):
+        header = buffer[start + 1:end]
+        hashes.append(hash_read_id(header.split(None, 1)[0] if header else b''))
+    return np.array(hashes, dtype=np.uint64)
+
+class ReadIndexWriter:
+    """
+    Build the index of a FASTQ while its records are being written.
+
+    Parameters:
+        fastq_path (str | Path): The FASTQ the records are written to. The index is saved next to it.
+    """
+    def __init__(self, fastq_path):
+        self.fastq_path = str(fastq_path)
+        self.offset = 0
+        self._chunks = []
+
+    def add(self, batch, indices, mean_qualities):
+        """
+        Index the records of a FastqBatch that were just written with batch.records_bytes(indices).
+
+        Parameters:
+            batch (FastqBatch): Batch holding the records.
+            indices (np.ndarray): Indices of the written records, in the order they were written.
+            mean_qualities (np.ndarray): Mean quality of every record of the batch.
+        """
+        rows = np.zeros(len(indices), dtype=READ_INDEX_DTYPE)
+        # records_bytes writes every line followed by a single newline
+        sizes = (batch.ends[indices] - batch.starts[indices]).sum(axis=1) + 4
+        rows['offset'] = self.offset + np.cumsum(sizes) - sizes
+        rows['size'] = sizes
+        rows['length'] = batch.lengths[indices]
+        rows['mean_quality'] = mean_qualities[indices]
+        rows['id_hash'] = _batch_id_hashes(batch, indices)
+        self.offset += int(sizes.sum())
+        self._chunks.append(rows)
+
+    def save(self, virtual_offsets=None):
+        """
+        Write the index to <fastq>.idx.npy.
+
+        Parameters:
+            virtual_offsets (callable | None): If the FASTQ was written as BGZF, the writer's virtual_offsets method,
+                used to turn the uncompressed offsets into virtual offsets.
+
+        Returns:
+            index_path (str): Path of the saved index.
+        """
+        rows = np.concatenate(self._chunks) if self._chunks else np.zeros(0, dtype=READ_INDEX_DTYPE)
+        if virtual_offsets is not None and len(rows):
+            rows['offset'] = virtual_offsets(rows['offset'])
+        index_path = read_index_path(self.fastq_path)
+        temporary_path = index_path[:-len('.npy')] + '.tmp.npy'
+        np.save(temporary_path, rows)
+        os.replace(temporary_path, index_path)
+        return index_path
+
+def build_read_index(fastq_path):
+    """
+    Index an existing plain, gzip or BGZF FASTQ in one pass and save the index next to it.
+
+    Returns:
+        index_path (str): Path of the saved index.
+    """
+    from .fastq_io import parse_fastq_batches, is_bgzf, bgzf_virtual_offsets
+    from .filter_fastqs import calculate_batch_mean_quality
+
+    chunks = []
+    base_offset = 0
+    for batch in parse_fastq_batches(fastq_path):
+        if batch.has_carriage_returns:
+            raise ValueError(f"Cannot index {fastq_path}: records with Windows line endings have no stable byte offsets")
+        indices = np.arange(len(batch))
+        rows = np.zeros(len(batch), dtype=READ_INDEX_DTYPE)
+        rows['offset'] = base_offset + batch.record_starts
+        rows['size'] = batch.record_ends - batch.record_starts
+        rows['length'] = batch.lengths
+        rows['mean_quality'] = calculate_batch_mean_quality(*batch.quality_array())
+        rows['id_hash'] = _batch_id_hashes(batch, indices)
+        base_offset += int(batch.record_ends[-1])
+        chunks.append(rows)
+
+    rows = np.concatenate(chunks) if chunks else np.zeros(0, dtype=READ_INDEX_DTYPE)
+    if len(rows) and is_bgzf(fastq_path):
+        rows['offset'] = bgzf_virtual_offsets(fastq_path, rows['offset'])
+    index_path = read_index_path(fastq_path)
+    np.save(index_path, rows)
+    return index_path
+
+def load_read_index(fastq_path, mmap=True):
+    """
+    Load the sidecar index of a FASTQ.
+
+    Parameters:
+        fastq_path (str | Path): The indexed FASTQ.
+        mmap (bool): If True, the index is memory mapped instead of read into memory.
+
+    Returns:
+        index (np.ndarray): Structured array with READ_INDEX_DTYPE, one row per record in file order.
+    """
+    index_path = read_index_path(fastq_path)
+    if os.path.getmtime(fastq_path) > os.path.getmtime(index_path):
+        raise ValueError(f"{index_path} is older than {fastq_path}; rebuild it with build_read_index")
+    return np.load(index_path, mmap_mode='r' if mmap else None)
+
+def fetch_records(fastq_path, rows):
+    """
+    Read selected records from an indexed FASTQ without parsing the rest of the file.
+
+    Plain and BGZF files are read at the stored offsets directly. Ordinary gzip files cannot be read at random offsets,
+    so they are decompressed forward up to each record; rows are visited in file order either way.
+
+    Parameters:
+        fastq_path (str | Path): The indexed FASTQ.
+        rows (np.ndarray): Rows of its index, e.g. index[index['length'] > 5000].
+
+    Returns:
+        Generator of raw FASTQ records (bytes), in file order.
+    """
+    from .fastq_io import is_bgzf, fetch_bgzf, open_fastq
+
+    rows = np.sort(np.asarray(rows), order='offset')
+    if is_bgzf(fastq_path):
+        with open(fastq_path, 'rb') as handle:
+            for offset, size in zip(rows['offset'].tolist(), rows['size'].tolist()):
+                yield fetch_bgzf(handle, offset, size)
+        return
+    with open_fastq(fastq_path) as handle:
+        for offset, size in zip(rows['offset'].tolist(), rows['size'].tolist()):
+            handle.seek(offset)
+            yield handle.read(size)
+
+def write_records(fastq_path, rows, output_path, compresslevel=6, compress_threads=1):
+    """
+    Write the records of selected index rows to a new FASTQ (gzipped if output_path ends in .gz).
+
+    Returns:
+        n_records (int): Number of records written.
+    """
+    from .fastq_io import open_compressed_output
+
+    if str(output_path).endswith('.gz'):
+        outfile = open_compressed_output(output_path, compresslevel, compress_threads)
+    else:
+        outfile = open(output_path, 'wb')
+    n_records = 0
+    with outfile:
+        for record in fetch_records(fastq_path, rows):
+            outfile.write(record)
+            n_records += 1
+    return n_records
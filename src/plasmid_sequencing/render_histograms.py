@@ -0,0 +1,170 @@
+## render_histograms
+import json
+import os
+from pathlib import Path
+import numpy as np
+
+PLOT_DATA_SUFFIX = '_histogram.json'  # Next to <name>_histogram.png, written by filter_fastqs.write_histogram_to_file
+
+def save_plot_data(output_path, label, accumulator, filter_threshold, n_passed, peaks):
+    """
+    Save everything needed to draw the QC histogram PNG of a label, so the PNG can be rendered later without the reads.
+
+    Only the occupied bins are stored. Bin edges are kept as integer bin indices so the rendered edges match the accumulator exactly.
+
+    Parameters:
+        output_path (Path): Histogram directory.
+        label (str): Label of the histogram (e.g. 'Read Length').
+        accumulator (HistogramAccumulator): Binned counts of the data.
+        filter_threshold (float): Threshold for read filtering on the data metric.
+        n_passed (int): Number of reads passing the threshold.
+        peaks (list of float): Peak positions to annotate.
+
+    Returns:
+        data_path (Path): Path of the saved plot data.
+    """
+    histogram, _ = accumulator.histogram()
+    occupied = np.flatnonzero(histogram)
+    first_bin = int(np.flatnonzero(accumulator.counts)[0]) if accumulator.n else 0
+    plot_data = {
+        'label': label,
+        'bin_size': accumulator.bin_size,
+        'first_bin': first_bin,
+        'n_bins': len(histogram),
+        'bins': occupied.tolist(),
+        'counts': histogram[occupied].tolist(),
+        'mean': float(accumulator.mean),
+        'n_data': int(accumulator.n),
+        'filter_threshold': float(filter_threshold),
+        'n_passed': int(n_passed),
+        'peaks': [float(peak) for peak in peaks],
+    }
+    data_path = Path(output_path) / f"{label.lower().replace(' ', '_')}{PLOT_DATA_SUFFIX}"
+    with open(data_path, 'w') as handle:
+        json.dump(plot_data, handle)
+    return data_path
+
+def render_histogram_png(data_path, png_path=None):
+    """
+    Draw a QC histogram PNG from plot data saved by save_plot_data.
+
+    The figure is drawn on its own Agg canvas instead of through pyplot, so no GUI backend is loaded and renders in
+    different threads or processes do not share figure state.
+
+    Parameters:
+        data_path (str | Path): Path of the plot data.
+        png_path (str | Path | None): Output PNG. Defaults to the data path with a .png suffix.
+
+    Returns:
+        png_path (str): Path of the PNG.
+    """
+    from matplotlib.figure import Figure
+
+    data_path = str(data_path)
+    png_path = str(png_path or data_path[:-len('.json')] + '.png')
+    with open(data_path) as handle:
+        plot_data = json.load(handle)
+
+    label = plot_data['label']
+    filter_threshold = plot_data['filter_threshold']
+    histogram = np.zeros(plot_data['n_bins'], dtype=np.int64)
+    histogram[plot_data['bins']] = plot_data['counts']
+    edges = np.arange(plot_data['first_bin'], plot_data['first_bin'] + plot_data['n_bins'] + 1) * plot_data['bin_size']
+    mean_annotation_y = max(histogram, default=0) / 2 * 1.8
+
+    figure = Figure(figsize=(10, 6))
+    ax = figure.add_subplot()
+    ax.hist(edges[:-1], bins=edges, weights=histogram, color="blue", edgecolor="black", alpha=0.7)
+    ax.set_xlabel(label)
+    ax.set_ylabel("Frequency")
+
+    # Plot a vertical line for the filter_threshold
+    ax.axvline(filter_threshold, color='green', linestyle='solid', linewidth=1)
+
+    # Annotate the threshold on the plot
+    ax.text(filter_threshold + 0.1, mean_annotation_y,
+            f'Threshold: {filter_threshold:.1f}', color='green', fontsize=10)
+
+    mean_val = plot_data['mean']
+    # Plot a vertical line for the mean
+    ax.axvline(mean_val, color='purple', linestyle='dashed', linewidth=0.5)
+
+    # Annotate the mean on the plot
+    ax.text(mean_val + 0.1, mean_annotation_y,
+            f'Mean: {mean_val:.1f}', color='purple', fontsize=10)
+
+    # Annotate the peaks
+    for peak_x in plot_data['peaks']:
+        peak_y = histogram[min(np.searchsorted(edges, peak_x, side='right') - 1, len(histogram) - 1)] if len(histogram) else 0
+
+        # Annotating the peak on the plot (vertical dashed line)
+        ax.axvline(x=peak_x, color='red', linestyle='--', linewidth=0.5)
+        ax.annotate(f"Peak: {peak_x:.1f}",
+                    xy=(peak_x, peak_y),
+                    xytext=(peak_x + 0.2, peak_y + 0.05),  # Adjust annotation position
+                    fontsize=10, color='red')
+    ax.set_title(f"{label} Distribution from {plot_data['n_data']} total unfiltered reads: {plot_data['n_passed']} reads above threshold")
+    ax.grid(axis='y', alpha=0.75)
+    figure.tight_layout()
+    figure.savefig(png_path)
+    print(f"{label} histogram PNG saved to: {png_path}")
+    return png_path
+
+def _render_job(data_path):
+    """Render one PNG inside a worker process, returning the log instead of printing it."""
+    import contextlib
+    import io
+
+    log = io.StringIO()
+    with contextlib.redirect_stdout(log):
+        png_path = render_histogram_png(data_path)
+    return png_path, log.getvalue()
+
+def render_directory(input_dir, workers=1, overwrite=False):
+    """
+    Recursively render a PNG for every saved histogram plot data file under a directory.
+
+    Parameters:
+        input_dir (str): Directory to search, e.g. the filtered FASTQ root.
+        workers (int): Number of PNGs rendered concurrently in a process pool. 1 renders them one after another in this process.
+        overwrite (bool): If False, PNGs newer than their plot data are left as they are.
+
+    Returns:
+        png_paths (list of str): Paths of the rendered PNGs.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    data_paths = []
+    for root, dirs, files in os.walk(input_dir):
+        dirs.sort()
+        for file in sorted(files):
+            if file.endswith(PLOT_DATA_SUFFIX):
+                data_path = os.path.join(root, file)
+                png_path = data_path[:-len('.json')] + '.png'
+                if overwrite or not os.path.exists(png_path) or os.path.getmtime(png_path) < os.path.getmtime(data_path):
+                    data_paths.append(data_path)
+
+    if workers > 1 and len(data_paths) > 1:
+        png_paths = []
+        with ProcessPoolExecutor(max_workers=min(workers, len(data_paths))) as pool:
+            for png_path, log in pool.map(_render_job, data_paths):
+                print(log, end='')
+                png_paths.append(png_path)
+        return png_paths
+    return [render_histogram_png(data_path) for data_path in data_paths]
+
+def main(argv=None):
+    """Render deferred QC histogram PNGs: python -m plasmid_sequencing.render_histograms <directory>."""
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='python -m plasmid_sequencing.render_histograms', description='Render QC histogram PNGs from saved histogram data.')
+    parser.add_argument('input_dir', help='Directory searched recursively for saved histogram data, e.g. filtered_demuliplexed_fastqs.')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='PNGs rendered in parallel (default: number of CPUs).')
+    parser.add_argument('--overwrite', action='store_true', help='Render PNGs that are already up to date again.')
+    args = parser.parse_args(argv)
+
+    png_paths = render_directory(args.input_dir, args.workers, args.overwrite)
+    print(f"Rendered {len(png_paths)} PNGs")
+
+if __name__ == '__main__':
+    main()
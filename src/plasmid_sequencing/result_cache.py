@@ -0,0 +1,278 @@
+## result_cache
+import fcntl
+import functools
+import hashlib
+import json
+import os
+import shutil
+import stat
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+DEFAULT_CACHE_DIR = os.environ.get('PLASMID_SEQ_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'plasmid_sequencing'))
+DEFAULT_MAX_BYTES = 100 * 1024 ** 3
+
+# Tools whose version is reported by a different executable than the one in the command
+_VERSION_COMMANDS = {
+    'medaka_consensus': ['medaka', '--version'],
+}
+
+# Thread options left out of cache keys, so the same work hits whatever thread count or host it runs with
+_THREAD_OPTIONS = {
+    'flye': '--threads',
+    'medaka_consensus': '-t',
+}
+
+@functools.lru_cache(maxsize=None)
+def tool_version(tool):
+    """Return the version string an external tool reports, or 'unknown' if it cannot be run."""
+    command = _VERSION_COMMANDS.get(tool, [tool, '--version'])
+    try:
+        completed = subprocess.run(command, capture_output=True, text=True, timeout=60)
+    except (OSError, subprocess.SubprocessError):
+        return 'unknown'
+    return (completed.stdout or completed.stderr).strip() or 'unknown'
+
+def parse_size(size):
+    """Convert a size such as 500M, 20G or 1048576 into bytes."""
+    if isinstance(size, (int, float)):
+        return int(size)
+    size = size.strip().upper().rstrip('B')
+    multipliers = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+    if size and size[-1] in multipliers:
+        return int(float(size[:-1]) * multipliers[size[-1]])
+    return int(size)
+
+def _path_size(path):
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(root, file)) for root, _, files in os.walk(path) for file in files)
+    return os.path.getsize(path)
+
+def _copy_file(src, dst):
+    """Copy a file, sharing blocks with a reflink where the filesystem supports it."""
+    if sys.platform.startswith('linux'):
+        completed = subprocess.run(['cp', '--reflink=auto', '-p', str(src), str(dst)], capture_output=True)
+        if completed.returncode == 0:
+            return
+    shutil.copy2(src, dst)
+
+def _link_or_copy_file(src, dst):
+    """Hardlink a file, falling back to a (reflink) copy across filesystems."""
+    try:
+        os.link(src, dst)
+    except OSError:
+        _copy_file(src, dst)
+
+def _copy_tree(src, dst, copy_function):
+    if os.path.isdir(src):
+        shutil.copytree(src, dst, copy_function=copy_function, dirs_exist_ok=True)
+    else:
+        copy_function(src, dst)
+
+def remove_outputs(outputs):
+    """
+    Delete existing output files and directories.
+
+    Outputs restored from the cache are hardlinks to its read-only objects, so they are removed before a command writes
+    its outputs again, rather than rewritten in place.
+    """
+    for output in outputs:
+        if os.path.isdir(output) and not os.path.islink(output):
+            shutil.rmtree(output)
+        elif os.path.lexists(output):
+            os.remove(output)
+
+def _make_read_only(path):
+    """Remove write permission from cached files so a tool rewriting a restored hardlink in place fails instead of corrupting the cache."""
+    paths = [os.path.join(root, file) for root, _, files in os.walk(path) for file in files] if os.path.isdir(path) else [path]
+    for file_path in paths:
+        mode = os.stat(file_path).st_mode
+        os.chmod(file_path, mode & ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH))
+
+class ResultCache:
+    """
+    Local content-addressed cache of external tool outputs.
+
+    Entries are keyed by the digests of the input files, the tool version and the command arguments, with input and
+    output paths replaced by placeholders so the same work in a different directory still hits. Outputs are copied
+    into the cache (as reflinks where supported) and restored as hardlinks. When the cache grows past max_bytes,
+    the least recently used entries are evicted.
+
+    Parameters:
+        root (str | None): Cache directory. Defaults to $PLASMID_SEQ_CACHE_DIR or ~/.cache/plasmid_sequencing.
+        max_bytes (int | str): Size cap, e.g. 50G.
+    """
+    def __init__(self, root=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = Path(root or DEFAULT_CACHE_DIR)
+        self.max_bytes = parse_size(max_bytes)
+        self.objects_dir = self.root / 'objects'
+        self.index_path = self.root / 'index.json'
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+
+    @contextmanager
+    def _locked_index(self):
+        """Hold an exclusive lock on the index, so concurrent processes sharing the cache do not lose updates."""
+        with open(self.root / '.lock', 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            index = {}
+            if self.index_path.exists():
+                with open(self.index_path) as handle:
+                    index = json.load(handle)
+            yield index
+            temporary_path = self.index_path.with_name('index.json.tmp')
+            with open(temporary_path, 'w') as handle:
+                json.dump(index, handle, indent=1)
+            os.replace(temporary_path, self.index_path)
+
+    def entries(self):
+        """Return the index as a dict of key -> entry metadata."""
+        if not self.index_path.exists():
+            return {}
+        with open(self.index_path) as handle:
+            return json.load(handle)
+
+    def key(self, command, inputs, outputs):
+        """
+        Build the cache key of a command. The thread count of tools in _THREAD_OPTIONS is not part of the key.
+
+        Parameters:
+            command (list): The command and arguments as it would be run.
+            inputs (list): Input file paths whose content determines the result.
+            outputs (list): Output paths written by the command.
+        """
+        from .workflow_engine import file_digest
+
+        thread_option = _THREAD_OPTIONS.get(os.path.basename(str(command[0])))
+        if thread_option in command:
+            position = command.index(thread_option)
+            command = command[:position] + command[position + 2:]
+        placeholders = {str(path): f'{{input_{i}}}' for i, path in enumerate(inputs)}
+        placeholders.update({str(path): f'{{output_{i}}}' for i, path in enumerate(outputs)})
+        key_material = {
+            'tool': str(command[0]),
+            'version': tool_version(str(command[0])),
+            'command': [placeholders.get(str(arg), str(arg)) for arg in command],
+            'inputs': [file_digest(path) for path in inputs],
+        }
+        return hashlib.sha256(json.dumps(key_material, sort_keys=True).encode()).hexdigest()
+
+    def _object_dir(self, key):
+        return self.objects_dir / key[:2] / key
+
+    def restore(self, key, outputs):
+        """
+        Restore the outputs of a cached entry.
+
+        Returns:
+            hit (bool): True if the entry existed and every output was restored.
+        """
+        object_dir = self._object_dir(key)
+        with self._locked_index() as index:
+            entry = index.get(key)
+            if entry is None or not object_dir.exists():
+                index.pop(key, None)
+                return False
+            entry['last_used'] = time.time()
+            entry['hits'] = entry.get('hits', 0) + 1
+
+        for i, output in enumerate(outputs):
+            cached = object_dir / f'output_{i}'
+            if not cached.exists():
+                return False
+            remove_outputs([output])
+            os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+            _copy_tree(cached, output, _link_or_copy_file)
+        print(f"Restored {', '.join(str(output) for output in outputs)} from cache entry {key[:12]}")
+        return True
+
+    def store(self, key, outputs, description=''):
+        """Copy finished outputs into the cache under key, then evict old entries if the cache is over its size cap."""
+        object_dir = self._object_dir(key)
+        object_dir.parent.mkdir(parents=True, exist_ok=True)
+        staging_dir = Path(tempfile.mkdtemp(prefix=f'{key}.tmp', dir=object_dir.parent))
+        for i, output in enumerate(outputs):
+            _copy_tree(output, staging_dir / f'output_{i}', _copy_file)
+        _make_read_only(staging_dir)
+        size = _path_size(staging_dir)
+
+        with self._locked_index() as index:
+            if object_dir.exists():
+                shutil.rmtree(staging_dir, ignore_errors=True)
+            else:
+                os.replace(staging_dir, object_dir)
+            now = time.time()
+            index[key] = {'description': description, 'size': size, 'created': now, 'last_used': now, 'hits': 0}
+            self._evict(index, self.max_bytes)
+
+    def _evict(self, index, max_bytes):
+        removed = []
+        total = sum(entry['size'] for entry in index.values())
+        for key, entry in sorted(index.items(), key=lambda item: item[1]['last_used']):
+            if total <= max_bytes:
+                break
+            shutil.rmtree(self._object_dir(key), ignore_errors=True)
+            total -= entry['size']
+            removed.append(key)
+            del index[key]
+        return removed
+
+    def prune(self, max_bytes=None):
+        """
+        Evict least recently used entries until the cache fits in max_bytes.
+
+        Returns:
+            removed (list of str): Keys of the evicted entries.
+        """
+        max_bytes = self.max_bytes if max_bytes is None else parse_size(max_bytes)
+        with self._locked_index() as index:
+            return self._evict(index, max_bytes)
+
+def add_cache_actions(parser):
+    """Add the list, prune and clear actions to an argparse parser, for cache_command."""
+    subparsers = parser.add_subparsers(dest='action', required=True)
+    subparsers.add_parser('list', help='List cached entries, least recently used first.')
+    prune_parser = subparsers.add_parser('prune', help='Evict least recently used entries down to a size.')
+    prune_parser.add_argument('--max-size', default=DEFAULT_MAX_BYTES, help='Size to prune down to, e.g. 20G.')
+    subparsers.add_parser('clear', help='Remove every entry.')
+
+def cache_command(root, action, max_size=DEFAULT_MAX_BYTES):
+    """
+    List, prune or clear a result cache.
+
+    Parameters:
+        root (str | None): Cache directory. None uses $PLASMID_SEQ_CACHE_DIR or ~/.cache/plasmid_sequencing.
+        action (str): 'list', 'prune' or 'clear'.
+        max_size (str | int): Size prune evicts down to, e.g. '20G'.
+    """
+    cache = ResultCache(root)
+    if action == 'list':
+        entries = cache.entries()
+        total = 0
+        for key, entry in sorted(entries.items(), key=lambda item: item[1]['last_used']):
+            last_used = time.strftime('%Y-%m-%d %H:%M', time.localtime(entry['last_used']))
+            print(f"{key[:12]}\t{entry['size'] / 1e6:10.1f} MB\t{entry.get('hits', 0):5d} hits\t{last_used}\t{entry['description']}")
+            total += entry['size']
+        print(f"{len(entries)} entries, {total / 1e6:.1f} MB in {cache.root}")
+    elif action == 'prune':
+        removed = cache.prune(max_size)
+        print(f"Evicted {len(removed)} entries")
+    elif action == 'clear':
+        removed = cache.prune(0)
+        print(f"Evicted {len(removed)} entries")
+
+def main(argv=None):
+    """Inspect and prune the result cache: python -m plasmid_sequencing.result_cache {list,prune,clear}, also plasmid-seq cache."""
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='python -m plasmid_sequencing.result_cache', description='Inspect and prune the assembly result cache.')
+    parser.add_argument('--root', default=None, help='Cache directory (default: $PLASMID_SEQ_CACHE_DIR or ~/.cache/plasmid_sequencing).')
+    add_cache_actions(parser)
+    args = parser.parse_args(argv)
+    cache_command(args.root, args.action, getattr(args, 'max_size', DEFAULT_MAX_BYTES))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,318 @@
+## scheduler
+import os
+import threading
+from contextlib import contextmanager
+from concurrent.futures import Future
+
+class JobResult:
+    """
+    Outcome of one external command.
+
+    Attributes:
+        name (str): Label of the job, used in log messages.
+        command (list of str): The command that was run.
+        returncode (int): Exit code of the command.
+        wall_time (float): Seconds between launching the command and its exit.
+        threads (int): Number of threads reserved for the command.
+        outputs (list): Paths the command was expected to produce.
+        cached (bool): True if the outputs were restored from a ResultCache instead of running the command.
+        usage (dict | None): cpu_time, max_rss_kb and block I/O of the command (see telemetry.run_instrumented). None if it was not run.
+    """
+    __slots__ = ('name', 'command', 'returncode', 'wall_time', 'threads', 'outputs', 'cached', 'usage')
+
+    def __init__(self, name, command, returncode, wall_time, threads, outputs, cached=False, usage=None):
+        self.name = name
+        self.command = command
+        self.returncode = returncode
+        self.wall_time = wall_time
+        self.threads = threads
+        self.outputs = outputs
+        self.cached = cached
+        self.usage = usage
+
+    @property
+    def ok(self):
+        return self.returncode == 0
+
+    def __repr__(self):
+        return f"JobResult(name={self.name!r}, returncode={self.returncode}, wall_time={self.wall_time:.1f}, outputs={self.outputs!r}, cached={self.cached})"
+
+class JobBatch:
+    """
+    Futures of the jobs one caller queued inside a JobScheduler.batch() block.
+
+    Attributes:
+        futures (list of Future): Futures of the submitted jobs, in submission order.
+    """
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
+        self.futures = []
+
+    def wait(self):
+        """
+        Block until the jobs of this batch have finished. Jobs other callers queued on the scheduler are not waited for.
+
+        Called from inside a job of the scheduler, the job's reservation is lent back while it waits (see JobScheduler.released).
+
+        Returns:
+            results (list): Result of every job of the batch, in submission order. The first exception raised by a job is re-raised.
+        """
+        with self.scheduler.released():
+            return [future.result() for future in self.futures]
+
+# Tools whose first argument selects the stage, e.g. dorado basecaller / dorado demux
+_SUBCOMMAND_TOOLS = {'dorado', 'trycycler'}
+
+def _execute(name, command, threads, outputs, stdout, cache=None, inputs=()):
+    """
+    Run a command to completion and describe the outcome as a JobResult.
+
+    If a ResultCache is given, the outputs are restored from it on a hit. On a miss, existing outputs are removed before the command runs,
+    and the new outputs are stored in the cache after a successful run.
+    Wall time, CPU time, peak RSS and input/output sizes of the command are recorded as a telemetry event (see telemetry).
+    """
+    from .telemetry import record_event, run_instrumented, path_bytes, telemetry_path
+    from .result_cache import remove_outputs
+
+    command = [str(arg) for arg in command]
+    stage = os.path.basename(command[0])
+    if stage in _SUBCOMMAND_TOOLS and len(command) > 1:
+        stage += ' ' + command[1]
+    if cache is not None:
+        key = cache.key(command, inputs, outputs)
+        if cache.restore(key, outputs):
+            record_event('command', stage, name, status='cached', threads=threads, wall_time=0.0)
+            return JobResult(name, command, 0, 0.0, threads, list(outputs), cached=True)
+        # Outputs restored by an earlier hit are hardlinks to cache objects, which the command must not overwrite in place
+        remove_outputs(outputs)
+
+    command_string = " ".join(command)
+    print(f"Running {command_string}")
+    if stdout:
+        with open(stdout, 'w') as outfile:
+            returncode, usage = run_instrumented(command, stdout=outfile)
+    else:
+        returncode, usage = run_instrumented(command)
+    if returncode != 0:
+        print(f"{name} exited with code {returncode}: {command_string}")
+    elif cache is not None and all(os.path.exists(output) for output in outputs):
+        cache.store(key, outputs, description=name)
+    if telemetry_path() is not None:
+        record_event('command', stage, name, status='ok' if returncode == 0 else f'exit {returncode}', threads=threads, command=command_string,
+                     bytes_read=path_bytes(inputs), bytes_written=path_bytes(outputs), **usage)
+    return JobResult(name, command, returncode, usage['wall_time'], threads, list(outputs), usage=usage)
+
+class JobScheduler:
+    """
+    Local scheduler that runs external commands concurrently under a shared CPU budget.
+
+    Each job reserves a number of threads, and optionally an amount of memory. Jobs start as soon as enough threads (and memory)
+    are free and fewer than max_jobs are running. When several queued jobs fit, the one with the highest priority starts first,
+    then the one reserving the most threads, so large jobs are not starved by a stream of small ones.
+    A job that asks for more threads or memory than the whole budget is run alone.
+
+    Parameters:
+        max_threads (int | None): Total threads shared by all running jobs. Defaults to the number of CPUs.
+        max_jobs (int | None): Maximum number of jobs running at once. Defaults to max_threads.
+        max_memory (str | int | None): Total memory reserved by running jobs, e.g. '64G'. None does not budget memory.
+    """
+    def __init__(self, max_threads=None, max_jobs=None, max_memory=None):
+        from .result_cache import parse_size
+
+        self.max_threads = max_threads or os.cpu_count() or 1
+        self.max_jobs = max_jobs or self.max_threads
+        self.max_memory = parse_size(max_memory) if max_memory else None
+        self._condition = threading.Condition()
+        self._queue = []
+        self._running_jobs = 0
+        self._threads_in_use = 0
+        self._memory_in_use = 0
+        self._released_jobs = 0  # Running jobs that lent their reservation back (see released)
+        self._reacquiring_jobs = 0  # Released jobs waiting to take their reservation back, which go before any queued job
+        self._local = threading.local()  # job: the job the current thread runs. batches: the open batch() blocks of the current thread
+
+    def submit(self, command, threads=1, name=None, outputs=(), stdout=None, cache=None, inputs=(), memory=None, priority=0):
+        """
+        Queue a command for execution.
+
+        Parameters:
+            command (list): Command and arguments.
+            threads (int): Threads the command will use.
+            name (str | None): Label for log messages. Defaults to the command name.
+            outputs (list): Paths the command is expected to produce, reported back in the JobResult.
+            stdout (str | None): If given, the command's standard output is written to this file.
+            cache (ResultCache | None): If given, outputs are restored from the cache on a hit instead of running the command.
+            inputs (list): Input files that determine the outputs, used for the cache key.
+            memory (str | int | None): Memory reserved while the command runs, e.g. '4G'.
+            priority (int): Queued jobs with a higher priority start first.
+
+        Returns:
+            future (concurrent.futures.Future): Resolves to the JobResult of the command.
+        """
+        name = name or os.path.basename(str(command[0]))
+
+        def run():
+            return _execute(name, command, threads, outputs, stdout, cache, inputs)
+
+        return self.submit_call(run, threads=threads, name=name, memory=memory, priority=priority)
+
+    def submit_call(self, func, threads=1, name=None, memory=None, priority=0):
+        """
+        Queue a Python callable that holds a share of the thread budget while it runs.
+
+        This lets in-process work, or a chain of blocking tool calls, share the same CPU budget as queued commands.
+
+        Parameters:
+            func (callable): Called with no arguments on a worker thread.
+            threads (int): Threads reserved while func runs.
+            name (str | None): Label for the job.
+            memory (str | int | None): Memory reserved while func runs, e.g. '4G'. Ignored if the scheduler has no max_memory.
+            priority (int): Queued jobs with a higher priority start first, e.g. the later stages of a pipeline.
+
+        Returns:
+            future (concurrent.futures.Future): Resolves to the return value of func.
+        """
+        from .result_cache import parse_size
+
+        threads = max(1, min(int(threads), self.max_threads))
+        memory = min(parse_size(memory), self.max_memory) if memory and self.max_memory else 0
+        future = Future()
+        job = (name, func, threads, future, memory, priority)
+        for batch in getattr(self._local, 'batches', ()):
+            batch.futures.append(future)
+        with self._condition:
+            self._queue.append(job)
+            self._dispatch()
+        return future
+
+    def _dispatch(self):
+        """
+        Start every queued job that fits in the free budget. Must be called with the condition held.
+
+        Nothing new starts while a released job is waiting to reacquire its reservation, so a stream of new jobs cannot starve it.
+        """
+        while self._queue and self._running_jobs < self.max_jobs and not self._reacquiring_jobs:
+            free_threads = self.max_threads - self._threads_in_use
+            free_memory = (self.max_memory or 0) - self._memory_in_use
+            fitting = [job for job in self._queue if job[2] <= free_threads and job[4] <= free_memory]
+            if not fitting:
+                return
+            job = max(fitting, key=lambda queued: (queued[5], queued[2]))
+            self._queue.remove(job)
+            self._running_jobs += 1
+            self._threads_in_use += job[2]
+            self._memory_in_use += job[4]
+            threading.Thread(target=self._run, args=(job,), daemon=True).start()
+
+    def _run(self, job):
+        name, func, threads, future, memory, _ = job
+        self._local.job = job
+        try:
+            result = func()
+        except BaseException as e:
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+        finally:
+            self._local.job = None
+            with self._condition:
+                self._running_jobs -= 1
+                self._threads_in_use -= threads
+                self._memory_in_use -= memory
+                self._dispatch()
+                self._condition.notify_all()
+
+    @contextmanager
+    def released(self):
+        """
+        Lend the reservation of the calling job back to the budget for the duration of the block.
+
+        A job that queues commands of its own and waits for them, e.g. a workflow task driving a multi-stage tool, would
+        otherwise hold threads and a job slot that its commands need, and deadlock when it holds the whole budget.
+        On leaving the block the job waits until its threads, memory and slot are free again, ahead of every queued job.
+        Outside a job of this scheduler the block runs unchanged.
+        """
+        job = getattr(self._local, 'job', None)
+        if job is None:
+            yield
+            return
+        threads, memory = job[2], job[4]
+        with self._condition:
+            self._running_jobs -= 1
+            self._threads_in_use -= threads
+            self._memory_in_use -= memory
+            self._released_jobs += 1
+            self._dispatch()
+            self._condition.notify_all()
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._reacquiring_jobs += 1
+                self._condition.wait_for(lambda: self._running_jobs < self.max_jobs and self._threads_in_use + threads <= self.max_threads
+                                         and self._memory_in_use + memory <= (self.max_memory or 0))
+                self._reacquiring_jobs -= 1
+                self._running_jobs += 1
+                self._threads_in_use += threads
+                self._memory_in_use += memory
+                self._released_jobs -= 1
+                # Queued jobs held back while this job waited may fit in what is left
+                self._dispatch()
+
+    @contextmanager
+    def batch(self):
+        """
+        Collect the jobs the calling thread queues inside the block, so they can be waited for without waiting for anyone else's.
+
+        Yields:
+            batch (JobBatch): Call batch.wait() after the block for the results of its jobs.
+        """
+        batch = JobBatch(self)
+        batches = getattr(self._local, 'batches', None)
+        if batches is None:
+            batches = self._local.batches = []
+        batches.append(batch)
+        try:
+            yield batch
+        finally:
+            batches.remove(batch)
+
+    def wait(self):
+        """
+        Barrier: block until the scheduler is idle, with no job queued or running, whoever submitted them.
+
+        Results are not reported here. Collect the jobs of one caller with batch() instead.
+        """
+        if getattr(self._local, 'job', None) is not None:
+            raise RuntimeError("wait() called from a job of the same scheduler would wait for itself, use batch() instead")
+        with self._condition:
+            self._condition.wait_for(lambda: not self._queue and self._running_jobs == 0 and self._released_jobs == 0)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.wait()
+
+def run_command(command, threads=1, scheduler=None, name=None, outputs=(), stdout=None, cache=None, inputs=(), memory=None, priority=0):
+    """
+    Run an external command, either right away or through a JobScheduler.
+
+    Parameters:
+        command (list): Command and arguments.
+        threads (int): Threads the command will use.
+        scheduler (JobScheduler | None): If given, the command is queued on it and this call returns immediately.
+        name (str | None): Label for log messages.
+        outputs (list): Paths the command is expected to produce.
+        stdout (str | None): If given, the command's standard output is written to this file.
+        cache (ResultCache | None): If given, outputs are restored from the cache on a hit instead of running the command.
+        inputs (list): Input files that determine the outputs, used for the cache key.
+        memory (str | int | None): Memory reserved on the scheduler while the command runs.
+        priority (int): Scheduling priority of the command on the scheduler.
+
+    Returns:
+        JobResult if scheduler is None, otherwise a Future resolving to the JobResult.
+    """
+    if scheduler is not None:
+        return scheduler.submit(command, threads=threads, name=name, outputs=outputs, stdout=stdout, cache=cache, inputs=inputs, memory=memory, priority=priority)
+    return _execute(name or os.path.basename(str(command[0])), command, threads, outputs, stdout, cache, inputs)
@@ -0,0 +1,176 @@
+## streaming_pipeline
+import os
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+def stream_filter_trim_subsample(input_path, output_dir, hist_dir, min_length=500, min_mean_quality=12, coverage=200, genome_size=None, iterations=3,
+                                 porechop_threads=4, extra_end_trim=2, discard_middle=True, trimmed_output=None, tmpdir=None, save_png=True, seed=0, min_depth=None, summary_root=None,
+                                 default_genome_size=None):
+    """
+    Filter, adapter trim and subsample one demultiplexed FASTQ, writing only the subsampled replicates (and optionally the trimmed reads).
+
+    Reads are decoded once on the way in and once on the way back from porechop:
+    1) Reads passing the length and quality thresholds are written uncompressed to a scratch file under tmpdir.
+       Porechop opens its input several times to sniff the format, so it cannot read from a pipe.
+    2) Porechop trims the scratch file and prints the trimmed reads to stdout, which is parsed batch by batch as it arrives.
+    3) Every trimmed batch is offered to all subsample replicates at once, and optionally written to trimmed_output.
+    The scratch file is deleted as soon as porechop exits, so pointing tmpdir at fast local disk keeps the intermediate off shared storage.
+    If min_depth is given, the coverage and number of replicates are adapted to the depth of the filtered reads (see subsample.plan_subsampling),
+    and a sample below min_depth is neither trimmed nor subsampled. A sample with no read passing the filter is never trimmed or subsampled.
+
+    Parameters:
+        input_path (str): Path to the demultiplexed FASTQ (.fastq or .fastq.gz).
+        output_dir (str): Directory the subsampled replicates are written to.
+        hist_dir (str): Directory the read length and quality histograms are written to.
+        min_length (int): Minimum read length to keep.
+        min_mean_quality (float): Minimum mean read Q-score to keep.
+        coverage (int | float): Target coverage of each subsample.
+        genome_size (str | int | float | None): Genome size of the coverage target. If None, the construct length estimated from the read length histogram is used.
+        iterations (int): Number of subsampled replicates.
+        porechop_threads (int): --threads passed to porechop.
+        extra_end_trim (int): How many extra bases porechop removes next to an adapter.
+        discard_middle (bool): Whether porechop discards reads that have middle adapters.
+        trimmed_output (str | None): If given, the full set of trimmed reads is also written here (gzipped if it ends in .gz).
+        tmpdir (str | None): Directory for the filtered scratch file. Defaults to $TMPDIR or /tmp.
+        save_png (bool): Whether to save histogram PNGs.
+        seed (int): Seed of the first subsample replicate.
+        min_depth (int | float | None): Lowest depth worth assembling. None keeps coverage and iterations as given.
+        summary_root (str | None): If given, the histogram statistics are recorded in the summary store of this directory (see summary_store).
+        default_genome_size (str | int | float | None): Genome size used if genome_size is None and no construct length could be estimated.
+            If None too, such a sample is skipped.
+
+    Returns:
+        result (dict): 'subsamples' (list of replicate paths, empty if the sample was skipped), 'trimmed' (trimmed_output or None),
+            'estimated_construct_length' and 'depth' (depth of the filtered reads, or None if min_depth was not given).
+    """
+    from .fastq_io import iter_fastq_batches, parse_fastq_batches, open_compressed_output
+    from .filter_fastqs import ReadFilter
+    from .subsample import CoverageSubsampler, parse_genome_size, plan_subsampling, subsample_output_paths
+    from .telemetry import stage_timer, record_event, wait_instrumented, path_bytes
+
+    input_path = str(input_path)
+    read_filter = ReadFilter(min_length, min_mean_quality)
+    n_filtered = 0
+
+    sample_name = os.path.basename(input_path).split('.fastq')[0]
+    os.makedirs(hist_dir, exist_ok=True)
+    if tmpdir is not None:
+        os.makedirs(tmpdir, exist_ok=True)
+    with tempfile.TemporaryDirectory(prefix=f'{sample_name}_', dir=tmpdir) as scratch_dir:
+        filtered_path = os.path.join(scratch_dir, sample_name + '_filtered.fastq')
+        with stage_timer('filter', input_path) as timer, open(filtered_path, 'wb') as out_fq:
+            for batch in parse_fastq_batches(input_path):
+                passed = read_filter.filter(batch)
+                if len(passed):
+                    out_fq.write(batch.records_bytes(passed))
+                    n_filtered += len(passed)
+            timer.fields.update(n_reads=read_filter.read_lengths.n, n_passed=n_filtered, bases_passed=read_filter.passed_bases, bytes_read=path_bytes([input_path]))
+        print(f"Filtered {input_path}: {n_filtered} of {read_filter.read_lengths.n} reads kept")
+
+        estimated_construct_length = read_filter.write_histograms(hist_dir, save_png, summary_root)
+        skipped = {'subsamples': [], 'trimmed': None, 'estimated_construct_length': float(estimated_construct_length), 'depth': None if min_depth is None else 0.0}
+        if n_filtered == 0:
+            print(f"Skipping {input_path}: no read passed the filter")
+            return skipped
+        if genome_size is None:
+            # The estimate is NaN or 0 when the read length histogram has no peak
+            genome_size = estimated_construct_length if estimated_construct_length > 0 else default_genome_size
+            if genome_size is None:
+                print(f"Skipping {input_path}: no construct length could be estimated and no default genome size was given")
+                return skipped
+        depth = None
+        if min_depth is not None:
+            plan = plan_subsampling(read_filter.passed_bases, genome_size, coverage, iterations, min_depth)
+            coverage, iterations, depth = plan['coverage'], plan['iterations'], plan['depth']
+            print(f"{input_path}: {depth:.1f}x depth of {parse_genome_size(genome_size):.0f} bp, {iterations} replicates at {coverage:.1f}x")
+            if iterations == 0:
+                print(f"Skipping {input_path}: depth is below {min_depth}x")
+                return dict(skipped, depth=depth)
+        subsampler = CoverageSubsampler(coverage, genome_size, iterations, seed)
+
+        command = ['porechop', '-i', filtered_path, '--threads', str(porechop_threads)]
+        if extra_end_trim:
+            command += ['--extra_end_trim', str(extra_end_trim)]
+        if discard_middle:
+            command.append('--discard_middle')
+        print(f"Running {' '.join(command)}")
+
+        trimmed_file = None
+        if trimmed_output is not None:
+            trimmed_file = open_compressed_output(trimmed_output) if str(trimmed_output).endswith('.gz') else open(trimmed_output, 'wb')
+        start = time.perf_counter()
+        process = subprocess.Popen(command, stdout=subprocess.PIPE)
+        try:
+            for batch in iter_fastq_batches(process.stdout):
+                subsampler.update(batch)
+                if trimmed_file is not None:
+                    trimmed_file.write(batch.records_bytes(slice(None)))
+        finally:
+            process.stdout.close()
+            returncode, usage = wait_instrumented(process, start)
+            if trimmed_file is not None:
+                trimmed_file.close()
+        record_event('command', 'porechop', f'porechop {sample_name} (streamed)', status='ok' if returncode == 0 else f'exit {returncode}', threads=porechop_threads,
+                     bytes_read=path_bytes([filtered_path]), n_reads=subsampler.n_reads, **usage)
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, ' '.join(command))
+
+    output_file_list = subsample_output_paths(sample_name + '_filtered_porechopped.fastq', iterations, output_dir)
+    subsampler.write(output_file_list)
+
+    return {'subsamples': output_file_list, 'trimmed': trimmed_output, 'estimated_construct_length': float(estimated_construct_length), 'depth': depth}
+
+def stream_directory(input_dir, output_dir='subsampled_trimmed_filtered_demuliplexed_fastqs', hist_root='filtered_demuliplexed_fastqs', keep_trimmed=False,
+                     scheduler=None, **kwargs):
+    """
+    Run stream_filter_trim_subsample on every FASTQ found recursively in a directory.
+
+    Parameters:
+        input_dir (str): Path to the directory of demultiplexed FASTQs.
+        output_dir (str): Name of the subsample output directory, created next to input_dir.
+        hist_root (str): Name of the directory holding the per-sample histograms (and trimmed reads), created next to input_dir.
+        keep_trimmed (bool): If True, the trimmed reads of every sample are written to hist_root as <name>_filtered_porechopped.fastq.gz.
+        scheduler (JobScheduler | None): Scheduler whose thread budget the samples share. If None, a scheduler using every CPU is created.
+        **kwargs: Passed on to stream_filter_trim_subsample (min_length, coverage, porechop_threads, tmpdir, ...).
+
+    Returns:
+        results (dict): Maps each input FASTQ path to its stream_filter_trim_subsample result.
+    """
+    from .filter_fastqs import histogram_dir
+    from .scheduler import JobScheduler
+
+    input_dir = Path(input_dir)
+    parent_dir = input_dir.parent
+    output_dir = parent_dir / Path(output_dir)
+    hist_root = parent_dir / Path(hist_root)
+    scheduler = scheduler or JobScheduler()
+    threads = kwargs.get('porechop_threads', 4)
+    kwargs.setdefault('summary_root', str(hist_root))
+
+    futures = {}
+    with scheduler.batch() as batch:
+        for root, dirs, files in os.walk(input_dir):
+            dirs.sort()
+            rel_path = Path(root).relative_to(input_dir)
+            output_subdir = output_dir / rel_path
+
+            for file in sorted(files):
+                if file.endswith(".fastq") or file.endswith(".fastq.gz"):
+                    input_file = Path(root) / file
+                    hist_dir = histogram_dir(hist_root / rel_path, input_file)
+                    output_subdir.mkdir(parents=True, exist_ok=True)
+                    hist_dir.mkdir(parents=True, exist_ok=True)
+                    trimmed_output = None
+                    if keep_trimmed:
+                        trimmed_output = str(hist_root / rel_path / (file.split('.fastq')[0] + '_filtered_porechopped.fastq.gz'))
+
+                    def job(input_file=input_file, output_subdir=output_subdir, hist_dir=hist_dir, trimmed_output=trimmed_output):
+                        return stream_filter_trim_subsample(input_file, output_subdir, hist_dir, trimmed_output=trimmed_output, **kwargs)
+
+                    futures[str(input_file)] = scheduler.submit_call(job, threads=threads, name=f'stream {file}')
+
+    batch.wait()
+
+    return {input_file: future.result() for input_file, future in futures.items()}
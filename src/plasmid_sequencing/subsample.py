@@ -0,0 +1,197 @@
+## subsample
+import heapq
+import os
+import numpy as np
+
+_GENOME_SIZE_UNITS = {'b': 1, 'kb': 1e3, 'k': 1e3, 'mb': 1e6, 'm': 1e6, 'gb': 1e9, 'g': 1e9}
+DEFAULT_MIN_DEPTH = 20  # Samples with less depth than this are not assembled
+DEFAULT_MAX_REPLICATE_FRACTION = 0.7  # Largest share of a sample's depth one replicate may take, so replicates still differ
+
+def parse_genome_size(genome_size):
+    """
+    Convert a genome size given the way rasusa accepts it (e.g. 10kb, 4.6mb, 5000) into a number of bases.
+
+    Parameters:
+        genome_size (str | int | float): Genome size with an optional b/kb/mb/gb suffix.
+
+    Returns:
+        bases (float): Genome size in bases.
+    """
+    if isinstance(genome_size, (int, float, np.integer, np.floating)):
+        bases = float(genome_size)
+    else:
+        text = str(genome_size).strip().lower()
+        number = text.rstrip('bkmg')
+        unit = text[len(number):] or 'b'
+        if unit not in _GENOME_SIZE_UNITS or not number:
+            raise ValueError(f"Cannot parse genome size: {genome_size!r}")
+        bases = float(number) * _GENOME_SIZE_UNITS[unit]
+    if not bases > 0:
+        raise ValueError(f"Genome size must be positive, got {genome_size!r}")
+    return bases
+
+def plan_subsampling(total_bases, genome_size, coverage=200, iterations=3, min_depth=DEFAULT_MIN_DEPTH, max_replicate_fraction=DEFAULT_MAX_REPLICATE_FRACTION):
+    """
+    Choose the coverage and number of replicates to subsample a sample with, given how much sequence it holds.
+
+    - Above coverage / max_replicate_fraction depth, every replicate is downsampled to the requested coverage.
+    - Below that, the replicate coverage is lowered to max_replicate_fraction of the depth, so replicates are still distinct
+      subsets of the reads rather than identical copies of the whole sample.
+    - If that falls below min_depth, a single replicate holding every read is assembled instead of several identical ones.
+    - Samples with less than min_depth in total are skipped (iterations 0).
+
+    Parameters:
+        total_bases (int): Number of bases in the sample.
+        genome_size (str | int | float): Genome size of the sample, e.g. its estimated construct length.
+        coverage (int | float): Requested coverage of each replicate.
+        iterations (int): Requested number of replicates.
+        min_depth (int | float): Lowest depth worth assembling.
+        max_replicate_fraction (float): Largest fraction of the sample depth a single replicate may take.
+
+    Returns:
+        plan (dict): 'coverage' and 'iterations' to subsample with, and the 'depth' of the sample.
+    """
+    depth = total_bases / parse_genome_size(genome_size)
+    replicate_coverage = round(depth * max_replicate_fraction, 1)
+    if depth < min_depth:
+        plan = {'coverage': 0, 'iterations': 0}
+    elif replicate_coverage >= coverage:
+        plan = {'coverage': coverage, 'iterations': iterations}
+    elif replicate_coverage >= min_depth:
+        plan = {'coverage': replicate_coverage, 'iterations': iterations}
+    else:
+        # Rounded up so every read is kept
+        plan = {'coverage': float(np.ceil(depth)), 'iterations': min(iterations, 1)}
+    plan['depth'] = depth
+    return plan
+
+class _CoverageReservoir:
+    """
+    Bottom-k style sample of reads for one replicate.
+
+    Every read gets a uniform random key. The replicate is the set of reads with the smallest keys whose total length
+    first reaches target_bases, which is what taking reads from a random shuffle until the target is met gives.
+    Reads whose key can no longer make it into that set are dropped as soon as they are seen, so memory stays close to target_bases.
+    """
+    __slots__ = ('target_bases', 'heap', 'total_bases')
+
+    def __init__(self, target_bases):
+        self.target_bases = target_bases
+        self.heap = []  # (-key, read index, length, record bytes), so heap[0] holds the largest key
+        self.total_bases = 0
+
+    @property
+    def threshold(self):
+        """Keys at or above this value can no longer be selected."""
+        if self.total_bases < self.target_bases:
+            return np.inf
+        return -self.heap[0][0]
+
+    def offer(self, key, index, length, record):
+        heap = self.heap
+        heapq.heappush(heap, (-key, index, length, record))
+        self.total_bases += length
+        while heap and self.total_bases - heap[0][2] >= self.target_bases:
+            self.total_bases -= heapq.heappop(heap)[2]
+
+    def selected_records(self):
+        """Return the selected records in input order."""
+        return [record for _, _, _, record in sorted(self.heap, key=lambda item: item[1])]
+
+class CoverageSubsampler:
+    """
+    Draw several seeded coverage-targeted subsamples from a stream of FastqBatches at once.
+
+    Replicate i takes reads in a random order seeded with seed + i until their total length reaches coverage * genome_size.
+    Feed every batch of the input to update(), then call write().
+
+    Parameters:
+        coverage (int | float): Target genome coverage.
+        genome_size (str | int | float): Target genome size, either in bases or as a string such as '10kb'.
+        iterations (int): Number of replicates.
+        seed (int): Seed of the first replicate. Replicate i uses seed + i.
+    """
+    def __init__(self, coverage=200, genome_size='10kb', iterations=3, seed=0):
+        self.target_bases = coverage * parse_genome_size(genome_size)
+        self.reservoirs = [_CoverageReservoir(self.target_bases) for _ in range(iterations)]
+        self.generators = [np.random.default_rng(seed + iteration) for iteration in range(iterations)]
+        self.n_reads = 0
+        self.total_bases = 0
+
+    def update(self, batch):
+        """Offer every read of a FastqBatch to each replicate."""
+        lengths = batch.lengths
+        self.total_bases += int(lengths.sum())
+        records = {}  # Replicates selecting the same read share one copy of it
+        for reservoir, generator in zip(self.reservoirs, self.generators):
+            # Keys are drawn for every read so a replicate does not depend on how the input was split into batches
+            keys = generator.random(len(lengths))
+            for i in np.flatnonzero(keys < reservoir.threshold).tolist():
+                key = float(keys[i])
+                if key < reservoir.threshold:
+                    if i not in records:
+                        records[i] = batch.records_bytes([i])
+                    reservoir.offer(key, self.n_reads + i, int(lengths[i]), records[i])
+        self.n_reads += len(lengths)
+
+    def write(self, output_paths, compresslevel=6, compress_threads=1):
+        """Write each replicate, in input order, as a gzipped FASTQ to the matching path of output_paths."""
+        from .fastq_io import open_compressed_output
+
+        if self.total_bases < self.target_bases:
+            print(f"Input holds {self.total_bases} bases, fewer than the {self.target_bases:.0f} requested; every read is kept in each subsample")
+
+        for reservoir, output_path in zip(self.reservoirs, output_paths):
+            records = reservoir.selected_records()
+            with open_compressed_output(output_path, compresslevel, compress_threads) as outfile:
+                outfile.write(b''.join(records))
+            print(f"Wrote {len(records)} reads ({reservoir.total_bases} bases) to {output_path}")
+
+def subsample_output_paths(input, iterations, output_dir=False):
+    """Return the rasusa-style subsample paths of an input FASTQ: <name>_rasusa_subsample_<i>.fastq.gz."""
+    input_basename = os.path.basename(str(input))
+    split_basename = input_basename.split('.fastq')
+    output_file_list = []
+    for iteration in range(iterations):
+        output_basename = split_basename[0] + '_' + f'rasusa_subsample_{iteration}' + '.fastq.gz'
+
+        if output_dir:
+            output_path = os.path.join(output_dir, output_basename)
+        else:
+            output_path = os.path.join(os.path.dirname(str(input)), output_basename)
+        output_file_list.append(output_path)
+    return output_file_list
+
+def subsample_fastq(input, coverage=200, genome_size='10kb', iterations=3, output_dir=False, seed=0, compresslevel=6, compress_threads=1):
+    """
+    Randomly subsample a FASTQ to a given average coverage, writing every replicate from a single pass over the input.
+
+    In-process alternative to rasusa. Replicate i takes reads in a random order seeded with seed + i until their total length
+    reaches coverage * genome_size, and writes them in input order. If the input holds fewer bases than that, every read is written.
+    The sampled reads differ from rasusa's for the same seed, but the coverage semantics and output names are the same.
+
+    Parameters:
+        input (str): Path to the input fastq. Gzipped input is detected automatically.
+        coverage (int | float): Target genome coverage.
+        genome_size (str | int | float): Target genome size, either in bases (e.g. the estimated construct length from filter_fastqs) or as a string such as '10kb'.
+        iterations (int): The int number of subsample files to write.
+        output_dir (bool | str): If False, just output subsample into the same directory as the input file. If a string is passed, pass it into that output directory.
+        seed (int): Seed of the first replicate. Replicate i uses seed + i.
+        compresslevel (int): gzip compression level of the subsample files.
+        compress_threads (int): Compression threads per output file (see fastq_io.open_compressed_output).
+
+    Returns:
+        output_file_list (list of str): List of filepaths of the subsamples
+    """
+    from .fastq_io import parse_fastq_batches
+    from .telemetry import stage_timer, path_bytes
+
+    with stage_timer('subsample', input) as timer:
+        subsampler = CoverageSubsampler(coverage, genome_size, iterations, seed)
+        for batch in parse_fastq_batches(input):
+            subsampler.update(batch)
+
+        output_file_list = subsample_output_paths(input, iterations, output_dir)
+        subsampler.write(output_file_list, compresslevel, compress_threads)
+        timer.fields.update(n_reads=subsampler.n_reads, bytes_read=path_bytes([input]), bytes_written=path_bytes(output_file_list))
+    return output_file_list
@@ -0,0 +1,172 @@
+## summary_store
+import os
+import sqlite3
+import numpy as np
+
+SUMMARY_DB_NAME = 'read_summary_statistics.sqlite'  # Kept in the filtered FASTQ root, next to read_summary_statistics.txt
+SUMMARY_TSV_NAME = 'read_summary_statistics.txt'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS histogram_stats (
+    histogram_path TEXT PRIMARY KEY,
+    sample TEXT NOT NULL,
+    histogram_file TEXT NOT NULL,
+    total_counts REAL NOT NULL,
+    mean_count REAL NOT NULL,
+    median_count REAL NOT NULL,
+    range_edges REAL NOT NULL,
+    weighted_mean REAL NOT NULL,
+    source_mtime_ns INTEGER NOT NULL,
+    source_size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS histogram_stats_sample ON histogram_stats (sample);
+"""
+
+_STAT_COLUMNS = ('total_counts', 'mean_count', 'median_count', 'range_edges', 'weighted_mean')
+
+def histogram_sample(hist_dir):
+    """
+    Sample name of a histogram directory: the FASTQ name of histograms/<FASTQ name> (see filter_fastqs.histogram_dir),
+    or the sample directory above a histograms directory written before FASTQs had their own.
+    """
+    hist_dir = os.path.abspath(hist_dir)
+    if os.path.basename(os.path.dirname(hist_dir)) == 'histograms':
+        return os.path.basename(hist_dir)
+    return os.path.basename(os.path.dirname(hist_dir))
+
+def summarize_histogram(start_edges, end_edges, counts):
+    """
+    Summary statistics of the occupied bins of a histogram, as reported in read_summary_statistics.txt.
+
+    Params:
+        start_edges (np.ndarray): Lower edge of every occupied bin.
+        end_edges (np.ndarray): Upper edge of every occupied bin.
+        counts (np.ndarray): Count of every occupied bin.
+
+    Returns:
+        stats (dict): total_counts, mean_count, median_count, range_edges and weighted_mean.
+    """
+    total_counts = np.sum(counts)
+    return {
+        'total_counts': float(total_counts),
+        'mean_count': float(np.mean(counts)),
+        'median_count': float(np.median(counts)),
+        'range_edges': float(end_edges[-1] - start_edges[0]),
+        'weighted_mean': float(np.sum(counts * (start_edges + end_edges) / 2) / total_counts),
+    }
+
+def summarize_accumulator(accumulator):
+    """
+    summarize_histogram of a HistogramAccumulator, giving exactly the values read back from the histogram text file it is written to.
+
+    Returns:
+        stats (dict | None): See summarize_histogram. None if the accumulator is empty.
+    """
+    histogram, edges = accumulator.histogram()
+    occupied = np.flatnonzero(histogram)
+    if len(occupied) == 0:
+        return None
+    # Edges are rounded as write_histogram_to_file rounds them in the text file
+    start_edges = np.round(edges[occupied], 1)
+    end_edges = np.round(edges[occupied + 1], 1)
+    if isinstance(accumulator.bin_size, int):
+        start_edges, end_edges = np.trunc(start_edges), np.trunc(end_edges)
+    return summarize_histogram(start_edges, end_edges, histogram[occupied].astype(np.float64))
+
+class SummaryStore:
+    """
+    SQLite table of per-histogram summary statistics, one row per histogram text file, from which read_summary_statistics.txt is generated.
+
+    Rows are keyed by the histogram file's path relative to the store and carry the file's mtime and size,
+    so a sample is only summarized again when its histogram changed. Filtering workers in separate processes can write
+    to the same store; the database runs in WAL mode and writers wait for each other.
+
+    Parameters:
+        root_dir (str | Path): Filtered FASTQ root. The database is root_dir/read_summary_statistics.sqlite.
+    """
+    def __init__(self, root_dir):
+        self.root_dir = os.path.abspath(root_dir)
+        self.db_path = os.path.join(self.root_dir, SUMMARY_DB_NAME)
+        self._connection = sqlite3.connect(self.db_path, timeout=60)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.executescript(_SCHEMA)
+
+    def _key(self, histogram_path):
+        return os.path.relpath(os.path.abspath(histogram_path), self.root_dir)
+
+    def is_current(self, histogram_path):
+        """Whether the stored row of a histogram file was computed from the file as it is now."""
+        stat = os.stat(histogram_path)
+        row = self._connection.execute('SELECT source_mtime_ns, source_size FROM histogram_stats WHERE histogram_path = ?',
+                                       (self._key(histogram_path),)).fetchone()
+        return row is not None and tuple(row) == (stat.st_mtime_ns, stat.st_size)
+
+    def upsert(self, histogram_path, sample, stats):
+        """
+        Store the statistics of one histogram file, replacing any earlier row of the same file.
+
+        Params:
+            histogram_path (str | Path): The histogram text file the statistics describe. It must exist.
+            sample (str): Sample name.
+            stats (dict): See summarize_histogram.
+        """
+        stat = os.stat(histogram_path)
+        with self._connection:
+            self._connection.execute(
+                f"INSERT OR REPLACE INTO histogram_stats VALUES (?, ?, ?, {', '.join('?' * len(_STAT_COLUMNS))}, ?, ?)",
+                (self._key(histogram_path), sample, os.path.basename(histogram_path), *(stats[column] for column in _STAT_COLUMNS),
+                 stat.st_mtime_ns, stat.st_size))
+
+    def prune(self, keep_paths):
+        """Delete the rows of histogram files that are not in keep_paths, e.g. of samples removed from the tree."""
+        keep = {self._key(path) for path in keep_paths}
+        stale = [(key,) for (key,) in self._connection.execute('SELECT histogram_path FROM histogram_stats') if key not in keep]
+        if stale:
+            with self._connection:
+                self._connection.executemany('DELETE FROM histogram_stats WHERE histogram_path = ?', stale)
+
+    def rows(self):
+        """Return (sample, histogram file, *statistics) of every stored histogram, ordered by sample."""
+        return self._connection.execute(
+            f"SELECT sample, histogram_file, {', '.join(_STAT_COLUMNS)} FROM histogram_stats ORDER BY sample, histogram_path").fetchall()
+
+    def write_report(self, output_file=None):
+        """
+        Write read_summary_statistics.txt from the stored rows.
+
+        Returns:
+            output_file (str): Path of the report.
+        """
+        output_file = output_file or os.path.join(self.root_dir, SUMMARY_TSV_NAME)
+        with open(output_file, "w") as f:
+            # Write the header row
+            f.write("Sample\tHistogram File\tTotal Counts\tMean Count\tMedian Count\tRange of Edges\tWeighted Mean\n")
+            # Write the data rows
+            for row in self.rows():
+                f.write(f"{row[0]}\t{row[1]}\t{row[2]:.2f}\t{row[3]:.2f}\t{row[4]:.2f}\t{row[5]:.2f}\t{row[6]:.2f}\n")
+        return output_file
+
+    def close(self):
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+def record_histograms(root_dir, hist_dir, accumulators):
+    """
+    Store the statistics of freshly written histogram files straight from their accumulators, so extract_histogram_stats need not reload them.
+
+    Params:
+        root_dir (str | Path): Filtered FASTQ root holding the store.
+        hist_dir (str | Path): The FASTQ's histogram directory. The sample name is taken from it by histogram_sample.
+        accumulators (dict): Maps each histogram text file name in hist_dir to the HistogramAccumulator it was written from.
+    """
+    sample = histogram_sample(hist_dir)
+    with SummaryStore(root_dir) as store:
+        for file_name, accumulator in accumulators.items():
+            stats = summarize_accumulator(accumulator)
+            if stats is not None:
+                store.upsert(os.path.join(hist_dir, file_name), sample, stats)
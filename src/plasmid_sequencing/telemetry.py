@@ -0,0 +1,270 @@
+## telemetry
+import json
+import os
+import resource
+import threading
+import time
+from contextlib import contextmanager
+
+TELEMETRY_ENV = 'PLASMID_SEQ_TELEMETRY'  # JSON-lines file events are appended to. Unset disables telemetry.
+PROFILE_ENV = 'PLASMID_SEQ_PROFILE_DIR'  # Directory cProfile dumps of the profiled Python hot paths are written to. Unset disables profiling.
+
+_WRITE_LOCK = threading.Lock()
+
+def set_telemetry_path(path):
+    """
+    Send telemetry events of this process, and of any worker process it starts afterwards, to a JSON-lines file.
+
+    Parameters:
+        path (str | None): Events file. None disables telemetry.
+    """
+    if path is None:
+        os.environ.pop(TELEMETRY_ENV, None)
+    else:
+        os.environ[TELEMETRY_ENV] = os.path.abspath(path)
+
+@contextmanager
+def telemetry_to(path):
+    """
+    Send telemetry events to a JSON-lines file for the duration of the block, then restore the previous setting.
+
+    Parameters:
+        path (str | None): Events file. None disables telemetry inside the block.
+    """
+    previous = os.environ.get(TELEMETRY_ENV)
+    set_telemetry_path(path)
+    try:
+        yield
+    finally:
+        set_telemetry_path(previous)
+
+def telemetry_path():
+    """Return the current events file, or None if telemetry is off."""
+    return os.environ.get(TELEMETRY_ENV) or None
+
+def record_event(event, stage, name, **fields):
+    """
+    Append one event to the telemetry file. Does nothing if telemetry is off.
+
+    Every event is written with a single append, so events from concurrent threads and worker processes do not interleave.
+
+    Parameters:
+        event (str): Kind of event: 'command' for an external tool, 'stage' for in-process work, 'task' for a workflow task.
+        stage (str): Pipeline stage, e.g. 'flye' or 'filter'. Events are rolled up per stage.
+        name (str): Label of the job, e.g. the output it produces.
+        **fields: Measurements such as wall_time, cpu_time, max_rss_kb, bytes_read, bytes_written and n_reads.
+    """
+    path = telemetry_path()
+    if path is None:
+        return
+    record = {'time': time.time(), 'event': event, 'stage': stage, 'name': name, 'pid': os.getpid()}
+    record.update(fields)
+    line = (json.dumps(record, default=str) + '\n').encode()
+    with _WRITE_LOCK:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+
+def path_bytes(paths):
+    """Total size of the existing files and directories among paths."""
+    total = 0
+    for path in paths:
+        path = str(path)
+        if os.path.isdir(path):
+            total += sum(os.path.getsize(os.path.join(root, file)) for root, _, files in os.walk(path) for file in files)
+        elif os.path.exists(path):
+            total += os.path.getsize(path)
+    return total
+
+def wait_instrumented(process, start):
+    """
+    Wait for a Popen child and measure the resources of that child alone.
+
+    os.wait4 reports the rusage of the one child, so commands running concurrently on other threads are not mixed in.
+    Linux carries a process's peak RSS over into the program it starts, so max_rss_kb is never below the RSS this process had when it started the command.
+
+    Parameters:
+        process (subprocess.Popen): The running child.
+        start (float): time.perf_counter() when the child was started.
+
+    Returns:
+        returncode (int): Exit code of the command.
+        usage (dict): wall_time and cpu_time in seconds, max_rss_kb, and block_reads / block_writes (512-byte blocks).
+    """
+    _, status, rusage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    usage = {
+        'wall_time': time.perf_counter() - start,
+        'cpu_time': rusage.ru_utime + rusage.ru_stime,
+        'max_rss_kb': rusage.ru_maxrss,
+        'block_reads': rusage.ru_inblock,
+        'block_writes': rusage.ru_oublock,
+    }
+    return process.returncode, usage
+
+def run_instrumented(command, stdout=None, stdin=None):
+    """
+    Run a command to completion and measure its resources with wait_instrumented.
+
+    Parameters:
+        command (list of str): Command and arguments.
+        stdout (file | None): Standard output of the command.
+        stdin (file | None): Standard input of the command.
+
+    Returns:
+        returncode (int): Exit code of the command.
+        usage (dict): See wait_instrumented.
+    """
+    import subprocess
+
+    start = time.perf_counter()
+    process = subprocess.Popen(command, stdout=stdout, stdin=stdin)
+    return wait_instrumented(process, start)
+
+class StageTimer:
+    """
+    Measurements of one block of in-process work, filled in by stage_timer.
+
+    Add counts such as n_reads or bytes_written to fields before the block ends and they are recorded with the event.
+    """
+    __slots__ = ('fields',)
+
+    def __init__(self):
+        self.fields = {}
+
+@contextmanager
+def stage_timer(stage, name, event='stage', **fields):
+    """
+    Record wall time, CPU time and peak RSS of the enclosed block as a telemetry event.
+
+    CPU time is that of the whole process, so it includes other threads running at the same time.
+    max_rss_kb is the peak of the process so far, not of the block alone.
+
+    Parameters:
+        stage (str): Pipeline stage, e.g. 'filter'.
+        name (str): Label of the job, e.g. the input file.
+        event (str): Kind of event, 'stage' for in-process work or 'task' for a workflow task.
+        **fields: Extra fields recorded with the event.
+
+    Yields:
+        timer (StageTimer): Add further fields to timer.fields inside the block.
+    """
+    timer = StageTimer()
+    timer.fields.update(fields)
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    status = 'ok'
+    try:
+        yield timer
+    except BaseException as error:
+        # Exceptions can name their own status, e.g. workflow_engine.TaskSkipped is 'skipped'
+        status = getattr(error, 'telemetry_status', 'error')
+        raise
+    finally:
+        if telemetry_path() is not None:
+            record_event(event, stage, name, status=status, wall_time=time.perf_counter() - start, cpu_time=time.process_time() - cpu_start,
+                         max_rss_kb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, **timer.fields)
+
+@contextmanager
+def profiled(name):
+    """
+    Run the enclosed block under cProfile if PLASMID_SEQ_PROFILE_DIR is set, dumping the stats to <dir>/<name>.prof.
+
+    The dumps open with python -m pstats or snakeviz. For sampling profilers such as py-spy, attach to the process instead;
+    the hot paths are kept as separate named functions so they show up in its flame graphs.
+
+    Parameters:
+        name (str): Stem of the stats file, e.g. 'filter_barcode01'.
+    """
+    profile_dir = os.environ.get(PROFILE_ENV)
+    if not profile_dir:
+        yield
+        return
+
+    import cProfile
+
+    os.makedirs(profile_dir, exist_ok=True)
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        stats_path = os.path.join(profile_dir, f"{name.replace(os.sep, '_')}.prof")
+        profile.dump_stats(stats_path)
+        print(f"Profile saved to: {stats_path}")
+
+def load_events(path):
+    """Return the events of a JSON-lines telemetry file, skipping a partially written last line."""
+    events = []
+    with open(path) as handle:
+        for line in handle:
+            try:
+                events.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return events
+
+_SUMMARY_FIELDS = ('wall_time', 'cpu_time', 'bytes_read', 'bytes_written', 'n_reads', 'n_passed')
+
+def summarize_events(events):
+    """
+    Roll events up per (event kind, stage).
+
+    Returns:
+        rows (list of dict): One row per stage with the number of events, summed wall_time, cpu_time, bytes and read counts,
+            the largest max_rss_kb and the number of events that did not succeed, sorted by total wall time.
+    """
+    rows = {}
+    for event in events:
+        key = (event.get('event'), event.get('stage'))
+        row = rows.setdefault(key, {'event': key[0], 'stage': key[1], 'count': 0, 'failed': 0, 'max_rss_kb': 0, **{field: 0 for field in _SUMMARY_FIELDS}})
+        row['count'] += 1
+        if event.get('status', 'ok') == 'error' or event.get('status', '').startswith('exit'):
+            row['failed'] += 1
+        for field in _SUMMARY_FIELDS:
+            row[field] += event.get(field) or 0
+        row['max_rss_kb'] = max(row['max_rss_kb'], event.get('max_rss_kb') or 0)
+    return sorted(rows.values(), key=lambda row: row['wall_time'], reverse=True)
+
+def write_summary(events_path, output_path=None):
+    """
+    Write the per-stage rollup of a telemetry file as a tab-separated table and print it.
+
+    Parameters:
+        events_path (str): JSON-lines telemetry file.
+        output_path (str | None): Summary table. Defaults to the events file with a _summary.tsv suffix.
+
+    Returns:
+        output_path (str): Path of the summary table.
+    """
+    output_path = output_path or os.path.splitext(events_path)[0] + '_summary.tsv'
+    rows = summarize_events(load_events(events_path))
+    header = ['event', 'stage', 'count', 'failed', 'wall_time', 'cpu_time', 'max_rss_kb', 'bytes_read', 'bytes_written', 'n_reads', 'n_passed']
+    lines = ['\t'.join(header)]
+    for row in rows:
+        lines.append('\t'.join(f"{row[field]:.2f}" if isinstance(row[field], float) else str(row[field]) for field in header))
+    with open(output_path, 'w') as handle:
+        handle.write('\n'.join(lines) + '\n')
+
+    print(f"{'stage':<24}{'count':>6}{'wall s':>10}{'cpu s':>10}{'max RSS MB':>12}{'read MB':>10}{'written MB':>12}{'reads':>12}")
+    for row in rows:
+        print(f"{row['event'] + ':' + str(row['stage']):<24}{row['count']:>6}{row['wall_time']:>10.1f}{row['cpu_time']:>10.1f}{row['max_rss_kb'] / 1024:>12.1f}"
+              f"{row['bytes_read'] / 1e6:>10.1f}{row['bytes_written'] / 1e6:>12.1f}{row['n_reads']:>12}")
+    print(f"Telemetry summary saved to: {output_path}")
+    return output_path
+
+def main(argv=None):
+    """Summarize a telemetry file: python -m plasmid_sequencing.telemetry <events.jsonl>."""
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='python -m plasmid_sequencing.telemetry', description='Roll up JSON-lines telemetry into a per-stage table.')
+    parser.add_argument('events', help='JSON-lines telemetry file.')
+    parser.add_argument('--output', default=None, help='Summary table (default: <events>_summary.tsv).')
+    args = parser.parse_args(argv)
+    write_summary(args.events, args.output)
+
+if __name__ == '__main__':
+    main()
@@ -1,91 +1,237 @@
 ## trycycler
+import os
+from .scheduler import JobScheduler, run_command
 
-def trycycler_cluster(input):
+MIN_ASSEMBLY_FRACTION = 0.5  # Clusters holding contigs of fewer replicate assemblies than this are discarded, as in Trycycler's manual curation
+CONSENSUS_FASTA = 'consensus.fasta'
+
+def trycycler_cluster(assemblies, reads, out_dir, threads=1, scheduler=None, priority=0):
     """
-    De nowo genome assembly
-    
+    Cluster the contigs of the replicate assemblies of one sample.
+
     Parameters:
-        input (str): Path to the input fastq.
+        assemblies (list of str): Paths to the replicate assembly FASTAs.
+        reads (str): Path to the sample's reads.
+        out_dir (str): Trycycler output directory. Any earlier contents are removed, as trycycler cluster refuses a non-empty directory.
+        threads (int): Number of threads to allocate.
+        scheduler (JobScheduler | None): If given, the job is queued on it and this call returns without waiting for trycycler to finish.
+        priority (int): Scheduling priority of the job on the scheduler.
 
     Return:
-        output_path (str): Path to the output flye directory
+        JobResult if scheduler is None, otherwise a Future resolving to the JobResult. The clusters are out_dir/cluster_*.
     """
-    import subprocess
-    import os
+    import shutil
+
+    shutil.rmtree(out_dir, ignore_errors=True)
+    command_list = ['trycycler', 'cluster', '--assemblies', *[str(assembly) for assembly in assemblies], '--reads', str(reads), '--out_dir', str(out_dir), '--threads', str(threads)]
 
-    command_list = ['flye']
-    read_error_list = []
-    
-    pass
+    return run_command(command_list, threads=threads, scheduler=scheduler, name=f'trycycler cluster {out_dir}', outputs=[out_dir], inputs=[*assemblies, reads], priority=priority)
 
-def trycycler_reconcile(input):
+def trycycler_reconcile(reads, cluster_dir, threads=1, scheduler=None, priority=0):
     """
-    De nowo genome assembly
-    
+    Reconcile the contigs of one cluster into 2_all_seqs.fasta.
+
     Parameters:
-        input (str): Path to the input fastq.
+        reads (str): Path to the sample's reads.
+        cluster_dir (str): Cluster directory written by trycycler_cluster.
+        threads (int): Number of threads to allocate.
+        scheduler (JobScheduler | None): If given, the job is queued on it and this call returns without waiting for trycycler to finish.
+        priority (int): Scheduling priority of the job on the scheduler.
 
     Return:
-        output_path (str): Path to the output flye directory
+        JobResult if scheduler is None, otherwise a Future resolving to the JobResult.
     """
-    import subprocess
-    import os
+    command_list = ['trycycler', 'reconcile', '--reads', str(reads), '--cluster_dir', str(cluster_dir), '--threads', str(threads)]
 
-    command_list = ['flye']
-    read_error_list = []
-    
-    pass
+    return run_command(command_list, threads=threads, scheduler=scheduler, name=f'trycycler reconcile {cluster_dir}',
+                       outputs=[os.path.join(cluster_dir, '2_all_seqs.fasta')], inputs=[reads], priority=priority)
 
-def trycycler_msa(input):
+def trycycler_msa(cluster_dir, threads=1, scheduler=None, priority=0):
     """
-    De nowo genome assembly
-    
+    Multiple sequence alignment of the reconciled contigs of one cluster into 3_msa.fasta.
+
     Parameters:
-        input (str): Path to the input fastq.
+        cluster_dir (str): Reconciled cluster directory.
+        threads (int): Number of threads to allocate.
+        scheduler (JobScheduler | None): If given, the job is queued on it and this call returns without waiting for trycycler to finish.
+        priority (int): Scheduling priority of the job on the scheduler.
 
     Return:
-        output_path (str): Path to the output flye directory
+        JobResult if scheduler is None, otherwise a Future resolving to the JobResult.
     """
-    import subprocess
-    import os
+    command_list = ['trycycler', 'msa', '--cluster_dir', str(cluster_dir), '--threads', str(threads)]
 
-    command_list = ['flye']
-    read_error_list = []
-    
-    pass
+    return run_command(command_list, threads=threads, scheduler=scheduler, name=f'trycycler msa {cluster_dir}',
+                       outputs=[os.path.join(cluster_dir, '3_msa.fasta')], priority=priority)
 
-def trycycler_partition(input):
+def trycycler_partition(reads, cluster_dirs, threads=1, scheduler=None, priority=0):
     """
-    De nowo genome assembly
-    
+    Assign the sample's reads to its reconciled clusters, writing 4_reads.fastq in every cluster directory.
+
+    Partitioning aligns every read against every cluster, so it is the stage that gains most from threads.
+
     Parameters:
-        input (str): Path to the input fastq.
+        reads (str): Path to the sample's reads.
+        cluster_dirs (list of str): Reconciled cluster directories of the sample.
+        threads (int): Number of threads to allocate.
+        scheduler (JobScheduler | None): If given, the job is queued on it and this call returns without waiting for trycycler to finish.
+        priority (int): Scheduling priority of the job on the scheduler.
 
     Return:
-        output_path (str): Path to the output flye directory
+        JobResult if scheduler is None, otherwise a Future resolving to the JobResult.
     """
-    import subprocess
-    import os
+    command_list = ['trycycler', 'partition', '--reads', str(reads), '--cluster_dirs', *[str(cluster_dir) for cluster_dir in cluster_dirs], '--threads', str(threads)]
 
-    command_list = ['flye']
-    read_error_list = []
-    
-    pass
+    return run_command(command_list, threads=threads, scheduler=scheduler, name=f'trycycler partition {os.path.dirname(str(cluster_dirs[0]))}',
+                       outputs=[os.path.join(cluster_dir, '4_reads.fastq') for cluster_dir in cluster_dirs], inputs=[reads], priority=priority)
 
-def trycycler_consensus(input):
+def trycycler_consensus(cluster_dir, threads=1, scheduler=None, priority=0):
     """
-    De nowo genome assembly
-    
+    Build the consensus sequence of one cluster into 7_final_consensus.fasta.
+
     Parameters:
-        input (str): Path to the input fastq.
+        cluster_dir (str): Cluster directory with its alignment (trycycler_msa) and partitioned reads (trycycler_partition).
+        threads (int): Number of threads to allocate.
+        scheduler (JobScheduler | None): If given, the job is queued on it and this call returns without waiting for trycycler to finish.
+        priority (int): Scheduling priority of the job on the scheduler.
 
     Return:
-        output_path (str): Path to the output flye directory
+        JobResult if scheduler is None, otherwise a Future resolving to the JobResult.
+    """
+    command_list = ['trycycler', 'consensus', '--cluster_dir', str(cluster_dir), '--threads', str(threads)]
+
+    return run_command(command_list, threads=threads, scheduler=scheduler, name=f'trycycler consensus {cluster_dir}',
+                       outputs=[os.path.join(cluster_dir, '7_final_consensus.fasta')], priority=priority)
+
+def cluster_assemblies(cluster_dir):
+    """Return the labels (A, B, ...) of the replicate assemblies with a contig in a cluster, from the contig files trycycler cluster wrote."""
+    contigs_dir = os.path.join(cluster_dir, '1_contigs')
+    if not os.path.isdir(contigs_dir):
+        return set()
+    return {file.split('_')[0] for file in os.listdir(contigs_dir) if file.endswith('.fasta')}
+
+def trycycler_sample(assemblies, reads, out_dir, threads=1, partition_threads=None, min_assembly_fraction=MIN_ASSEMBLY_FRACTION, scheduler=None, priority=0):
+    """
+    Consensus assembly of one sample from its replicate assemblies: cluster, reconcile, msa, partition and consensus.
+
+    Every stage is queued on the scheduler. Clusters move on independently: each cluster's alignment starts as soon as it is reconciled,
+    while the reads are partitioned once all clusters are reconciled, and each cluster's consensus starts once both are done.
+    The manual curation between clustering and reconciling is replaced by two rules: clusters holding contigs of fewer than
+    min_assembly_fraction of the assemblies are discarded, and so are clusters that trycycler reconcile rejects.
+    Run as a job of the scheduler, e.g. a workflow task, the job lends its threads back while it waits (see JobScheduler.released).
+
+    Parameters:
+        assemblies (list of str): Paths to the replicate assembly FASTAs, at least 2.
+        reads (str): Path to the sample's reads.
+        out_dir (str): Trycycler output directory of the sample.
+        threads (int): Threads of every reconcile, msa and consensus job.
+        partition_threads (int | None): Threads of the partition job. Defaults to threads.
+        min_assembly_fraction (float): Minimum fraction of the assemblies a cluster must hold contigs of. Never fewer than 2 assemblies.
+        scheduler (JobScheduler | None): Scheduler to run the jobs on. If None, a scheduler using every CPU is created.
+        priority (int): Scheduling priority of the jobs.
+
+    Returns:
+        consensus_path (str): out_dir/consensus.fasta, the consensus sequences of all kept clusters.
     """
-    import subprocess
-    import os
+    import math
+    from concurrent.futures import as_completed
+
+    if len(assemblies) < 2:
+        raise ValueError(f"Trycycler needs at least 2 assemblies, got {len(assemblies)}")
+    scheduler = scheduler or JobScheduler()
+    partition_threads = partition_threads or threads
+    min_assemblies = max(2, math.ceil(min_assembly_fraction * len(assemblies)))
+
+    def check(job, step):
+        if not job.ok:
+            raise RuntimeError(f"{step} exited with code {job.returncode}")
+
+    with scheduler.released():
+        check(trycycler_cluster(assemblies, reads, out_dir, threads, scheduler, priority).result(), f'trycycler cluster {out_dir}')
+
+        cluster_dirs = sorted(os.path.join(out_dir, name) for name in os.listdir(out_dir) if name.startswith('cluster_'))
+        kept = []
+        for cluster_dir in cluster_dirs:
+            n_assemblies = len(cluster_assemblies(cluster_dir))
+            if n_assemblies < min_assemblies:
+                print(f"Discarding {cluster_dir}: contigs of {n_assemblies} of {len(assemblies)} assemblies")
+            else:
+                kept.append(cluster_dir)
+
+        reconcile_jobs = {trycycler_reconcile(reads, cluster_dir, threads, scheduler, priority): cluster_dir for cluster_dir in kept}
+        reconciled = []
+        msa_jobs = []
+        for job in as_completed(reconcile_jobs):
+            cluster_dir = reconcile_jobs[job]
+            if not job.result().ok:
+                print(f"Discarding {cluster_dir}: trycycler reconcile could not reconcile its contigs")
+                continue
+            reconciled.append(cluster_dir)
+            msa_jobs.append(trycycler_msa(cluster_dir, threads, scheduler, priority))
+        if not reconciled:
+            raise RuntimeError(f"No cluster of {out_dir} could be reconciled")
+        reconciled.sort()
+
+        check(trycycler_partition(reads, reconciled, partition_threads, scheduler, priority).result(), f'trycycler partition {out_dir}')
+        for job in msa_jobs:
+            check(job.result(), 'trycycler msa')
+        consensus_jobs = [trycycler_consensus(cluster_dir, threads, scheduler, priority) for cluster_dir in reconciled]
+        for job in consensus_jobs:
+            check(job.result(), 'trycycler consensus')
+
+    consensus_path = os.path.join(out_dir, CONSENSUS_FASTA)
+    with open(consensus_path, 'w') as consensus:
+        for cluster_dir in reconciled:
+            with open(os.path.join(cluster_dir, '7_final_consensus.fasta')) as cluster_consensus:
+                consensus.write(cluster_consensus.read())
+    print(f"Consensus of {len(reconciled)} clusters from {len(assemblies)} assemblies: {consensus_path}")
+    return consensus_path
+
+def recursive_trycycler(reads_dir, assembly_dir, output_name='trycycler', threads=1, partition_threads=None, min_assembly_fraction=MIN_ASSEMBLY_FRACTION, scheduler=None):
+    """
+    Consensus assembly of every sample from its flye replicates, with all samples running at once.
+
+    Parameters:
+        reads_dir (str): Directory containing a subdirectory of trimmed reads per sample.
+        assembly_dir (str): Root directory of the flye outputs, holding the flye_* replicate directories of each sample.
+        output_name (str): Name of the Trycycler output directory created in each sample's assembly directory.
+        threads (int): Threads of every reconcile, msa and consensus job.
+        partition_threads (int | None): Threads of every partition job. Defaults to threads.
+        min_assembly_fraction (float): See trycycler_sample.
+        scheduler (JobScheduler | None): Scheduler to run the jobs on. If None, a scheduler using every CPU is created.
+
+    Returns:
+        consensus_paths (dict): Maps each sample to the path of its consensus FASTA, for the samples that completed.
+    """
+    scheduler = scheduler or JobScheduler()
+    samples = {}
+
+    for sample_id in sorted(os.listdir(assembly_dir)):
+        sample_dir_a = os.path.join(reads_dir, sample_id)
+        sample_dir_b = os.path.join(assembly_dir, sample_id)
+        if not os.path.isdir(sample_dir_a) or not os.path.isdir(sample_dir_b):
+            continue
+
+        fastq_files = sorted(f for f in os.listdir(sample_dir_a) if '.fastq' in f and 'porechop' in f)
+        if not fastq_files:
+            print(f"No FASTQ file found in {sample_dir_a}")
+            continue
+        assemblies = [os.path.join(sample_dir_b, sub_dir, 'assembly.fasta') for sub_dir in sorted(os.listdir(sample_dir_b))
+                      if sub_dir.startswith('flye_') and os.path.exists(os.path.join(sample_dir_b, sub_dir, 'assembly.fasta'))]
+        if len(assemblies) < 2:
+            print(f"Not enough assemblies for a consensus in {sample_dir_b}: {len(assemblies)}")
+            continue
+
+        reads = os.path.join(sample_dir_a, fastq_files[0])
+        out_dir = os.path.join(sample_dir_b, output_name)
+        samples[sample_id] = scheduler.submit_call(lambda assemblies=assemblies, reads=reads, out_dir=out_dir: trycycler_sample(assemblies, reads, out_dir, threads, partition_threads,
+                                                                                                                             min_assembly_fraction, scheduler),
+                                                   name=f'trycycler {sample_id}')
 
-    command_list = ['flye']
-    read_error_list = []
-    
-    pass
\ No newline at end of file
+    consensus_paths = {}
+    for sample_id, future in samples.items():
+        try:
+            consensus_paths[sample_id] = future.result()
+        except Exception as e:
+            print(f"Consensus of {sample_id} failed: {e}")
+    return consensus_paths
@@ -0,0 +1,261 @@
+## workflow_engine
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+def file_digest(path, block_size=1 << 20):
+    """
+    Return the SHA-256 hex digest of a file, or of a directory's relative file paths and contents.
+
+    Parameters:
+        path (str | Path): Path to a file or directory.
+        block_size (int): Number of bytes hashed per read.
+    """
+    path = Path(path)
+    digest = hashlib.sha256()
+    if path.is_dir():
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for file in sorted(files):
+                file_path = Path(root) / file
+                digest.update(str(file_path.relative_to(path)).encode())
+                digest.update(file_digest(file_path, block_size).encode())
+        return digest.hexdigest()
+    with open(path, 'rb') as handle:
+        for block in iter(lambda: handle.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def collect_paths(value):
+    """Return every str or Path inside a (nested) task result that names an existing file or directory."""
+    if isinstance(value, (str, Path)):
+        return [str(value)] if os.path.exists(value) else []
+    if isinstance(value, dict):
+        value = list(value.values())
+    if isinstance(value, (list, tuple)):
+        return [path for item in value for path in collect_paths(item)]
+    return []
+
+def _to_json(value):
+    """Convert a task result into plain JSON types so fresh and resumed results look the same."""
+    return json.loads(json.dumps(value, default=str))
+
+class Manifest:
+    """
+    JSON record of completed workflow tasks.
+
+    Each completed task is stored under a key derived from its name, its parameters and the content digests of its inputs.
+    File digests are cached by path, size and modification time so unchanged inputs are not rehashed on every run.
+
+    Parameters:
+        path (str | Path): Location of the manifest file. It is created on the first completed task.
+    """
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        if self.path.exists():
+            with open(self.path) as handle:
+                data = json.load(handle)
+        else:
+            data = {}
+        self.tasks = data.get('tasks', {})
+        self.digests = data.get('digests', {})
+
+    def digest(self, path):
+        """Return the content digest of a file or directory, reusing the cached value if it has not changed."""
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        signature = [stat.st_size, stat.st_mtime_ns]
+        with self._lock:
+            cached = self.digests.get(path)
+        if cached and cached[:2] == signature and not os.path.isdir(path):
+            return cached[2]
+        value = file_digest(path)
+        with self._lock:
+            self.digests[path] = signature + [value]
+        return value
+
+    def task_key(self, name, params, inputs):
+        """Build the manifest key of a task from its name, parameters and input content."""
+        key_material = {
+            'name': name,
+            'params': _to_json(params),
+            'inputs': sorted(self.digest(path) for path in inputs),
+        }
+        return hashlib.sha256(json.dumps(key_material, sort_keys=True).encode()).hexdigest()
+
+    def lookup(self, key):
+        """Return the recorded result of a completed task, or None if it has not completed or its outputs are gone."""
+        with self._lock:
+            entry = self.tasks.get(key)
+        if entry is None:
+            return None
+        if not all(os.path.exists(path) for path in entry['outputs']):
+            return None
+        return entry
+
+    def record(self, key, name, result, wall_time):
+        """Store a completed task and write the manifest to disk."""
+        entry = {
+            'name': name,
+            'result': result,
+            'outputs': collect_paths(result),
+            'wall_time': wall_time,
+            'completed': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        }
+        with self._lock:
+            self.tasks[key] = entry
+            self._save()
+
+    def _save(self):
+        temporary_path = self.path.with_name(self.path.name + '.tmp')
+        with open(temporary_path, 'w') as handle:
+            json.dump({'tasks': self.tasks, 'digests': self.digests}, handle, indent=1)
+        os.replace(temporary_path, self.path)
+
+class TaskSkipped(Exception):
+    """Raised by a task function when there is nothing for it to do, e.g. a sample too shallow to assemble. Its dependents are skipped too."""
+    telemetry_status = 'skipped'
+
+class Task:
+    """
+    One unit of work in a workflow DAG.
+
+    The task function is called as func(*dependency_results, *optional_dependency_results, *args). Its return value must be JSON serializable
+    and is passed on to dependent tasks. Any existing paths in the dependency results, plus the explicit inputs,
+    are hashed to decide whether a previous run of the task can be reused.
+
+    Parameters:
+        name (str): Unique task name, e.g. 'trim:barcode01'.
+        func (callable): Function performing the work.
+        args (tuple): Extra arguments passed after the dependency results. They are part of the task key.
+        deps (list of str): Names of the tasks whose results this task consumes.
+        optional_deps (list of str): Names of tasks this task waits for but also runs without, e.g. replicates of which some may be skipped.
+            The result of each one that failed or was skipped is passed as None.
+        inputs (list of str): Extra input paths that are not produced by another task.
+        threads (int): Threads reserved on the scheduler while the task runs.
+        memory (str | int | None): Memory reserved on the scheduler while the task runs, e.g. '4G'.
+        priority (int): Among ready tasks, those with a higher priority start first, e.g. later pipeline stages.
+    """
+    __slots__ = ('name', 'func', 'args', 'deps', 'optional_deps', 'inputs', 'threads', 'memory', 'priority')
+
+    def __init__(self, name, func, args=(), deps=(), inputs=(), threads=1, memory=None, priority=0, optional_deps=()):
+        self.name = name
+        self.func = func
+        self.args = tuple(args)
+        self.deps = list(deps)
+        self.optional_deps = list(optional_deps)
+        self.inputs = [str(path) for path in inputs]
+        self.threads = threads
+        self.memory = memory
+        self.priority = priority
+
+class WorkflowEngine:
+    """
+    Run a DAG of Tasks on a JobScheduler, skipping tasks recorded as complete in a manifest.
+
+    A task starts as soon as all of its dependencies have finished, so independent samples move through the
+    pipeline at their own pace. A failed task only blocks the tasks that depend on it.
+
+    Parameters:
+        manifest_path (str | Path): Location of the JSON manifest of completed tasks.
+        scheduler (JobScheduler | None): Scheduler providing the thread budget. If None, a scheduler using every CPU is created.
+        resume (bool): If True, tasks recorded in the manifest with unchanged inputs and existing outputs are skipped.
+    """
+    def __init__(self, manifest_path, scheduler=None, resume=True):
+        from .scheduler import JobScheduler
+
+        self.manifest = Manifest(manifest_path)
+        self.scheduler = scheduler or JobScheduler()
+        self.resume = resume
+        self.results = {}
+        self.failed = {}
+
+    def _execute(self, task, dep_results):
+        from .telemetry import stage_timer
+
+        inputs = task.inputs + collect_paths(dep_results)
+        key = self.manifest.task_key(task.name, task.args, inputs)
+        if self.resume:
+            entry = self.manifest.lookup(key)
+            if entry is not None:
+                print(f"Skipping {task.name}: completed in a previous run")
+                return entry['result']
+
+        print(f"Starting {task.name}")
+        stage = task.name.split(':')[0]
+        with stage_timer(stage, task.name, event='task', threads=task.threads):
+            start = time.perf_counter()
+            result = _to_json(task.func(*dep_results, *task.args))
+            wall_time = time.perf_counter() - start
+        self.manifest.record(key, task.name, result, wall_time)
+        print(f"Finished {task.name} in {wall_time:.1f} s")
+        return result
+
+    def run(self, tasks):
+        """
+        Execute tasks in dependency order and block until all of them have finished, failed or been skipped.
+
+        Dependencies on tasks completed by an earlier run() call of this engine are allowed.
+
+        Parameters:
+            tasks (list of Task): Tasks to run.
+
+        Returns:
+            results (dict): Maps task name to its result for every task completed so far.
+        """
+        pending = {task.name: task for task in tasks}
+        for task in tasks:
+            for dep in task.deps + task.optional_deps:
+                if dep not in pending and dep not in self.results and dep not in self.failed:
+                    raise ValueError(f"Task {task.name} depends on unknown task {dep}")
+
+        condition = threading.Condition()
+        running = set()
+
+        def on_done(task, future):
+            with condition:
+                running.discard(task.name)
+                error = future.exception()
+                if error is None:
+                    self.results[task.name] = future.result()
+                elif isinstance(error, TaskSkipped):
+                    print(f"Skipping {task.name}: {error}")
+                    self.failed[task.name] = f'skipped: {error}'
+                else:
+                    print(f"Task {task.name} failed: {error!r}")
+                    self.failed[task.name] = repr(error)
+                submit_ready()
+                condition.notify_all()
+
+        def submit_ready():
+            progressed = True
+            while progressed:
+                progressed = False
+                for name, task in list(pending.items()):
+                    if name not in pending:
+                        continue
+                    if any(dep in self.failed for dep in task.deps):
+                        failed_deps = [self.failed[dep] for dep in task.deps if dep in self.failed]
+                        skipped = all(reason.startswith('skipped') or reason == 'dependency skipped' for reason in failed_deps)
+                        reason = 'dependency skipped' if skipped else 'dependency failed'
+                        print(f"Skipping {name}: {reason}")
+                        self.failed[name] = reason
+                        del pending[name]
+                        progressed = True
+                    elif all(dep in self.results for dep in task.deps) and all(dep in self.results or dep in self.failed for dep in task.optional_deps):
+                        del pending[name]
+                        running.add(name)
+                        dep_results = [self.results[dep] for dep in task.deps] + [self.results.get(dep) for dep in task.optional_deps]
+                        future = self.scheduler.submit_call(lambda task=task, dep_results=dep_results: self._execute(task, dep_results), threads=task.threads, name=name,
+                                                                     memory=task.memory, priority=task.priority)
+                        future.add_done_callback(lambda future, task=task: on_done(task, future))
+
+        with condition:
+            submit_ready()
+            condition.wait_for(lambda: not running and not pending)
+
+        return self.results
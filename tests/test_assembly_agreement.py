@@ -0,0 +1,50 @@
+## test_assembly_agreement
+import random
+
+from plasmid_sequencing.assembly_agreement import compare_assemblies
+
+_COMPLEMENT = str.maketrans('ACGT', 'TGCA')
+
+def _write_fasta(path, sequence):
+    path.write_text(f">contig_1\n{sequence}\n")
+    return str(path)
+
+def _plasmid(length=3000, seed=0):
+    rng = random.Random(seed)
+    return ''.join(rng.choice('ACGT') for _ in range(length))
+
+def test_rotated_and_reverse_complemented_replicates_are_identical(tmp_path):
+    plasmid = _plasmid()
+    rotated = plasmid[1234:] + plasmid[:1234]
+    reverse = plasmid[::-1].translate(_COMPLEMENT)
+    reverse = reverse[700:] + reverse[:700]
+    assemblies = [_write_fasta(tmp_path / f'{name}.fasta', sequence) for name, sequence in [('a', plasmid), ('b', rotated), ('c', reverse)]]
+
+    agreement = compare_assemblies(assemblies)
+    assert agreement.identical
+    assert agreement.agree
+    assert agreement.identity == 1.0
+    assert agreement.n_contigs == [1, 1, 1]
+    normalized = agreement.contigs[0][1].decode()
+    assert len(normalized) == len(plasmid)
+    assert normalized in plasmid + plasmid or normalized in (plasmid + plasmid)[::-1].translate(_COMPLEMENT)
+
+def test_replicates_with_a_substitution_differ(tmp_path):
+    plasmid = _plasmid()
+    mutated = plasmid[:1500] + ('A' if plasmid[1500] != 'A' else 'C') + plasmid[1501:]
+    assemblies = [_write_fasta(tmp_path / 'a.fasta', plasmid), _write_fasta(tmp_path / 'b.fasta', mutated[900:] + mutated[:900])]
+
+    agreement = compare_assemblies(assemblies)
+    assert not agreement.identical
+    assert not agreement.agree
+    assert 0.9 < agreement.identity < 1.0
+    assert compare_assemblies(assemblies, min_identity=0.9).agree
+
+def test_different_contig_counts_disagree(tmp_path):
+    plasmid = _plasmid()
+    two_contigs = tmp_path / 'b.fasta'
+    two_contigs.write_text(f">contig_1\n{plasmid[:1500]}\n>contig_2\n{plasmid[1500:]}\n")
+
+    agreement = compare_assemblies([_write_fasta(tmp_path / 'a.fasta', plasmid), str(two_contigs)])
+    assert not agreement.agree
+    assert agreement.n_contigs == [1, 2]
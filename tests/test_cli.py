@@ -0,0 +1,40 @@
+## test_cli
+import pytest
+
+from plasmid_sequencing.cli import build_parser, main
+
+SUBCOMMANDS = ['demux', 'filter', 'trim', 'subsample', 'assemble', 'polish', 'consensus', 'run-all', 'cache']
+
+def test_help_lists_every_subcommand(capsys):
+    with pytest.raises(SystemExit) as exit_info:
+        main(['--help'])
+    assert exit_info.value.code == 0
+    usage = capsys.readouterr().out
+    for subcommand in SUBCOMMANDS:
+        assert subcommand in usage
+
+@pytest.mark.parametrize('subcommand', SUBCOMMANDS)
+def test_subcommand_help(subcommand, capsys):
+    with pytest.raises(SystemExit) as exit_info:
+        main([subcommand, '--help'])
+    assert exit_info.value.code == 0
+    assert f'plasmid-seq {subcommand}' in capsys.readouterr().out
+
+def test_run_all_defaults():
+    args = build_parser().parse_args(['run-all', 'run.bam'])
+    assert args.input_bam == 'run.bam'
+    assert args.resume and args.png and args.consensus and args.agreement
+    assert args.subsampler == 'rasusa'
+    assert args.polish_depth == 100
+    assert args.genome_size == '10kb'
+
+def test_missing_subcommand_is_an_error():
+    with pytest.raises(SystemExit) as exit_info:
+        build_parser().parse_args([])
+    assert exit_info.value.code == 2
+
+def test_cache_subcommand(tmp_path, capsys):
+    assert main(['cache', '--cache-dir', str(tmp_path), 'list']) == 0
+    assert '0 entries' in capsys.readouterr().out
+    assert main(['cache', '--cache-dir', str(tmp_path), 'prune', '--max-size', '1G']) == 0
+    assert main(['cache', '--cache-dir', str(tmp_path), 'clear']) == 0
@@ -0,0 +1,58 @@
+## test_result_cache
+from plasmid_sequencing.result_cache import ResultCache
+
+def _flye_command(reads, output, threads):
+    return ['flye', '--nano-hq', str(reads), '--out-dir', str(output), '--threads', str(threads)]
+
+def test_key_ignores_thread_count_and_paths(tmp_path):
+    cache = ResultCache(tmp_path / 'cache')
+    for name in ['a', 'b']:
+        (tmp_path / name).mkdir()
+        (tmp_path / name / 'reads.fastq').write_text('@r\nACGT\n+\n5555\n')
+    key = cache.key(_flye_command(tmp_path / 'a' / 'reads.fastq', tmp_path / 'a' / 'out', 2), [tmp_path / 'a' / 'reads.fastq'], [tmp_path / 'a' / 'out'])
+
+    assert key == cache.key(_flye_command(tmp_path / 'a' / 'reads.fastq', tmp_path / 'a' / 'out', 8), [tmp_path / 'a' / 'reads.fastq'], [tmp_path / 'a' / 'out'])
+    assert key == cache.key(_flye_command(tmp_path / 'b' / 'reads.fastq', tmp_path / 'b' / 'out', 2), [tmp_path / 'b' / 'reads.fastq'], [tmp_path / 'b' / 'out'])
+    (tmp_path / 'b' / 'reads.fastq').write_text('@r\nACGA\n+\n5555\n')
+    assert key != cache.key(_flye_command(tmp_path / 'b' / 'reads.fastq', tmp_path / 'b' / 'out', 2), [tmp_path / 'b' / 'reads.fastq'], [tmp_path / 'b' / 'out'])
+
+def test_medaka_key_ignores_thread_count(tmp_path):
+    cache = ResultCache(tmp_path / 'cache')
+    reads = tmp_path / 'reads.fastq'
+    reads.write_text('@r\nACGT\n+\n5555\n')
+
+    def key(threads):
+        return cache.key(['medaka_consensus', '-i', str(reads), '-o', 'out', '-t', str(threads)], [reads], ['out'])
+
+    assert key(2) == key(8)
+
+def test_store_and_restore(tmp_path):
+    cache = ResultCache(tmp_path / 'cache')
+    output = tmp_path / 'run_1' / 'assembly'
+    output.mkdir(parents=True)
+    (output / 'assembly.fasta').write_text('>contig_1\nACGT\n')
+    cache.store('ab' * 32, [output], description='flye run_1')
+
+    restored = tmp_path / 'run_2' / 'assembly'
+    assert cache.restore('ab' * 32, [restored])
+    assert (restored / 'assembly.fasta').read_text() == '>contig_1\nACGT\n'
+    assert cache.entries()['ab' * 32]['hits'] == 1
+    assert not cache.restore('cd' * 32, [tmp_path / 'run_3'])
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = ResultCache(tmp_path / 'cache', max_bytes=2500)
+    keys = [str(i) * 64 for i in range(3)]
+    for key in keys[:2]:
+        output = tmp_path / f'{key[0]}.fasta'
+        output.write_bytes(b'A' * 1000)
+        cache.store(key, [output])
+    # Using the first entry makes the second the least recently used
+    assert cache.restore(keys[0], [tmp_path / 'restored.fasta'])
+
+    output = tmp_path / 'new.fasta'
+    output.write_bytes(b'A' * 1000)
+    cache.store(keys[2], [output])
+    assert sorted(cache.entries()) == [keys[0], keys[2]]
+
+    assert len(cache.prune(0)) == 2
+    assert cache.entries() == {}
@@ -0,0 +1,101 @@
+## test_scheduler
+import threading
+import time
+
+import pytest
+
+from plasmid_sequencing.scheduler import JobScheduler
+
+class _Usage:
+    """Track the threads and memory held by the jobs running at once, and the peak of each."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.threads = 0
+        self.memory = 0
+        self.peak_threads = 0
+        self.peak_memory = 0
+
+    def job(self, threads, memory=0, seconds=0.05):
+        def run():
+            with self.lock:
+                self.threads += threads
+                self.memory += memory
+                self.peak_threads = max(self.peak_threads, self.threads)
+                self.peak_memory = max(self.peak_memory, self.memory)
+            time.sleep(seconds)
+            with self.lock:
+                self.threads -= threads
+                self.memory -= memory
+            return threads
+        return run
+
+def test_jobs_stay_within_the_thread_budget():
+    usage = _Usage()
+    scheduler = JobScheduler(max_threads=3)
+    with scheduler.batch() as batch:
+        for threads in [2, 1, 2, 1, 3, 1]:
+            scheduler.submit_call(usage.job(threads), threads=threads)
+    assert batch.wait() == [2, 1, 2, 1, 3, 1]
+    assert usage.peak_threads <= 3
+
+def test_jobs_stay_within_the_memory_budget():
+    usage = _Usage()
+    scheduler = JobScheduler(max_threads=4, max_memory='2G')
+    with scheduler.batch() as batch:
+        for _ in range(4):
+            scheduler.submit_call(usage.job(1, 1), threads=1, memory='1G')
+    batch.wait()
+    assert usage.peak_threads <= 2
+    assert usage.peak_memory <= 2
+
+def test_batch_waits_only_for_its_own_jobs():
+    scheduler = JobScheduler(max_threads=2)
+    release = threading.Event()
+    other = scheduler.submit_call(release.wait, name='other')
+    with scheduler.batch() as batch:
+        scheduler.submit_call(lambda: 'first')
+        scheduler.submit_call(lambda: 'second')
+    assert batch.wait() == ['first', 'second']
+    assert not other.done()
+    release.set()
+    scheduler.wait()
+    assert other.done()
+
+def test_batch_wait_inside_a_job_lends_its_threads_back():
+    scheduler = JobScheduler(max_threads=1)
+
+    def parent():
+        with scheduler.batch() as batch:
+            scheduler.submit_call(lambda: 'child')
+        return batch.wait()
+
+    assert scheduler.submit_call(parent).result(timeout=10) == ['child']
+
+def test_wait_inside_a_job_raises():
+    scheduler = JobScheduler(max_threads=1)
+    with pytest.raises(RuntimeError):
+        scheduler.submit_call(scheduler.wait).result(timeout=10)
+
+def test_released_job_reacquires_before_new_jobs():
+    scheduler = JobScheduler(max_threads=2)
+    stop = threading.Event()
+
+    def feed():
+        while not stop.is_set():
+            scheduler.submit_call(lambda: time.sleep(0.05))
+            time.sleep(0.01)
+
+    def parent():
+        with scheduler.released():
+            time.sleep(0.1)
+        return 'reacquired'
+
+    future = scheduler.submit_call(parent, threads=2)
+    feeder = threading.Thread(target=feed, daemon=True)
+    feeder.start()
+    try:
+        assert future.result(timeout=5) == 'reacquired'
+    finally:
+        stop.set()
+        feeder.join()
+        scheduler.wait()
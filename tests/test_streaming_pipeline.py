@@ -0,0 +1,22 @@
+## test_streaming_pipeline
+import pytest
+
+from plasmid_sequencing.streaming_pipeline import stream_filter_trim_subsample
+
+def _write_fastq(path, lengths):
+    with open(path, 'w') as fastq:
+        for i, length in enumerate(lengths):
+            fastq.write(f"@read{i}\n{'A' * length}\n+\n{'5' * length}\n")
+
+@pytest.mark.parametrize('lengths', [[], [100] * 20], ids=['empty', 'fully_filtered'])
+@pytest.mark.parametrize('min_depth', [None, 20])
+def test_sample_without_filtered_reads_is_skipped(tmp_path, lengths, min_depth):
+    input_path = tmp_path / 'sample.fastq'
+    _write_fastq(input_path, lengths)
+
+    result = stream_filter_trim_subsample(input_path, tmp_path / 'subsampled', tmp_path / 'histograms', min_length=500, tmpdir=tmp_path / 'scratch',
+                                          save_png=False, min_depth=min_depth, default_genome_size='10kb')
+
+    assert result['subsamples'] == []
+    assert result['trimmed'] is None
+    assert result['depth'] == (None if min_depth is None else 0.0)
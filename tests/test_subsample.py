@@ -0,0 +1,56 @@
+## test_subsample
+import gzip
+import random
+
+import numpy as np
+
+from plasmid_sequencing.read_index import build_read_index, hash_read_id, load_read_index, write_records
+from plasmid_sequencing.subsample import subsample_fastq
+
+def _write_fastq(path, n_reads=300, seed=0):
+    rng = random.Random(seed)
+    with open(path, 'w') as fastq:
+        for i in range(n_reads):
+            length = rng.randint(200, 800)
+            sequence = ''.join(rng.choice('ACGT') for _ in range(length))
+            fastq.write(f"@read{i} runid=0\n{sequence}\n+\n{'5' * length}\n")
+
+def _records(data):
+    lines = data.split(b'\n')
+    return [b'\n'.join(lines[i:i + 4]) + b'\n' for i in range(0, len(lines) - 1, 4)]
+
+def test_subsamples_round_trip_through_the_read_index(tmp_path):
+    input_path = tmp_path / 'sample.fastq'
+    _write_fastq(input_path)
+    input_records = _records(input_path.read_bytes())
+    build_read_index(input_path)
+    index = load_read_index(input_path)
+    assert len(index) == len(input_records)
+
+    # 20x of 5 kb is 100 kb, about two thirds of the input
+    outputs = subsample_fastq(str(input_path), coverage=20, genome_size='5kb', iterations=2, output_dir=str(tmp_path), seed=3)
+    replicates = []
+    for output in outputs:
+        with gzip.open(output, 'rb') as handle:
+            records = _records(handle.read())
+        assert set(records) <= set(input_records)
+        assert sorted(records, key=input_records.index) == records, 'subsample is not in input order'
+        bases = sum(len(record.split(b'\n')[1]) for record in records)
+        assert bases >= 100_000
+        assert bases - max(len(record.split(b'\n')[1]) for record in records) < 100_000
+        replicates.append(records)
+
+        # The replicate's reads, looked up by id in the index of the input, are written back out unchanged
+        id_hashes = [hash_read_id(record[1:].split(None, 1)[0]) for record in records]
+        rows = index[np.isin(index['id_hash'], np.array(id_hashes, dtype=np.uint64))]
+        copy_path = tmp_path / f'{len(replicates)}_copy.fastq'
+        assert write_records(input_path, rows, copy_path) == len(records)
+        assert copy_path.read_bytes() == b''.join(records)
+    assert replicates[0] != replicates[1]
+
+    # The same seed gives the same replicates
+    (tmp_path / 'again').mkdir()
+    again = subsample_fastq(str(input_path), coverage=20, genome_size='5kb', iterations=2, output_dir=str(tmp_path / 'again'), seed=3)
+    for output, records in zip(again, replicates):
+        with gzip.open(output, 'rb') as handle:
+            assert _records(handle.read()) == records
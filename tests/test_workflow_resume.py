@@ -0,0 +1,44 @@
+## test_workflow_resume
+import random
+
+from plasmid_sequencing.full_plasmid_workflow import _filter_task, _render_task
+from plasmid_sequencing.workflow_engine import Task, WorkflowEngine
+
+def _write_fastq(path, n_reads=200, seed=0):
+    rng = random.Random(seed)
+    with open(path, 'w') as fastq:
+        for i in range(n_reads):
+            length = rng.randint(600, 1500)
+            sequence = ''.join(rng.choice('ACGT') for _ in range(length))
+            fastq.write(f"@read{i}\n{sequence}\n+\n{'5' * length}\n")
+
+_CALLS = []
+
+def _count_reads(filter_result):
+    _CALLS.append(filter_result['fastq'])
+    return filter_result['n_reads']
+
+def _run_workflow(tmp_path):
+    """Filter one sample, use its result downstream, then render its histogram PNGs, as full_plasmid_workflow does."""
+    filtered_root = tmp_path / 'filtered_fastqs'
+    filtered_root.mkdir(exist_ok=True)
+    output_file = filtered_root / 'sample_filtered.fastq'
+    engine = WorkflowEngine(tmp_path / 'manifest.json')
+    # The PNGs are rendered after the downstream task has run, so a resumed run sees them as new files in the histogram directory
+    engine.run([Task('filter:sample', _filter_task, args=(str(tmp_path / 'sample.fastq'), str(output_file), 500, 12)),
+                Task('count:sample', _count_reads, deps=['filter:sample'])])
+    engine.run([Task('render_histograms', _render_task, args=(str(filtered_root),), deps=['filter:sample'])])
+    return engine
+
+def test_rendered_histograms_do_not_invalidate_dependent_tasks(tmp_path):
+    _write_fastq(tmp_path / 'sample.fastq')
+    _CALLS.clear()
+
+    first = _run_workflow(tmp_path)
+    assert not first.failed
+    assert first.results['render_histograms'], 'no histogram PNGs were rendered'
+
+    second = _run_workflow(tmp_path)
+    assert not second.failed
+    assert len(_CALLS) == 1, 'the dependent task ran again on resume'
+    assert second.results['count:sample'] == first.results['count:sample']